@@ -0,0 +1,76 @@
+import time
+import argparse
+import numpy as np
+
+from hand_pose_transform import HandPoseTransform
+from landmark_dataset import load_dataset
+
+parser = argparse.ArgumentParser(description="Check and benchmark the vectorized HandPoseTransform.")
+parser.add_argument("-d", "--dataset_path", type=str, default='data/spotify_control_training_data.csv',
+                    help='Dataset (CSV or .lmd) used as the source of landmark rows')
+parser.add_argument("--sizes", type=int, nargs='+', default=[10000, 100000, 1000000],
+                    help='Number of rows to benchmark')
+parser.add_argument("--max_reference_rows", type=int, default=100000,
+                    help='Largest size also timed with the original row-by-row transform')
+args = parser.parse_args()
+
+
+def reference_transform(X):
+    """
+    The original row-by-row transform, kept as the reference for equivalence
+    """
+    X_ = X.copy()
+
+    def _shift_and_scale(row):
+        row[0::3] = row[0::3] - row[0]
+        row[1::3] = row[1::3] - row[1]
+        norm = np.max(
+            np.sqrt(np.square(row[0::3]) + np.square(row[1::3]) + np.square(row[2::3]))
+        )
+        row = row / norm
+        return row
+
+    return np.apply_along_axis(_shift_and_scale, 1, X_)
+
+
+def best_of(func, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t0)
+    return best
+
+
+X_data = np.asarray(load_dataset(args.dataset_path)[0], dtype=np.float64)
+transform = HandPoseTransform()
+
+# Numerical equivalence on the real dataset, for all three output modes
+expected = reference_transform(X_data)
+X_inplace = np.ascontiguousarray(X_data)
+out = np.empty(X_data.shape)
+for mode, result in [('new array', transform.transform(X_data)),
+                     ('out=', transform.transform(X_data, out=out)),
+                     ('in place', transform.transform(X_inplace, out=X_inplace))]:
+    max_diff = np.abs(result - expected).max()
+    assert np.allclose(result, expected, rtol=1e-12, atol=1e-12), f'{mode}: max abs diff {max_diff}'
+    print(f'{mode:>10}: matches the row-by-row transform (max abs diff {max_diff:.2e})')
+
+# Single sample, as in HandPoses.predict_pose
+sample = X_data[:1]
+t_ref = best_of(lambda: reference_transform(sample), repeat=1000)
+t_vec = best_of(lambda: transform.transform(sample), repeat=1000)
+print(f'\n{"1 row":>10}: row-by-row {t_ref * 1e6:9.1f} us   vectorized {t_vec * 1e6:9.1f} us')
+
+# Throughput on larger, resampled data sets
+rng = np.random.RandomState(42)
+for size in args.sizes:
+    X = X_data[rng.randint(len(X_data), size=size)]
+    out = np.empty(X.shape)
+    t_vec = best_of(lambda: transform.transform(X))
+    t_out = best_of(lambda: transform.transform(X, out=out))
+    line = f'{size:>10}: vectorized {t_vec * 1e3:9.1f} ms   out= {t_out * 1e3:9.1f} ms'
+    if size <= args.max_reference_rows:
+        t_ref = best_of(lambda: reference_transform(X), repeat=1)
+        line += f'   row-by-row {t_ref * 1e3:9.1f} ms   speed-up {t_ref / t_vec:6.1f}x'
+    print(line)
@@ -0,0 +1,188 @@
+import json
+import argparse
+import itertools
+import contextlib
+from collections import Counter
+
+from hand_poses import HandPoses
+from delay import Delay
+from model_artifact import load_classifier
+from spotify_controls import SpotifyControls
+from fake_spotify import FakeSpotify
+from command_dispatcher import CommandDispatcher
+from multi_stream import MultiStreamClassifier, SequenceStreamClassifier
+from sequence_classifier import GestureWindow
+from frame_scheduler import DetectionScheduler
+from replay import ReplayEngine, read_recording, read_videos, synthetic_recording
+
+parser = argparse.ArgumentParser(description="Replay recorded landmarks or videos through the gesture pipeline, "
+                                             "with a fake Spotify client, and report its performance.")
+parser.add_argument("--recording", type=str, default=None,
+                    help='landmark recording (CSV written by gesture_controller.py --record_landmarks)')
+parser.add_argument("--videos", type=str, nargs='+', default=None,
+                    help='video files to replay through MediaPipe, one per stream')
+parser.add_argument("-d", "--dataset_path", type=str, default='data/spotify_control_training_data.csv',
+                    help='training data used to build a synthetic recording when none is given')
+parser.add_argument("--gestures", type=int, default=40,
+                    help='number of gestures of the synthetic recording')
+parser.add_argument("--seed", type=int, default=0,
+                    help='random seed of the synthetic recording')
+parser.add_argument("--swipes", type=float, default=0.,
+                    help='fraction of swipes among the synthetic gestures')
+parser.add_argument("--transitions", type=float, default=0.,
+                    help='fraction of synthetic gaps where the hand morphs into the next gesture')
+parser.add_argument("--path_classifier", type=str, default='models/spotify_gesture_cmd_model.npz',
+                    help='path to classifier')
+parser.add_argument("--path_sequence_model", type=str, default=None,
+                    help='also replay with this window classifier (train_sequence_classifier.py) instead of Delay')
+parser.add_argument("--sequence_threshold", type=float, default=0.80,
+                    help='minimum probability of a window classifier decision')
+parser.add_argument("--confirm_frames", type=int, default=3,
+                    help='consecutive windows agreeing before the window classifier fires')
+parser.add_argument("--confirm_frames_in_action", type=int, default=20,
+                    help='consecutive windows agreeing before the window classifier fires again for a held gesture')
+parser.add_argument("--detect_threshold", type=float, default=0.90,
+                    help='minimum percentage of a hand prediction')
+parser.add_argument("--pose_threshold", type=float, nargs='+', default=[0.90],
+                    help='SVC thresholds in classification confidence to compare')
+parser.add_argument("--moving_average", type=float, nargs='+', default=[0.85],
+                    help='minimum percentages of pose prediction of last frames to compare')
+parser.add_argument("--frames_in", type=int, nargs='+', default=[20],
+                    help='numbers of frames to consider to predict a pose when in action to compare')
+parser.add_argument("--frames_out", type=int, nargs='+', default=[40],
+                    help='numbers of frames to consider to predict a pose to compare')
+parser.add_argument("--speed", type=float, default=0.,
+                    help='replay speed relative to the recording, 0 for as fast as possible')
+parser.add_argument("--api_latency", type=float, default=0.,
+                    help='seconds each fake Spotify API call takes')
+parser.add_argument("--api_jitter", type=float, default=0.,
+                    help='up to this many seconds are randomly added to each fake Spotify API call')
+parser.add_argument("--api_error_rate", type=float, default=0.,
+                    help='fraction of the fake Spotify API calls that fail with a 503')
+parser.add_argument("--max_num_hands", type=int, default=1,
+                    help='maximum number of hands detected per video')
+parser.add_argument("--inference_width", type=int, default=None,
+                    help='downsample video frames to this width before hand detection')
+parser.add_argument("--track_roi", action='store_true',
+                    help='crop detection to the region around the last detected hands')
+parser.add_argument("--idle_fps", type=float, default=None,
+                    help='schedule detection as gesture_controller.py does: detection rate without hands')
+parser.add_argument("--idle_after", type=float, default=2.,
+                    help='seconds without hands before detection slows down to --idle_fps')
+parser.add_argument("--motion_threshold", type=float, default=4.,
+                    help='thumbnail difference that brings detection back to full rate (videos only)')
+parser.add_argument("--json", type=str, default=None,
+                    help='also write the results of every configuration to this JSON file')
+args = parser.parse_args()
+
+gestures = None
+if args.recording:
+    frames = read_recording(args.recording)
+elif args.videos:
+    frames = None  # decoded again for every configuration
+else:
+    frames, gestures = synthetic_recording(args.dataset_path, n_gestures=args.gestures, seed=args.seed,
+                                           swipe_fraction=args.swipes, transition_fraction=args.transitions)
+
+
+def run(pose_threshold, moving_average, frames_in, frames_out, sequence=False):
+    """
+    Replay the recording with one configuration, on fresh Delays (or GestureWindows with
+    sequence=True) and a fresh fake Spotify
+    """
+
+    if sequence:
+        sequence_model = load_classifier(args.path_sequence_model)
+        classifier = SequenceStreamClassifier(sequence_model, lambda: GestureWindow(
+            sequence_model.classes_, sequence_model.window, threshold=args.sequence_threshold,
+            confirm_frames=args.confirm_frames, confirm_frames_in_action=args.confirm_frames_in_action),
+            detect_threshold=args.detect_threshold)
+    else:
+        hand_pose = HandPoses(pose_threshold=pose_threshold, name_classifier=args.path_classifier)
+        classifier = MultiStreamClassifier(hand_pose, lambda: Delay(
+            hand_pose.classifier.classes_, moving_average=moving_average,
+            frames_in_action=frames_in, frames_out=frames_out), detect_threshold=args.detect_threshold)
+    # No request budget: replays run faster than real time, so it would drop commands
+    controls = SpotifyControls(sp_client=FakeSpotify(latency=args.api_latency, jitter=args.api_jitter,
+                                                     error_rate=args.api_error_rate, seed=args.seed),
+                               poll_playback=False, rate_limit=False)
+    classes = sequence_model.classes_ if sequence else hand_pose.classifier.classes_
+    failed = Counter()
+    dispatcher = CommandDispatcher(controls.commands.resolve(classes), on_error=lambda pose, e: failed.update([pose]))
+    scheduler = None
+    if args.idle_fps is not None:
+        scheduler = DetectionScheduler(classifier, idle_fps=args.idle_fps, idle_after=args.idle_after,
+                                       motion_threshold=args.motion_threshold)
+
+    with contextlib.ExitStack() as stack:
+        detectors = None
+        if args.videos:
+            from hand_detect import HandDetect
+            from roi_detect import RoiDetector
+            from frame_buffers import FrameBuffers
+
+            hand_detect = HandDetect(detect_threshold=args.detect_threshold)
+            buffers = FrameBuffers()
+            detectors = [(RoiDetector(hand_detect, buffers=buffers, inference_width=args.inference_width,
+                                      track_roi=args.track_roi),
+                          stack.enter_context(hand_detect.mp_hands.Hands(
+                              max_num_hands=args.max_num_hands,
+                              min_detection_confidence=0.6,
+                              min_tracking_confidence=0.5))) for _ in args.videos]
+
+        engine = ReplayEngine(classifier, dispatcher, detectors=detectors, speed=args.speed, scheduler=scheduler)
+        report = engine.run(frames if frames is not None else read_videos(args.videos))
+
+    dispatcher.stop()
+    controls.stop()
+    if sequence:
+        report['config'] = {'path_sequence_model': args.path_sequence_model, 'window': sequence_model.window,
+                            'sequence_threshold': args.sequence_threshold, 'confirm_frames': args.confirm_frames,
+                            'confirm_frames_in_action': args.confirm_frames_in_action}
+    else:
+        report['config'] = {'pose_threshold': pose_threshold, 'moving_average': moving_average,
+                            'frames_in': frames_in, 'frames_out': frames_out}
+    report['api_calls'] = dict(controls.sp_client.calls)
+    report['commands_failed'] = sum(failed.values())
+    if gestures is not None:
+        report.update(engine.recognized(gestures))
+    return report
+
+
+configs = list(itertools.product(args.pose_threshold, args.moving_average, args.frames_in, args.frames_out))
+if args.path_sequence_model:
+    configs.append((None, None, None, None, True))
+
+results = []
+for config in configs:
+    report = run(*config)
+    results.append(report)
+
+    print(' '.join(f'{key}={value}' for key, value in report['config'].items()))
+    print(f"  {report['frames']} frames ({report['duration_s']:.1f} s recorded) in {report['wall_s']:.2f} s: "
+          f"{report['fps']:.0f} fps, {report['speedup']:.1f}x real time")
+    line = f"  {report['commands']} commands ({report['commands_per_min']:.1f}/min), {report['commands_sent']} sent"
+    if args.api_error_rate:
+        line += f" ({report['commands_failed']} failed)"
+    if gestures is not None:
+        line += f", {report['recognized']:.0%} of the gestures recognized, {report['wrong']} wrong commands, " \
+                f"{report['duplicates']} duplicates"
+        print(line)
+        line = f"  decision latency: p50 {report['latency_frames']['p50']} frames " \
+               f"({report['latency_ms']['p50']:.0f} ms), p95 {report['latency_frames']['p95']} frames " \
+               f"({report['latency_ms']['p95']:.0f} ms)"
+    print(line)
+    print(f"  poses: {report['poses']}")
+    if 'detection' in report:
+        d = report['detection']
+        print(f"  detection on {d['duty_cycle']:.0%} of the frames: {d['skipped_idle']} skipped idle, "
+              f"{d['skipped_locked']} skipped locked, {d['motion_wakeups']} motion wake-ups")
+    for name, t in report['timings'].items():
+        print(f"  {name:>10}: p50 {t['p50_ms']:7.3f} ms  p95 {t['p95_ms']:7.3f} ms  p99 {t['p99_ms']:7.3f} ms  "
+              f"max {t['max_ms']:7.3f} ms  n={t['count']}")
+    print()
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved in {args.json}')
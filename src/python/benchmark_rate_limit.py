@@ -0,0 +1,110 @@
+import json
+import time
+import argparse
+from collections import Counter
+import numpy as np
+
+from delay import Delay
+from spotify_controls import SpotifyControls
+from command_dispatcher import CommandDispatcher
+from fake_spotify_server import FakeSpotifyServer
+from utils import N_LANDMARKS, INDEX_FINGER_TIP
+from pipeline import StageStats
+from metrics import METRICS
+
+parser = argparse.ArgumentParser(description="Send a burst of gesture commands through the real spotipy client to a "
+                                             "local fake Spotify server that rate limits and fails requests, "
+                                             "with and without the RateLimitedClient.")
+parser.add_argument("--seconds", type=float, default=10.,
+                    help='length of the gesture session')
+parser.add_argument("--fps", type=float, default=30.,
+                    help='frames per second at which commands are submitted')
+parser.add_argument("--server_limit", type=int, default=10,
+                    help='requests the fake server accepts per window before answering 429')
+parser.add_argument("--window", type=float, default=1.,
+                    help='seconds of the rate limit window of the fake server')
+parser.add_argument("--retry_after", type=int, default=1,
+                    help='Retry-After seconds of the 429 answers')
+parser.add_argument("--error_rate", type=float, default=.05,
+                    help='fraction of the requests the fake server fails with a 503')
+parser.add_argument("--json", type=str, default=None,
+                    help='also write the results to this JSON file')
+args = parser.parse_args()
+
+# One pass of a busy session, one pose per frame: a volume sweep, a burst of skips, track and device changes
+SESSION = ['volume_slider'] * 30 + ['skipfwd_1'] * 6 + [None] * 10 + ['next_track'] + [None] * 12 + \
+          ['previous_track'] + [None] * 12 + ['pause_or_play'] + [None] * 12 + ['pause_or_play'] + [None] * 5 + \
+          ['connect_cycle'] + [None] * 12
+
+
+def run(rate_limit):
+    server = FakeSpotifyServer(rate_limit=args.server_limit, window=args.window, retry_after=args.retry_after,
+                               error_rate=args.error_rate).start()
+    controls = SpotifyControls(sp_client=server.client(), rate_limit=rate_limit)
+    switches = StageStats()
+    METRICS.register('device_switch', switches)
+    errors = Counter()
+    classes = sorted(set(SESSION) - {None})
+    dispatcher = CommandDispatcher(controls.commands.resolve(classes),
+                                   on_error=lambda pose, e: errors.update([getattr(e, 'http_status', 0)]))
+    delay = Delay(classes)
+    lm = np.zeros((N_LANDMARKS, 3), dtype=np.float32)
+
+    n_frames = int(args.seconds * args.fps)
+    t0 = time.perf_counter()
+    for frame in range(n_frames):
+        pose = SESSION[frame % len(SESSION)]
+        if pose is not None:
+            lm[INDEX_FINGER_TIP, 1] = .8 - .6 * (frame % len(SESSION)) / 30  # sweeping the volume up
+            dispatcher.submit(pose, lm, delay)
+        time.sleep(max(0., t0 + (frame + 1) / args.fps - time.perf_counter()))
+    dispatcher.wait_idle(timeout=10.)
+    time.sleep(1.)  # deferred volume and seek calls
+    wall_s = time.perf_counter() - t0
+
+    dispatcher.stop()
+    controls.stop()
+    server.stop()
+    answers = Counter()
+    for (endpoint, code), n in server.requests.items():
+        answers[code] += n
+    return {'rate_limit': rate_limit,
+            'wall_s': wall_s,
+            'commands': dispatcher.submitted,
+            'coalesced': dispatcher.coalesced,
+            'failed_commands': sum(errors.values()),
+            'errors': {str(code): n for code, n in errors.items()},
+            'server_answers': {str(code): n for code, n in answers.items()},
+            'client': dict(controls.requests.counters) if controls.requests is not None else None,
+            'command_ms': dispatcher.stats.summary(),
+            'commands_ms': dispatcher.commands.stats(),
+            'device_switch_ms': switches.summary(),
+            'device_list_requests': sum(n for (endpoint, code), n in server.requests.items()
+                                        if endpoint == 'GET /v1/me/player/devices'),
+            'final_volume': server.fake._active()['volume_percent'] if server.fake._active() else None}
+
+
+results = []
+for rate_limit in (False, True):
+    report = run(rate_limit)
+    results.append(report)
+    answers = report['server_answers']
+    print(f"{'RateLimitedClient' if rate_limit else 'plain spotipy client'}:")
+    print(f"  {report['commands']} commands ({report['coalesced']} coalesced by the dispatcher) in "
+          f"{report['wall_s']:.1f} s, {report['failed_commands']} failed {report['errors']}")
+    print(f"  server answers: {sum(answers.values())} requests, {answers.get('429', 0)} answered 429, "
+          f"{answers.get('503', 0)} answered 503")
+    if report['client'] is not None:
+        print(f"  client: {report['client']}")
+    t = report['command_ms']
+    print(f"  command time: p50 {t['p50_ms']:.1f} ms  p95 {t['p95_ms']:.1f} ms  max {t['max_ms']:.1f} ms")
+    t = report['device_switch_ms']
+    print(f"  {t['count']} device switches: p50 {t['p50_ms']:.1f} ms  max {t['max_ms']:.1f} ms, "
+          f"{report['device_list_requests']} device list requests")
+    print(f"  final volume: {report['final_volume']}")
+    print()
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved in {args.json}')
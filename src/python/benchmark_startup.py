@@ -0,0 +1,94 @@
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+parser = argparse.ArgumentParser(description="Measure the import time of the modules of the gesture controller "
+                                             "and the time to its first frame, each run in a fresh interpreter.")
+parser.add_argument("--modules", type=str, nargs='+',
+                    default=['gesture_service', 'hand_detect', 'spotify_controls', 'hand_poses',
+                             'numpy', 'cv2', 'mediapipe', 'spotipy', 'sklearn'],
+                    help='modules to time the import of')
+parser.add_argument("--cameras", type=str, nargs='+', default=None,
+                    help='also time the startup of a GestureService on these cameras or video files, '
+                         'with a fake Spotify client')
+parser.add_argument("--path_classifier", type=str, default='models/spotify_gesture_cmd_model.npz',
+                    help='path to classifier of the GestureService')
+parser.add_argument("--runs", type=int, default=5,
+                    help='fresh interpreters per measurement, the median is reported')
+parser.add_argument("--json", type=str, default=None,
+                    help='also write the results to this JSON file, e.g. to track startup regressions')
+args = parser.parse_args()
+
+IMPORT = """
+import time
+t0 = time.perf_counter()
+import {module}
+print(time.perf_counter() - t0)
+"""
+
+SERVICE = """
+import time
+t0 = time.perf_counter()
+import json
+from gesture_service import GestureService
+from fake_spotify import FakeSpotify
+imported = time.perf_counter() - t0
+service = GestureService(sp_client=FakeSpotify(), cameras={cameras!r}, path_classifier={path_classifier!r})
+service.startup['imports_s'] = imported
+service.start(t0=t0)
+while 'first_frame_s' not in service.startup or 'spotify_s' not in service.startup:
+    if time.perf_counter() - t0 > 60:
+        break
+    time.sleep(.001)
+service.stop()
+print(json.dumps(service.startup))
+"""
+
+
+def run(code):
+    """
+    Last line printed by code in a fresh interpreter, None if it failed
+    """
+
+    # The modules of this directory are importable as when running a script of it
+    path = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), os.environ.get('PYTHONPATH')]))
+    process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                             env=dict(os.environ, PYTHONPATH=path))
+    if process.returncode != 0:
+        print(process.stderr.strip().splitlines()[-1])
+        return None
+    return process.stdout.strip().splitlines()[-1]
+
+
+results = {'imports_s': {}, 'service_s': None}
+for module in args.modules:
+    times = []
+    for _ in range(args.runs):
+        output = run(IMPORT.format(module=module))
+        if output is None:
+            break
+        times.append(float(output))
+    if len(times) < args.runs:
+        print(f'{module:>18}: could not be imported')
+        continue
+    results['imports_s'][module] = statistics.median(times)
+    print(f'{module:>18}: {statistics.median(times) * 1000.:8.1f} ms  (min {min(times) * 1000.:.1f} ms)')
+
+if args.cameras:
+    cameras = [int(camera) if camera.isdigit() else camera for camera in args.cameras]
+    runs = [run(SERVICE.format(cameras=cameras, path_classifier=args.path_classifier)) for _ in range(args.runs)]
+    runs = [json.loads(output) for output in runs if output is not None]
+    if runs:
+        steps = sorted(set().union(*runs), key=lambda step: statistics.median(r.get(step, 0.) for r in runs))
+        results['service_s'] = {step: statistics.median(r[step] for r in runs if step in r) for step in steps}
+        print(f'\nGestureService startup, median of {len(runs)} runs:')
+        for step, seconds in results['service_s'].items():
+            print(f'{step[:-2]:>18}: {seconds * 1000.:8.1f} ms')
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved in {args.json}')
@@ -0,0 +1,102 @@
+import json
+import time
+import argparse
+import numpy as np
+
+from fake_spotify import FakeSpotify
+from playback_state import PlaybackState
+from volume_control import VolumeController
+
+parser = argparse.ArgumentParser(description="Sweep the volume with a simulated, jittery fingertip and compare the "
+                                             "per-frame volume updates with the filtered VolumeController.")
+parser.add_argument("--fps", type=float, default=30.,
+                    help='frames per second of the fingertip positions')
+parser.add_argument("--sweep", type=float, default=1.5,
+                    help='seconds the fingertip takes to sweep from the bottom to the top of the range')
+parser.add_argument("--rest", type=float, default=1.,
+                    help='seconds the fingertip rests before and after the sweep')
+parser.add_argument("--jitter", type=float, default=.004,
+                    help='standard deviation of the landmark noise, in frame heights')
+parser.add_argument("--max_rate", type=float, default=3.,
+                    help='volume() calls per second at most of the VolumeController')
+parser.add_argument("--min_cutoff", type=float, default=1.,
+                    help='OneEuroFilter cutoff frequency at rest, in Hz')
+parser.add_argument("--beta", type=float, default=10.,
+                    help='OneEuroFilter cutoff increase with speed')
+parser.add_argument("--seed", type=int, default=0,
+                    help='random seed of the landmark noise')
+parser.add_argument("--json", type=str, default=None,
+                    help='also write the results to this JSON file')
+args = parser.parse_args()
+
+# Fingertip heights: rest low, sweep up (volume 50 -> 100 with the gain of 200), rest high
+rng = np.random.default_rng(args.seed)
+rest, sweep = int(args.rest * args.fps), int(args.sweep * args.fps)
+ease = (1 - np.cos(np.linspace(0, np.pi, sweep))) / 2
+trajectory = np.concatenate([np.full(rest, .7), .7 - .25 * ease, np.full(rest, .45)])
+trajectory = trajectory + rng.normal(0, args.jitter, len(trajectory))
+
+
+class VolumeLog(FakeSpotify):
+    """
+    FakeSpotify keeping every volume() value
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.volumes = []
+
+    def volume(self, volume_percent, *args, **kwargs):
+        super().volume(volume_percent)
+        self.volumes.append(volume_percent)
+
+
+def per_frame(sp_client, playback):
+    """
+    The volume_slider of SpotifyControls before the VolumeController: one volume() per frame
+    """
+
+    prev_y = None
+    for y in trajectory:
+        if prev_y is not None:
+            cur_vol = playback.current()['device']['volume_percent']
+            new_vol = max(0, min(100, cur_vol + int((prev_y - y) * 200)))
+            sp_client.volume(new_vol)
+            playback.update(volume_percent=new_vol)
+        prev_y = y
+        yield
+
+
+def filtered(sp_client, playback):
+    controller = VolumeController(sp_client, playback, max_rate=args.max_rate, min_cutoff=args.min_cutoff,
+                                  beta=args.beta)
+    for y in trajectory:
+        controller.update(float(y))
+        yield
+    controller.stop()
+
+
+def run(name, method):
+    sp_client = VolumeLog()
+    playback = PlaybackState(sp_client, ttl=60., poll=False)
+    t0 = time.perf_counter()
+    for frame, _ in enumerate(method(sp_client, playback)):
+        time.sleep(max(0., t0 + (frame + 1) / args.fps - time.perf_counter()))
+    volumes = sp_client.volumes
+    steps = np.diff([50] + volumes)
+    return {'method': name,
+            'volume_calls': len(volumes),
+            'final_volume': volumes[-1] if volumes else 50,
+            'reversals': int(np.sum(steps[1:] * steps[:-1] < 0)),  # changes of direction, i.e. jitter
+            'volumes': volumes}
+
+
+results = [run('per frame', per_frame), run('VolumeController', filtered)]
+for report in results:
+    print(f"{report['method']:>17}: {report['volume_calls']:3d} volume() calls, final volume "
+          f"{report['final_volume']}, {report['reversals']} direction reversals")
+
+if args.json:
+    with open(args.json, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f'Results saved in {args.json}')
@@ -0,0 +1,158 @@
+import threading
+import time
+from collections import deque
+
+from pipeline import StageStats
+from playback_backend import http_status
+from metrics import METRICS
+
+
+class CommandDispatcher:
+    """
+    Command Dispatcher Class.
+
+    Runs the commands of a CommandTable on a background worker so the frame loop never
+    waits on network I/O.  submit() looks the pose up in the table, applies the Delay
+    cool-down the command declares and queues it.  The worker drains the queue and
+    coalesces runs of commands with the same key before sending them, as each command
+    declares:
+        - 'latest': consecutive volume_slider updates collapse into the latest one, whose
+          landmarks hold the latest volume target
+        - 'sum': consecutive skipback_/skipfwd_ poses become one net seek
+    Idempotent commands are tried once more after a transient error (backends whose calls
+    already retry do not declare them so).  Besides the time of every command (stats, and
+    the stats of each command in the table), it measures the gesture-to-command latency
+    (latency), from the onset of the gesture (delay.onset, the first frame classified as the
+    pose) to the response of the last API call.
+
+    Arguments:
+        commands {CommandTable}: commands of the model classes, from CommandRegistry.resolve
+    Keyword Arguments:
+        on_result {callable, optional}: called as on_result(pose, elapsed_seconds) after
+                a command succeeded.
+                (Default: {None})
+        on_error {callable, optional}: called as on_error(pose, exception) when a command
+                failed.  Errors are printed if not given.
+                (Default: {None})
+        max_pending {int, optional}: commands kept waiting before the oldest is dropped.
+                (Default: {32})
+    """
+
+    def __init__(self, commands, on_result=None, on_error=None, max_pending=32):
+        self.commands = commands
+        self.on_result = on_result
+        self.on_error = on_error
+        self.pending = deque(maxlen=max_pending)
+        self.cond = threading.Condition()
+        self.stats = StageStats()
+        self.latency = StageStats()
+        METRICS.register('command', self.stats)
+        METRICS.register('gesture_to_command', self.latency)
+        self.submitted = 0
+        self.coalesced = 0
+        self.busy = False
+        self.running = True
+        self.worker = threading.Thread(target=self._run, name='dispatch', daemon=True)
+        self.worker.start()
+
+    def submit(self, pose, lm, delay):
+        """
+        Queue the command for a pose and apply its Delay cool-down right away.
+        Returns False for poses that do not trigger a command.
+        """
+
+        command = self.commands.get(pose)
+        if command is None:
+            return False
+
+        delay.reset_counter(command.cooldown)
+        delay.set_in_action(True)
+        with self.cond:
+            # The landmarks may live in a buffer the next frame overwrites
+            self.pending.append((command, lm.copy(), getattr(delay, 'onset', None)))
+            self.submitted += 1
+            self.cond.notify_all()
+        return True
+
+    def _next_batch(self):
+        """
+        Pop the next command, merged with the following ones of the same key as its
+        coalescing policy allows
+        """
+
+        command, lm, onset = self.pending.popleft()
+        value = command.value
+
+        # Merged commands are timed from the onset of the first gesture
+        if command.coalesce is not None:
+            while self.pending and self.pending[0][0].key == command.key:
+                merged, lm, _ = self.pending.popleft()
+                if command.coalesce == 'sum':
+                    value += merged.value
+                self.coalesced += 1
+
+        return command, lm, value, onset
+
+    @staticmethod
+    def transient(error):
+        """
+        Whether a failed command may succeed if tried again: 5xx answers and connection errors
+        """
+
+        return (http_status(error) or 0) >= 500 or isinstance(error, OSError)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.running and not self.pending:
+                    self.cond.wait()
+                if not self.running:
+                    return
+                command, lm, value, onset = self._next_batch()
+                self.busy = True
+
+            t0 = time.perf_counter()
+            try:
+                try:
+                    command(lm, value)
+                except Exception as e:
+                    if not (command.idempotent and self.transient(e)):
+                        raise
+                    command(lm, value)
+            except Exception as e:
+                if self.on_error is not None:
+                    self.on_error(command.name, e)
+                else:
+                    print(f"Tried to {command.name}...")
+                    print(e)
+            else:
+                if onset is not None:
+                    self.latency.add((time.perf_counter() - onset) * 1000.)
+                if self.on_result is not None:
+                    self.on_result(command.name, time.perf_counter() - t0)
+            finally:
+                elapsed = (time.perf_counter() - t0) * 1000.
+                self.stats.add(elapsed)
+                if command.stats is not None:
+                    command.stats.add(elapsed)
+                with self.cond:
+                    self.busy = False
+                    self.cond.notify_all()
+
+    def wait_idle(self, timeout=None):
+        """
+        Wait until every queued command has been sent.  Returns False on timeout.
+        """
+
+        with self.cond:
+            return self.cond.wait_for(lambda: not self.pending and not self.busy, timeout)
+
+    def stop(self, timeout=1.):
+        """
+        Stop the worker, dropping commands that have not been sent yet
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify_all()
+        self.worker.join(timeout)
@@ -0,0 +1,156 @@
+import re
+
+from pipeline import StageStats
+from metrics import METRICS
+
+# How the dispatcher merges a run of queued commands with the same key into one call
+COALESCE = (None, 'latest', 'sum')
+
+
+class Command:
+    """
+    Command Class.
+
+    One action a gesture triggers, as declared by a backend: the handler, run as
+    handler(lm, value) on the dispatcher worker, and how the dispatcher treats it.  Commands
+    sharing a key (e.g. every skipfwd_/skipback_ pose) are coalesced and timed together.
+
+    Arguments:
+        name {str}: class name of the gesture
+        handler {callable}: called with the (21, 3) landmarks and value
+    Keyword Arguments:
+        cooldown {int, optional}: frames the Delay ignores after the command, so one gesture
+                does not fire twice.
+                (Default: {0})
+        coalesce {str, optional}: None to run every command, 'latest' to run only the newest of
+                a run of queued commands with the same key (its landmarks hold the latest
+                target), 'sum' to run one command with the sum of their values.
+                (Default: {None})
+        idempotent {bool, optional}: running it twice has the effect of running it once, so
+                it is tried again after a transient error (5xx answer, connection error).  Left
+                False when the backend calls retry themselves, e.g. through a RateLimitedClient.
+                (Default: {False})
+        value {optional}: argument of the handler, e.g. the seconds to seek.
+                (Default: {None})
+        key {str, optional}: name the command is coalesced and timed under, name if not given.
+                (Default: {None})
+    """
+
+    __slots__ = ('name', 'handler', 'cooldown', 'coalesce', 'idempotent', 'value', 'key', 'stats')
+
+    def __init__(self, name, handler, cooldown=0, coalesce=None, idempotent=False, value=None, key=None):
+        if coalesce not in COALESCE:
+            raise ValueError(f'Unknown coalescing policy {coalesce!r} of {name}, expected one of {COALESCE}')
+        self.name = name
+        self.handler = handler
+        self.cooldown = cooldown
+        self.coalesce = coalesce
+        self.idempotent = idempotent
+        self.value = value
+        self.key = key or name
+        self.stats = None  # StageStats of command.<key>, set by CommandRegistry.resolve
+
+    def __call__(self, lm, value=None):
+        return self.handler(lm, self.value if value is None else value)
+
+    def __repr__(self):
+        return f'Command({self.name!r}, cooldown={self.cooldown}, coalesce={self.coalesce!r})'
+
+
+class CommandRegistry:
+    """
+    Command Registry Class.
+
+    The commands of a backend, by gesture name, plus patterns building the commands of whole
+    families of names (e.g. skipfwd_1 ... skipfwd_9) from their match.  resolve() turns it
+    into the CommandTable of a model's classes once, at load time, so dispatching a pose is
+    a lookup: names are never parsed per frame.  New actions are added here, and a new
+    backend brings its own registry, without touching the CommandDispatcher.
+    """
+
+    def __init__(self):
+        self.commands = {}
+        self.patterns = []  # (compiled regex, make(match) -> Command)
+
+    def add(self, name, handler, **kwargs):
+        """
+        Register the command of a gesture; kwargs are those of Command.  Returns the Command.
+        """
+
+        command = self.commands[name] = Command(name, handler, **kwargs)
+        return command
+
+    def add_pattern(self, pattern, make):
+        """
+        Register make(match), returning a Command or None, for the gesture names fully
+        matching the regular expression pattern
+        """
+
+        self.patterns.append((re.compile(pattern), make))
+        return self
+
+    def get(self, name):
+        """
+        Command of a gesture name, or None if it does not trigger any
+        """
+
+        command = self.commands.get(name)
+        if command is not None:
+            return command
+        for regex, make in self.patterns:
+            match = regex.fullmatch(name)
+            if match is not None:
+                return make(match)
+        return None
+
+    def resolve(self, classes, metrics=METRICS):
+        """
+        CommandTable of the classes of a model (classifier.classes_).  Every command gets a
+        StageStats, shared by its key and registered as command.<key> in metrics.
+        """
+
+        commands = [self.get(str(name)) for name in classes]
+        stats = {}
+        for command in commands:
+            if command is not None:
+                if command.key not in stats:
+                    stats[command.key] = StageStats()
+                    metrics.register(f'command.{command.key}', stats[command.key])
+                command.stats = stats[command.key]
+        return CommandTable(classes, commands)
+
+
+class CommandTable:
+    """
+    Command Table Class.
+
+    Commands of the classes of a model, resolved by CommandRegistry.resolve: commands[i] is
+    the Command of class i (None for classes without one, e.g. 'Unknown'), and by_name maps
+    the class names to the same objects.
+
+    Arguments:
+        classes {list}: class names of the model
+        commands {list}: Command (or None) of each class
+    """
+
+    def __init__(self, classes, commands):
+        self.classes = [str(name) for name in classes]
+        self.commands = list(commands)
+        self.by_name = {name: command for name, command in zip(self.classes, self.commands) if command is not None}
+
+    def __getitem__(self, idx):
+        return self.commands[idx]
+
+    def get(self, pose):
+        return self.by_name.get(pose)
+
+    def stats(self):
+        """
+        Summary of the time of every command that ran, by key
+        """
+
+        summaries = {}
+        for command in self.by_name.values():
+            if command.stats.count and command.key not in summaries:
+                summaries[command.key] = command.stats.summary()
+        return summaries
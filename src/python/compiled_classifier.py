@@ -0,0 +1,209 @@
+from operator import mul
+
+import numpy as np
+
+from utils import shift_and_scale
+
+
+class CompiledClassifier:
+    """
+    Compiled Classifier Class.
+
+    NumPy-only replacement for a trained sklearn Pipeline([HandPoseTransform, SVC(probability=True)])
+    or a bare SVC.  It holds the support vectors, the one-vs-one coefficients (folded into one
+    weight matrix for linear kernels) and the Platt scaling coefficients, and reproduces libsvm's
+    predict_proba without importing sklearn or going through its input validation.
+
+    Build it with from_sklearn(); it exposes classes_, predict_proba() and predict() like the
+    sklearn model, so HandPoses can use either.
+
+    Arguments:
+        classes {np.ndarray}: class names, in the order of the probability columns
+        kernel {str}: 'linear', 'rbf', 'poly' or 'sigmoid'
+        support_vectors {np.ndarray}: (n_SV, n_features) support vectors
+        pair_coef {np.ndarray}: (n_SV, n_pairs) dual coefficients of each one-vs-one classifier
+        intercept {np.ndarray}: (n_pairs,) intercepts of the one-vs-one classifiers
+        prob_a {np.ndarray}: (n_pairs,) Platt scaling slopes
+        prob_b {np.ndarray}: (n_pairs,) Platt scaling offsets
+    Keyword Arguments:
+        gamma, coef0, degree: kernel parameters, as in SVC
+        hand_pose_transform {bool, optional}: apply utils.shift_and_scale to the input first.
+                (Default: {True})
+    """
+
+    min_prob = 1e-7
+    # Below this many rows the per-row plain-float coupling beats the vectorized one
+    scalar_rows = 8
+
+    def __init__(self, classes, kernel, support_vectors, pair_coef, intercept, prob_a, prob_b,
+                 gamma=1., coef0=0., degree=3, hand_pose_transform=True):
+        self.classes_ = np.asarray(classes)
+        self.kernel = kernel
+        self.gamma = gamma
+        self.coef0 = coef0
+        self.degree = degree
+        self.hand_pose_transform = hand_pose_transform
+        self.support_vectors = np.ascontiguousarray(support_vectors, dtype=np.float64)
+        self.pair_coef = np.ascontiguousarray(pair_coef, dtype=np.float64)
+        self.intercept = np.asarray(intercept, dtype=np.float64)
+        self.prob_a = np.asarray(prob_a, dtype=np.float64)
+        self.prob_b = np.asarray(prob_b, dtype=np.float64)
+
+        n_classes = len(self.classes_)
+        self.pairs = [(i, j) for i in range(n_classes) for j in range(i + 1, n_classes)]
+        self.pair_i = np.array([i for i, _ in self.pairs], dtype=np.intp)
+        self.pair_j = np.array([j for _, j in self.pairs], dtype=np.intp)
+
+        # A linear kernel collapses the support vectors into one weight vector per pair
+        self.weights = None
+        if kernel == 'linear':
+            self.weights = np.ascontiguousarray(self.support_vectors.T @ self.pair_coef)
+
+    @classmethod
+    def from_sklearn(cls, model):
+        """
+        Export a fitted Pipeline([HandPoseTransform, SVC]) or SVC trained with probability=True
+        """
+
+        hand_pose_transform = hasattr(model, 'steps')
+        svc = model.steps[-1][1] if hand_pose_transform else model
+        if not getattr(svc, 'probability', False):
+            raise ValueError('The SVC must be trained with probability=True')
+
+        # Read libsvm's raw fitted state; attribute names changed across sklearn versions
+        state = vars(svc)
+        n_support = np.asarray(state['_n_support'] if '_n_support' in state else svc.n_support_)
+        prob_a = state['_probA'] if '_probA' in state else state['probA_']
+        prob_b = state['_probB'] if '_probB' in state else state['probB_']
+        dual_coef = np.asarray(state['_dual_coef_'])
+        intercept = np.asarray(state['_intercept_'])
+
+        # Scatter libsvm's (n_classes - 1, n_SV) dual coefficients into one column per pair:
+        # the pair (i, j) uses row j - 1 for the SVs of class i and row i for those of class j
+        starts = np.concatenate([[0], np.cumsum(n_support)])
+        pair_coef = np.zeros((dual_coef.shape[1], len(n_support) * (len(n_support) - 1) // 2))
+        p = 0
+        for i in range(len(n_support)):
+            for j in range(i + 1, len(n_support)):
+                pair_coef[starts[i]:starts[i + 1], p] = dual_coef[j - 1, starts[i]:starts[i + 1]]
+                pair_coef[starts[j]:starts[j + 1], p] = dual_coef[i, starts[j]:starts[j + 1]]
+                p += 1
+
+        return cls(svc.classes_, svc.kernel, svc.support_vectors_, pair_coef, intercept,
+                   prob_a, prob_b, gamma=state.get('_gamma', svc.gamma), coef0=svc.coef0,
+                   degree=svc.degree, hand_pose_transform=hand_pose_transform)
+
+    def decision_values(self, X):
+        """
+        One-vs-one decision values, shape (n_samples, n_pairs)
+        """
+
+        if self.weights is not None:
+            return X @ self.weights + self.intercept
+
+        K = X @ self.support_vectors.T
+        if self.kernel == 'rbf':
+            sq = np.einsum('ij,ij->i', X, X)[:, None] - 2 * K \
+                + np.einsum('ij,ij->i', self.support_vectors, self.support_vectors)[None, :]
+            K = np.exp(-self.gamma * sq)
+        elif self.kernel == 'poly':
+            K = (self.gamma * K + self.coef0) ** self.degree
+        elif self.kernel == 'sigmoid':
+            K = np.tanh(self.gamma * K + self.coef0)
+        return K @ self.pair_coef + self.intercept
+
+    def pairwise_probabilities(self, X):
+        """
+        Platt-scaled probability that class i beats class j for every pair, shape (n_samples, n_pairs)
+        """
+
+        f = self.decision_values(X) * self.prob_a + self.prob_b
+        # Numerically stable 1 / (1 + exp(f)), as in libsvm's sigmoid_predict
+        e = np.exp(-np.abs(f))
+        r = np.where(f >= 0, e / (1 + e), 1 / (1 + e))
+        return np.clip(r, self.min_prob, 1 - self.min_prob)
+
+    def couple(self, r):
+        """
+        Combine pairwise probabilities into class probabilities with libsvm's iterative method
+        (Wu, Lin & Weng 2004, method 2), including its per-sample stopping rule
+        """
+
+        n, k = len(r), len(self.classes_)
+        R = np.zeros((n, k, k))  # R[:, i, j] = P(i beats j)
+        R[:, self.pair_i, self.pair_j] = r
+        R[:, self.pair_j, self.pair_i] = 1 - r
+
+        Q = -R.transpose(0, 2, 1) * R
+        idx = np.arange(k)
+        Q[:, idx, idx] = np.square(R).sum(axis=1)
+
+        p = np.full((n, k), 1. / k)
+        active = np.arange(n)
+        eps = 0.005 / k
+        for _ in range(max(100, k)):
+            Qa, pa = Q[active], p[active]
+            Qp = np.einsum('ntj,nj->nt', Qa, pa)
+            pQp = np.einsum('nt,nt->n', pa, Qp)
+            converged = np.abs(Qp - pQp[:, None]).max(axis=1) < eps
+            active, Qa, pa, Qp, pQp = active[~converged], Qa[~converged], pa[~converged], \
+                Qp[~converged], pQp[~converged]
+            if not len(active):
+                break
+            for t in range(k):
+                diff = (pQp - Qp[:, t]) / Qa[:, t, t]
+                pa[:, t] += diff
+                scale = 1 + diff
+                pQp = (pQp + diff * (diff * Qa[:, t, t] + 2 * Qp[:, t])) / scale / scale
+                Qp = (Qp + diff[:, None] * Qa[:, t, :]) / scale[:, None]
+                pa /= scale[:, None]
+            p[active] = pa
+        return p
+
+    def couple_one(self, r):
+        """
+        Same as couple() for a single sample, in plain Python floats, which beats NumPy's
+        per-call overhead on a 7x7 problem
+        """
+
+        k = len(self.classes_)
+        R = [[0.] * k for _ in range(k)]
+        for (i, j), r_ij in zip(self.pairs, r):
+            R[i][j] = r_ij
+            R[j][i] = 1 - r_ij
+        Q = [[-R[j][t] * R[t][j] for j in range(k)] for t in range(k)]
+        for t in range(k):
+            Q[t][t] = sum(R[j][t] ** 2 for j in range(k))
+
+        p = [1. / k] * k
+        eps = 0.005 / k
+        for _ in range(max(100, k)):
+            Qp = [sum(map(mul, Qt, p)) for Qt in Q]
+            pQp = sum(map(mul, p, Qp))
+            if max(abs(qpt - pQp) for qpt in Qp) < eps:
+                break
+            # p and Qp are kept multiplied by the running scale S instead of being divided by
+            # (1 + diff) after every step; they are normalized once per sweep
+            S = 1.
+            for t in range(k):
+                Qt = Q[t]
+                diff = (pQp - Qp[t] / S) / Qt[t]
+                p[t] += diff * S
+                pQp = (pQp + diff * (diff * Qt[t] + 2 * Qp[t] / S)) / (1 + diff) / (1 + diff)
+                dS = diff * S
+                Qp = [qpj + dS * qtj for qpj, qtj in zip(Qp, Qt)]
+                S *= 1 + diff
+            p = [pj / S for pj in p]
+        return p
+
+    def predict_proba(self, X):
+        X = np.asarray(X, dtype=np.float64)
+        if self.hand_pose_transform:
+            X = shift_and_scale(X)
+        r = self.pairwise_probabilities(X)
+        if len(X) <= self.scalar_rows:
+            return np.array([self.couple_one(row) for row in r.tolist()])
+        return self.couple(r)
+
+    def predict(self, X):
+        return self.classes_[np.argmax(self.predict_proba(X), axis=1)]
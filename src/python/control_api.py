@@ -0,0 +1,159 @@
+import os
+import json
+import stat
+import threading
+import socketserver
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import numpy as np
+
+from metrics import METRICS
+
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def remove_socket(path):
+    """
+    Remove the Unix socket at path, if any; anything else there is left alone
+    """
+
+    try:
+        mode = os.lstat(path).st_mode
+    except FileNotFoundError:
+        return
+    if not stat.S_ISSOCK(mode):
+        raise FileExistsError(f'{path} exists and is not a socket')
+    os.remove(path)
+
+
+def to_json(obj):
+    """
+    JSON encoding of NumPy scalars and arrays found in stats and events
+    """
+
+    if isinstance(obj, np.generic):
+        return obj.item()
+    if isinstance(obj, np.ndarray):
+        return obj.tolist()
+    return str(obj)
+
+
+class ControlHandler(BaseHTTPRequestHandler):
+    """
+    Requests of the control API, answered with JSON:
+        GET  /status                      running state, frame rate, cameras, last command
+        GET  /metrics                     timings of every step, detection duty cycle, counters
+        GET  /metrics?format=prometheus   the timings in the Prometheus text format
+        GET  /events?since=<id>           commands submitted, done and failed after event <id>
+        GET  /config                      current settings
+        POST /config                      JSON object of RUNTIME_SETTINGS to change
+        GET  /preview.jpg?stream=<n>      last preview image (404 while previews are off)
+        POST /stop                        ask the service to stop
+    """
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+
+        if url.path == '/status':
+            self.send_json(service.status())
+        elif url.path == '/metrics':
+            if query.get('format') == ['prometheus']:
+                return self.send_bytes(METRICS.prometheus().encode(), 'text/plain; version=0.0.4')
+            self.send_json(service.metrics())
+        elif url.path == '/events':
+            try:
+                since = int(query.get('since', ['0'])[0])
+            except ValueError:
+                return self.send_json({'error': 'since must be an event id'}, 400)
+            self.send_json(service.recent_events(since))
+        elif url.path == '/config':
+            self.send_json(service.config)
+        elif url.path == '/preview.jpg':
+            try:
+                stream = int(query.get('stream', ['0'])[0])
+            except ValueError:
+                return self.send_json({'error': 'stream must be a number'}, 400)
+            jpeg = service.preview_jpeg(stream)
+            if jpeg is None:
+                return self.send_json({'error': 'no preview, set preview_fps to enable it'}, 404)
+            self.send_bytes(jpeg, 'image/jpeg')
+        else:
+            self.send_json({'error': f'unknown path {url.path}'}, 404)
+
+    def do_POST(self):
+        service = self.server.service
+        path = urlparse(self.path).path
+
+        if path == '/config':
+            try:
+                changes = json.loads(self.rfile.read(int(self.headers.get('Content-Length', 0))) or b'{}')
+                if not isinstance(changes, dict):
+                    raise ValueError('expected a JSON object of settings')
+                self.send_json(service.reconfigure(**changes))
+            except ValueError as e:  # json.JSONDecodeError is a ValueError too
+                self.send_json({'error': str(e)}, 400)
+        elif path == '/stop':
+            service.request_stop()
+            self.send_json({'stopping': True})
+        else:
+            self.send_json({'error': f'unknown path {path}'}, 404)
+
+    def send_json(self, obj, code=200):
+        self.send_bytes(json.dumps(obj, default=to_json).encode(), 'application/json', code)
+
+    def send_bytes(self, body, content_type, code=200):
+        self.send_response(code)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class ControlServer:
+    """
+    Control Server Class.
+
+    Serves the control API of a GestureService (see ControlHandler) from a background thread,
+    over HTTP on a local port or on a Unix socket.  It only listens on localhost by default:
+    anyone who can reach it controls the service.
+
+    Arguments:
+        service {GestureService}: service to control
+    Keyword Arguments:
+        host {str, optional}: address to listen on.
+                (Default: {'127.0.0.1'})
+        port {int, optional}: TCP port, 0 for any free one.
+                (Default: {8765})
+        socket_path {str, optional}: listen on this Unix socket instead of a TCP port.
+                (Default: {None})
+    """
+
+    def __init__(self, service, host='127.0.0.1', port=8765, socket_path=None):
+        if socket_path is not None:
+            remove_socket(socket_path)  # left over by a previous run
+            self.server = UnixHTTPServer(socket_path, ControlHandler)
+            self.url = f'unix:{socket_path}'
+        else:
+            self.server = ThreadingHTTPServer((host, port), ControlHandler)
+            self.server.daemon_threads = True
+            self.url = f'http://{host}:{self.server.server_address[1]}'
+        self.socket_path = socket_path
+        self.server.service = service
+        self.thread = threading.Thread(target=self.server.serve_forever, name='control_api', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+        if self.socket_path is not None:
+            remove_socket(self.socket_path)
@@ -0,0 +1,65 @@
+import os
+import time
+import argparse
+import numpy as np
+import pandas as pd
+
+from landmark_dataset import LandmarkDataset, csv_to_dataset
+from utils import LANDMARK_COLUMNS
+
+parser = argparse.ArgumentParser(description="Convert CSV training data into a binary LandmarkDataset (.lmd) "
+                                             "and compare their size and load time.")
+parser.add_argument("-i", "--csv_path", type=str, default='data/spotify_control_training_data.csv',
+                    help='CSV training data to convert')
+parser.add_argument("-o", "--dataset_path", type=str, default=None,
+                    help='Dataset directory to write (default: <csv>.lmd)')
+parser.add_argument("--repeat", type=int, default=5,
+                    help='Loads timed for each format')
+args = parser.parse_args()
+
+dataset_path = args.dataset_path or os.path.splitext(args.csv_path)[0] + '.lmd'
+if os.path.exists(dataset_path):
+    raise SystemExit(f'{dataset_path} already exists, the converter only creates new datasets')
+
+print(f'Converting {args.csv_path}...')
+dataset = csv_to_dataset(args.csv_path, dataset_path)
+print(f'Dataset with {len(dataset)} rows and classes {dataset.classes} saved in {dataset_path}', end='\n\n')
+
+# Both formats must hold the same data
+df = pd.read_csv(args.csv_path)
+if not (np.array_equal(dataset.landmarks, df[LANDMARK_COLUMNS].values.astype(np.float32))
+        and np.array_equal(dataset.labels(), df['class'].values)):
+    raise SystemExit('Converted dataset does not match the CSV!')
+
+
+def best_of(load):
+    times = []
+    for _ in range(args.repeat):
+        t0 = time.perf_counter()
+        load()
+        times.append(time.perf_counter() - t0)
+    return min(times) * 1000
+
+
+def load_csv():
+    df = pd.read_csv(args.csv_path)
+    return df[LANDMARK_COLUMNS].values, df['class'].values
+
+
+def load_dataset():
+    dataset = LandmarkDataset(dataset_path)
+    return dataset.landmarks, dataset.labels()
+
+
+def load_dataset_read():
+    # Touch every landmark, so the memory map cost is paid like the CSV parse
+    X, y = load_dataset()
+    return float(np.asarray(X).sum()), y
+
+
+csv_bytes = os.path.getsize(args.csv_path)
+dataset_bytes = sum(os.path.getsize(os.path.join(dataset_path, f)) for f in os.listdir(dataset_path))
+print(f'{"format":>22} {"size":>12} {"load":>12}')
+print(f'{"pandas CSV":>22} {csv_bytes / 2**10:9.0f} KB {best_of(load_csv):9.2f} ms')
+print(f'{"LandmarkDataset":>22} {dataset_bytes / 2**10:9.0f} KB {best_of(load_dataset):9.2f} ms')
+print(f'{"LandmarkDataset + read":>22} {"":>12} {best_of(load_dataset_read):9.2f} ms')
@@ -1,5 +1,5 @@
+import threading
 import numpy as np
-from collections import Counter
 
 
 class Delay():
@@ -7,6 +7,11 @@ class Delay():
     Delay Frames Class.
 
     This class is responsible to provoke delays on the execution frames.
+
+    The last frames are kept in a fixed-capacity ring buffer of class indices
+    together with per-class vote counts and running confidence sums, so each
+    update costs O(1) and does not allocate.  The public methods are guarded
+    by a lock, so commands running on another thread can reset the counters.
     Keyword Arguments:
         moving_average {float, optional}: minimum percentage of pose prediction
                         in the last (frames_in_action or frames_out) frames to
@@ -23,27 +28,63 @@ class Delay():
 
     def __init__(self, classes, moving_average=.8, frames_in_action=10, frames_out=40):
         self.in_action = False
-        self.counter_class = np.empty((0))
         self.classes = list(classes)
-        self.counter_confidences = np.empty(
-            (0, len(classes)), dtype=np.float64)
         self.moving_average = moving_average
         self.frames_in_action = frames_in_action
         self.frames_out = frames_out
         self.ignore_frames = 0
+        self.onset = None  # time of the first frame of the last decided pose, set by MultiStreamClassifier
+        self.lock = threading.RLock()
+
+        # 'Unknown' gets its own slot after the model classes
+        self.class_index = {cls: i for i, cls in enumerate(self.classes)}
+        self.unknown_idx = self.class_index.setdefault('Unknown', len(self.classes))
+        n_slots = max(len(self.classes), self.unknown_idx + 1)
+
+        self.capacity = max(frames_in_action, frames_out)
+        self._ring_class = [self.unknown_idx] * self.capacity
+        self._ring_conf = np.zeros((self.capacity, len(self.classes)), dtype=np.float64)
+        self._start = 0
+        self._length = 0
+        self._votes = [0] * n_slots
+        self._conf_sum = np.zeros(len(self.classes), dtype=np.float64)
 
     def reset_counter(self, ignore_next_frames=0):
         """
         Clear counters arrays and can ignore the next frames
         """
 
-        self.in_action = False
-        self.counter_class = np.empty((0))
-        self.counter_confidences = np.empty(
-            (0, len(self.classes)), dtype=np.float64)
+        with self.lock:
+            self.in_action = False
+            self._start = 0
+            self._length = 0
+            for i in range(len(self._votes)):
+                self._votes[i] = 0
+            self._conf_sum.fill(0.)
+
+            if ignore_next_frames > 0:
+                self.ignore_frames = ignore_next_frames
+
+    def _drop_oldest(self):
+        """
+        Remove the oldest frame from the ring buffer and its running totals
+        """
+
+        self._votes[self._ring_class[self._start]] -= 1
+        self._conf_sum -= self._ring_conf[self._start]
+        self._start = (self._start + 1) % self.capacity
+        self._length -= 1
 
-        if ignore_next_frames > 0:
-            self.ignore_frames = ignore_next_frames
+    def _first_in_window(self, candidates):
+        """
+        Among tied classes, return the one seen first in the window, as
+        Counter.most_common would
+        """
+
+        for k in range(self._length):
+            idx = self._ring_class[(self._start + k) % self.capacity]
+            if idx in candidates:
+                return idx
 
     def get_prediction(self):
         """
@@ -51,19 +92,19 @@ class Delay():
         moving average rule
         """
 
-        most_common_class, most_common_rep = Counter(
-            self.counter_class).most_common(1)[0]
+        most_common_rep = max(self._votes)
+        window = self.frames_in_action if self.in_action else self.frames_out
 
-        if (self.in_action and most_common_rep >= self.moving_average * self.frames_in_action) or\
-                (not self.in_action and most_common_rep >= self.moving_average * self.frames_out):
+        if most_common_rep >= self.moving_average * window:
+            candidates = [i for i, n in enumerate(self._votes) if n == most_common_rep]
+            idx_cls = candidates[0] if len(candidates) == 1 else self._first_in_window(candidates)
 
-            if most_common_class == 'Unknown':
+            if idx_cls == self.unknown_idx:
                 return ('Unknown', 1.0)
 
-            idx_cls = self.classes.index(most_common_class)
-            avg_confidence = self.counter_confidences.mean(axis=0)[idx_cls]
+            avg_confidence = self._conf_sum[idx_cls] / self._length
 
-            return (most_common_class, avg_confidence)
+            return (self.classes[idx_cls], avg_confidence)
 
         return ('Unknown', 1.0)
 
@@ -72,34 +113,49 @@ class Delay():
         Change the in_action state
         """
 
-        if self.in_action == value:
-            return
-        self.in_action = value
-        if value:
-            self.counter_class = self.counter_class[-self.frames_in_action:]
-            self.counter_confidences = self.counter_confidences[-self.frames_in_action:, :]
+        with self.lock:
+            if self.in_action == value:
+                return
+            self.in_action = value
+            if value:
+                while self._length > self.frames_in_action:
+                    self._drop_oldest()
 
     def update(self, cls, conf=None):
         """
         Based on the last frames, compute the most possible prediction and
         its confidence
         """
-        if conf is None:
-            conf = np.zeros((1, len(self.classes)), dtype=np.float64)
-
-        if self.ignore_frames > 0:
-            self.ignore_frames -= 1
-            return (None, None)
 
-        self.counter_class = np.append(self.counter_class, cls)
-        self.counter_confidences = np.vstack((self.counter_confidences, conf))
+        return self.update_index(self.class_index[cls], conf)
 
-        if (self.in_action and len(self.counter_class) < self.frames_in_action) or\
-           (not self.in_action and len(self.counter_class) < self.frames_out):
-            return (None, None)
-
-        self.counter_class = np.delete(self.counter_class, 0)
-        self.counter_confidences = np.delete(
-            self.counter_confidences, 0, axis=0)
+    def update_index(self, idx, conf=None):
+        """
+        Same as update, but takes the class index (position in classes, or
+        unknown_idx) instead of its label
+        """
 
-        return self.get_prediction()
+        with self.lock:
+            if self.ignore_frames > 0:
+                self.ignore_frames -= 1
+                return (None, None)
+
+            if self._length == self.capacity:
+                self._drop_oldest()
+            pos = (self._start + self._length) % self.capacity
+            self._ring_class[pos] = idx
+            self._votes[idx] += 1
+            if conf is None:
+                self._ring_conf[pos].fill(0.)
+            else:
+                self._ring_conf[pos] = conf
+                self._conf_sum += self._ring_conf[pos]
+            self._length += 1
+
+            if (self.in_action and self._length < self.frames_in_action) or\
+               (not self.in_action and self._length < self.frames_out):
+                return (None, None)
+
+            self._drop_oldest()
+
+            return self.get_prediction()
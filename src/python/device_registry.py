@@ -0,0 +1,110 @@
+import threading
+import time
+
+
+class DeviceRegistry:
+    """
+    Device Registry Class.
+
+    Local cache of spotipy's devices() list (Spotify Connect devices), refreshed by a
+    background poller every ttl seconds.  The device a connect_cycle gesture switches to (the
+    one before the active device in the list, wrapping around) is computed whenever the list
+    changes, so the gesture costs a single transfer_playback() request.  Our own transfers
+    update it optimistically.
+
+    Arguments:
+        sp_client {PlaybackBackend}: authenticated Spotify client, or another playback backend
+    Keyword Arguments:
+        ttl {float, optional}: seconds between polls.  A read refreshes the cache itself
+                once it is older than ttl, or than 2 * ttl while the poller runs, so reads
+                do not race the next poll.
+                (Default: {10.})
+        poll {bool, optional}: start the background poller.
+                (Default: {True})
+    """
+
+    def __init__(self, sp_client, ttl=10., poll=True):
+        self.sp_client = sp_client
+        self.ttl = ttl
+        self.devices = []
+        self.next = None  # device the next cycle switches to
+        self.updated = None
+        self.refreshes = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.poller = None
+        if poll:
+            self.start_polling()
+
+    def start_polling(self):
+        """
+        Start the background poller, if not running yet
+        """
+
+        if self.poller is None:
+            self.poller = threading.Thread(target=self._poll, name='device_poller', daemon=True)
+            self.poller.start()
+
+    def _poll(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Could not refresh the device list...")
+                print(e)
+            self.stop_event.wait(self.ttl)
+
+    def refresh(self):
+        """
+        Fetch devices() from Spotify into the cache
+        """
+
+        devices = self.sp_client.devices()['devices']
+        with self.lock:
+            self.devices = devices
+            self.updated = time.monotonic()
+            self.refreshes += 1
+            self._predict()
+
+    def _predict(self):
+        """
+        Compute the device the next cycle switches to.  Call with the lock held.
+        """
+
+        active = next((i for i, dev in enumerate(self.devices) if dev['is_active']), 0)
+        self.next = self.devices[active - 1] if len(self.devices) > 1 else None  # Loop backwards
+
+    def max_age(self):
+        """
+        Age of the cache a read accepts, as PlaybackState.max_age
+        """
+
+        polling = self.poller is not None and not self.stop_event.is_set()
+        return 2 * self.ttl if polling else self.ttl
+
+    def next_device(self):
+        """
+        Device a connect_cycle switches to, or None if there is no other device
+        """
+
+        with self.lock:
+            fresh = self.updated is not None and time.monotonic() - self.updated < self.max_age()
+        if not fresh:
+            self.refresh()
+        with self.lock:
+            return None if self.next is None else dict(self.next)
+
+    def activate(self, device_id):
+        """
+        Mark a device active after transferring playback to it
+        """
+
+        with self.lock:
+            for dev in self.devices:
+                dev['is_active'] = dev['id'] == device_id
+            self._predict()
+
+    def stop(self, timeout=1.):
+        self.stop_event.set()
+        if self.poller is not None:
+            self.poller.join(timeout)
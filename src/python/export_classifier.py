@@ -0,0 +1,76 @@
+import os
+import time
+import pickle
+import argparse
+import numpy as np
+
+from compiled_classifier import CompiledClassifier
+from sequence_classifier import SequenceClassifier
+from landmark_dataset import load_dataset
+from model_artifact import save_model, load_model
+from utils import N_LANDMARKS
+
+parser = argparse.ArgumentParser(description="Convert a pickled pose classifier (trained sklearn model or compiled "
+                                             "export) or sequence model to a NumPy-only model artifact (.npz).")
+parser.add_argument("-m", "--model_path", type=str, default='models/spotify_gesture_cmd_model.pkl',
+                    help='Pickled sklearn Pipeline/SVC, CompiledClassifier or SequenceClassifier to convert')
+parser.add_argument("-s", "--save_path", type=str, default=None,
+                    help='Path to save the model artifact (default: <model>.npz)')
+parser.add_argument("-d", "--dataset_path", type=str, default='data/spotify_control_training_data.csv',
+                    help='Dataset (CSV or .lmd) used to check that both models give the same probabilities')
+parser.add_argument("--tolerance", type=float, default=1e-9,
+                    help='Largest accepted difference between the probabilities of both models')
+args = parser.parse_args()
+
+path_save_model = args.save_path or args.model_path.replace('.pkl', '').replace('_compiled', '') + '.npz'
+
+print(f'Loading {args.model_path}...')
+t0 = time.perf_counter()
+model = pickle.load(open(args.model_path, 'rb'))
+pickle_load_s = time.perf_counter() - t0
+if isinstance(model, (CompiledClassifier, SequenceClassifier)):
+    exported = model
+    print(f'{type(model).__name__} with classes {list(model.classes_)}', end='\n\n')
+else:
+    exported = CompiledClassifier.from_sklearn(model)
+    print(f'Exported {exported.kernel} SVC with {len(exported.support_vectors)} support vectors '
+          f'and classes {list(exported.classes_)}', end='\n\n')
+
+print('Saving model artifact...')
+save_model(path_save_model, exported, source=os.path.basename(args.model_path))
+t0 = time.perf_counter()
+artifact = load_model(path_save_model)
+artifact_load_s = time.perf_counter() - t0
+print(f'Model artifact Saved in {path_save_model} (schema {artifact.schema})', end='\n\n')
+
+# Parity check of the artifact against the pickled model
+X = np.asarray(load_dataset(args.dataset_path)[0], dtype=np.float64)
+if isinstance(exported, SequenceClassifier):
+    # Consecutive dataset rows as windows of frames
+    X = X[:len(X) // exported.window * exported.window].reshape(-1, exported.window, N_LANDMARKS, 3)
+expected = model.predict_proba(X)
+batch = artifact.predict_proba(X)
+results = [('batch', batch)]
+if isinstance(artifact, CompiledClassifier):
+    results.append(('single sample', np.vstack([artifact.predict_proba(X[i:i + 1]) for i in range(len(X))])))
+for mode, result in results:
+    max_diff = np.abs(result - expected).max()
+    print(f'{mode:>13}: max abs probability diff {max_diff:.2e}, '
+          f'same predicted class for {np.mean(result.argmax(1) == expected.argmax(1)):.2%} of {len(X)} samples')
+    if max_diff > args.tolerance:
+        os.remove(path_save_model)
+        raise SystemExit(f'Model artifact does not match {args.model_path}!')
+
+
+def per_call_us(func, x, repeat=2000):
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        func(x)
+    return (time.perf_counter() - t0) / repeat * 1e6
+
+
+print()
+print(f'Load: pickle {pickle_load_s * 1000.:7.1f} ms   artifact {artifact_load_s * 1000.:7.1f} ms')
+if exported is not model:
+    print(f'Single sample predict_proba: sklearn {per_call_us(model.predict_proba, X[:1]):7.1f} us   '
+          f'compiled {per_call_us(artifact.predict_proba, X[:1]):7.1f} us')
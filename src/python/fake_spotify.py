@@ -0,0 +1,173 @@
+import random
+import threading
+import time
+from collections import Counter
+
+from playback_backend import PlaybackBackend, PlaybackError
+
+
+class FakeSpotify(PlaybackBackend):
+    """
+    Fake Spotify Class.
+
+    In-process mock playback backend, a local stand-in for spotipy.Spotify with the calls
+    SpotifyControls makes, so the gesture pipeline runs without a Spotify login or network,
+    e.g. in replay.py or with gesture_controller.py --backend mock.  Playback (devices,
+    volume, track, progress and is_playing) lives in memory, and every call is counted and
+    optionally slowed down to mimic the API round trip.  A fraction of the calls can fail,
+    before changing anything, with a PlaybackError of error_status.  Like Spotify, player
+    commands fail with a 404 PlaybackError while no device is active, and so does a transfer
+    to an unknown device: start with active_device=None, or remove_device() the cached one,
+    to exercise the fallbacks of SpotifyControls.
+
+    Keyword Arguments:
+        latency {float, optional}: seconds each call sleeps before returning.
+                (Default: {0.})
+        jitter {float, optional}: up to this many seconds, uniformly drawn, are added to the
+                latency of each call.
+                (Default: {0.})
+        error_rate {float, optional}: fraction of the calls that fail.
+                (Default: {0.})
+        error_status {int, optional}: HTTP status of the failures, e.g. 503 for a transient
+                error or 404 for no active device.
+                (Default: {503})
+        seed {int, optional}: random seed of the jitter and failures.
+                (Default: {0})
+        n_devices {int, optional}: number of devices playback can be transferred to.
+                (Default: {2})
+        active_device {int, optional}: index of the active device, None for no active device.
+                (Default: {0})
+        duration_ms {int, optional}: duration of every track.
+                (Default: {200000})
+    """
+
+    def __init__(self, latency=0., n_devices=2, duration_ms=200000, jitter=0., error_rate=0., error_status=503,
+                 seed=0, active_device=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.duration_ms = duration_ms
+        self.calls = Counter()
+        self.failures = Counter()
+        self.lock = threading.Lock()
+        self.devices_list = [{'id': f'device{i}', 'name': f'Device {i}', 'type': 'Computer',
+                              'is_active': i == active_device, 'volume_percent': 50} for i in range(n_devices)]
+        self.track = 0
+        self.is_playing = True
+        self.progress_ms = 0
+        self.started = time.monotonic()
+        self.saved_tracks = set()
+
+    def _call(self, name):
+        with self.lock:
+            self.calls[name] += 1
+            latency = self.latency + (self.random.uniform(0., self.jitter) if self.jitter else 0.)
+            failed = self.error_rate and self.random.random() < self.error_rate
+            if failed:
+                self.failures[name] += 1
+        if latency:
+            time.sleep(latency)
+        if failed:
+            raise PlaybackError(self.error_status, f'{name} failed (injected)')
+
+    def _progress(self):
+        if not self.is_playing:
+            return self.progress_ms
+        return min(self.duration_ms, self.progress_ms + int((time.monotonic() - self.started) * 1000))
+
+    def _seek(self, position_ms):
+        self.progress_ms = max(0, min(self.duration_ms, position_ms))
+        self.started = time.monotonic()
+
+    def _active(self):
+        for dev in self.devices_list:
+            if dev['is_active']:
+                return dev
+        return None
+
+    def _require_active(self):
+        device = self._active()
+        if device is None:
+            raise PlaybackError(404, 'Player command failed: No active device found')
+        return device
+
+    def _item(self):
+        return {'id': f'track{self.track}', 'uri': f'spotify:track:track{self.track}',
+                'duration_ms': self.duration_ms}
+
+    def current_playback(self):
+        self._call('current_playback')
+        with self.lock:
+            device = self._active()
+            if device is None:
+                return None
+            return {'device': dict(device), 'is_playing': self.is_playing,
+                    'progress_ms': self._progress(), 'item': self._item()}
+
+    def devices(self):
+        self._call('devices')
+        with self.lock:
+            return {'devices': [dict(dev) for dev in self.devices_list]}
+
+    def transfer_playback(self, device_id, force_play=True):
+        self._call('transfer_playback')
+        with self.lock:
+            if not any(dev['id'] == device_id for dev in self.devices_list):
+                raise PlaybackError(404, f'Device not found: {device_id}')
+            for dev in self.devices_list:
+                dev['is_active'] = dev['id'] == device_id
+
+    def start_playback(self, *args, **kwargs):
+        self._call('start_playback')
+        with self.lock:
+            self._require_active()
+            self._seek(self._progress())
+            self.is_playing = True
+
+    def pause_playback(self, *args, **kwargs):
+        self._call('pause_playback')
+        with self.lock:
+            self._require_active()
+            self._seek(self._progress())
+            self.is_playing = False
+
+    def next_track(self, *args, **kwargs):
+        self._call('next_track')
+        with self.lock:
+            self._require_active()
+            self.track += 1
+            self._seek(0)
+
+    def previous_track(self, *args, **kwargs):
+        self._call('previous_track')
+        with self.lock:
+            self._require_active()
+            self.track = max(0, self.track - 1)
+            self._seek(0)
+
+    def seek_track(self, position_ms, *args, **kwargs):
+        self._call('seek_track')
+        with self.lock:
+            self._require_active()
+            self._seek(position_ms)
+
+    def volume(self, volume_percent, *args, **kwargs):
+        self._call('volume')
+        with self.lock:
+            self._require_active()['volume_percent'] = volume_percent
+
+    def current_user_saved_tracks_add(self, tracks=None):
+        self._call('current_user_saved_tracks_add')
+        with self.lock:
+            self.saved_tracks.update(tracks or [])
+
+    def remove_device(self, device_id):
+        """
+        Take a device off the list, e.g. a speaker switched off; if it was active, no device is
+        active anymore.  Not an API call: it is neither counted nor failed.
+        """
+
+        with self.lock:
+            self.devices_list = [dev for dev in self.devices_list if dev['id'] != device_id]
@@ -0,0 +1,173 @@
+import json
+import time
+import random
+import threading
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+from fake_spotify import FakeSpotify
+from playback_backend import PlaybackError
+
+
+class FakeSpotifyHandler(BaseHTTPRequestHandler):
+    """
+    The Web API endpoints SpotifyControls uses, answered from the server's FakeSpotify
+    """
+
+    def do_GET(self):
+        self.route('GET')
+
+    def do_PUT(self):
+        self.route('PUT')
+
+    def do_POST(self):
+        self.route('POST')
+
+    def route(self, method):
+        try:
+            self.answer(method)
+        except PlaybackError as e:
+            self.send_json({'error': {'status': e.http_status, 'message': e.msg}}, e.http_status, e.headers)
+
+    def answer(self, method):
+        server = self.server.fake_server
+        url = urlparse(self.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}') if length else {}
+        endpoint = f"{method} {url.path.rstrip('/')}"
+
+        refusal = server.admit(endpoint)
+        if refusal is not None:
+            code, headers, message = refusal
+            return self.send_json({'error': {'status': code, 'message': message}}, code, headers)
+
+        fake = server.fake
+        if endpoint == 'GET /v1/me/player':
+            playback = fake.current_playback()
+            return self.send_json(playback) if playback is not None else self.send_empty()
+        if endpoint == 'GET /v1/me/player/devices':
+            return self.send_json(fake.devices())
+        if endpoint == 'PUT /v1/me/player':
+            fake.transfer_playback(body['device_ids'][0], force_play=body.get('play', False))
+        elif endpoint == 'PUT /v1/me/player/play':
+            fake.start_playback()
+        elif endpoint == 'PUT /v1/me/player/pause':
+            fake.pause_playback()
+        elif endpoint == 'POST /v1/me/player/next':
+            fake.next_track()
+        elif endpoint == 'POST /v1/me/player/previous':
+            fake.previous_track()
+        elif endpoint == 'PUT /v1/me/player/seek':
+            fake.seek_track(int(query['position_ms']))
+        elif endpoint == 'PUT /v1/me/player/volume':
+            fake.volume(int(query['volume_percent']))
+        elif endpoint == 'PUT /v1/me/tracks':  # spotipy 2.18
+            fake.current_user_saved_tracks_add(tracks=query.get('ids', '').split(','))
+        elif endpoint == 'PUT /v1/me/library':  # newer spotipy versions
+            fake.current_user_saved_tracks_add(tracks=query.get('uris', '').split(','))
+        else:
+            return self.send_json({'error': {'status': 404, 'message': f'Unknown endpoint {endpoint}'}}, 404)
+        self.send_empty()
+
+    def send_json(self, obj, code=200, headers=None):
+        body = json.dumps(obj).encode()
+        self.send_response(code)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def send_empty(self):
+        self.send_response(204)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+class FakeSpotifyServer:
+    """
+    Fake Spotify Server Class.
+
+    Local HTTP server speaking the part of the Spotify Web API that SpotifyControls uses, on
+    top of a FakeSpotify, so the real spotipy client, its HTTP session and the rate limiting
+    around it can be exercised without network.  Like Spotify, it answers 429 with a
+    Retry-After header once the requests of the last window seconds go over rate_limit, and
+    it can fail a fraction of the requests with a 503.  The PlaybackErrors of the FakeSpotify,
+    e.g. the 404 of no active device, are answered with their status.  requests counts the
+    requests per endpoint and answer, e.g. requests['PUT /v1/me/player/volume', 429].
+
+    Keyword Arguments:
+        fake {FakeSpotify, optional}: playback state to serve, a new one if not given.
+                (Default: {None})
+        rate_limit {int, optional}: requests allowed per window, None for no limit.
+                (Default: {None})
+        window {float, optional}: seconds of the rolling rate limit window.
+                (Default: {1.})
+        retry_after {int, optional}: Retry-After seconds of the 429 answers.
+                (Default: {1})
+        error_rate {float, optional}: fraction of the requests answered 503.
+                (Default: {0.})
+        seed {int, optional}: random seed of the failures.
+                (Default: {0})
+    """
+
+    def __init__(self, fake=None, rate_limit=None, window=1., retry_after=1, error_rate=0., seed=0):
+        self.fake = fake if fake is not None else FakeSpotify()
+        self.rate_limit = rate_limit
+        self.window = window
+        self.retry_after = retry_after
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.recent = deque()  # time of the requests of the last window
+        self.requests = Counter()
+        self.lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), FakeSpotifyHandler)
+        self.server.daemon_threads = True
+        self.server.fake_server = self
+        self.url = f'http://127.0.0.1:{self.server.server_address[1]}'
+        self.thread = threading.Thread(target=self.server.serve_forever, name='fake_spotify', daemon=True)
+
+    def admit(self, endpoint):
+        """
+        None if the request is served, else the (code, headers, message) of its refusal
+        """
+
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] >= self.window:
+                self.recent.popleft()
+            if self.rate_limit is not None and len(self.recent) >= self.rate_limit:
+                self.requests[endpoint, 429] += 1
+                return 429, {'Retry-After': str(self.retry_after)}, 'API rate limit exceeded'
+            self.recent.append(now)
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.requests[endpoint, 503] += 1
+                return 503, {}, 'Service unavailable'
+            self.requests[endpoint, 200] += 1
+        return None
+
+    def client(self):
+        """
+        spotipy client of this server, without urllib3 retries so every answer reaches the caller
+        """
+
+        import requests
+        import spotipy
+
+        client = spotipy.Spotify(auth='fake-token', requests_session=requests.Session(), requests_timeout=2)
+        client.prefix = self.url + '/v1/'
+        return client
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
@@ -0,0 +1,121 @@
+import threading
+import tracemalloc
+from collections import deque
+import numpy as np
+
+
+class FrameBuffers:
+    """
+    Frame Buffers Class.
+
+    Reusable image arrays keyed by name, e.g. the RGB frame given to MediaPipe or the
+    display frame.  A buffer is only reallocated when the requested shape changes, and
+    the bytes allocated that way are counted, so the steady state can be checked to
+    allocate nothing.  Each key must only be used by one thread.
+    """
+
+    def __init__(self):
+        self.buffers = {}
+        self.allocated_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, shape, dtype=np.uint8):
+        buf = self.buffers.get(key)
+        if buf is None or buf.shape != tuple(shape) or buf.dtype != dtype:
+            buf = np.empty(shape, dtype=dtype)
+            self.buffers[key] = buf
+            with self.lock:
+                self.allocated_bytes += buf.nbytes
+        return buf
+
+
+class FramePool:
+    """
+    Frame Pool Class.
+
+    Captured frames handed from stage to stage.  acquire() returns a free buffer of the
+    given shape (allocating one only when none is free) and release() gives it back once
+    no stage reads it anymore: after display, or when a queue drops the frame.
+
+    Arguments:
+        buffers {FrameBuffers}: where the bytes allocated for new frames are counted
+    """
+
+    def __init__(self, buffers):
+        self.buffers = buffers
+        self.free = []
+        self.lock = threading.Lock()
+
+    def acquire(self, shape, dtype=np.uint8):
+        shape = tuple(shape)
+        with self.lock:
+            for i, buf in enumerate(self.free):
+                if buf.shape == shape and buf.dtype == dtype:
+                    return self.free.pop(i)
+        buf = np.empty(shape, dtype=dtype)
+        with self.buffers.lock:
+            self.buffers.allocated_bytes += buf.nbytes
+        return buf
+
+    def release(self, buf):
+        with self.lock:
+            self.free.append(buf)
+
+
+class AllocationMeter:
+    """
+    Allocation Meter Class.
+
+    Reports how many bytes the frame path allocates per frame:
+        - frame_bytes: new frame buffers and reusable buffers (FrameBuffers/FramePool);
+          zero once the pipeline reaches its steady state
+        - traced_bytes (with trace=True, Python 3.9+): high-water mark of all Python
+          and NumPy allocations, from any thread, above the level of the previous frame,
+          using tracemalloc.  Tracing slows everything down, so only use it to check.
+
+    Arguments:
+        buffers {FrameBuffers}: buffers whose allocations are counted
+    Keyword Arguments:
+        trace {bool, optional}: also trace all allocations with tracemalloc.
+                (Default: {False})
+    """
+
+    def __init__(self, buffers, trace=False):
+        self.buffers = buffers
+        self.trace = trace and hasattr(tracemalloc, 'reset_peak')
+        if self.trace:
+            tracemalloc.start()
+            self.last_traced, _ = tracemalloc.get_traced_memory()
+        self.last_frame_bytes = buffers.allocated_bytes
+        self.frames = 0
+        self.recent = deque(maxlen=100)
+
+    def frame(self):
+        """
+        Account for one more frame; returns (frame_bytes, traced_bytes) allocated since the last one
+        """
+
+        self.frames += 1
+        frame_bytes = self.buffers.allocated_bytes - self.last_frame_bytes
+        self.last_frame_bytes = self.buffers.allocated_bytes
+
+        traced_bytes = 0
+        if self.trace:
+            current, peak = tracemalloc.get_traced_memory()
+            traced_bytes = max(0, peak - self.last_traced)
+            tracemalloc.reset_peak()
+            self.last_traced = current
+        self.recent.append((frame_bytes, traced_bytes))
+        return frame_bytes, traced_bytes
+
+    def report(self):
+        """
+        Mean bytes allocated per frame over the last 100 frames, and in total since the start
+        """
+
+        recent = max(1, len(self.recent))
+        line = f'{"allocations":>12}: frame buffers {sum(b for b, _ in self.recent) / recent:10.0f} B/frame ' \
+               f'({self.buffers.allocated_bytes} B in total over {self.frames} frames)'
+        if self.trace:
+            line += f'  traced high-water {sum(b for _, b in self.recent) / recent:10.0f} B/frame'
+        return line
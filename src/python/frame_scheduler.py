@@ -0,0 +1,174 @@
+import time
+from collections import Counter
+import cv2
+
+from frame_buffers import FrameBuffers
+
+
+class FramePacer:
+    """
+    Frame Pacer Class.
+
+    Caps a loop at target_fps: wait() sleeps until the next frame is due.  Frames are due on
+    a fixed grid, so sleep overshoot does not add up; a loop that falls behind starts a new
+    grid instead of bursting to catch up.
+
+    Keyword Arguments:
+        target_fps {float, optional}: frames per second, 0 for no cap.
+                (Default: {30.})
+    """
+
+    def __init__(self, target_fps=30.):
+        self.interval = 1. / target_fps if target_fps else 0.
+        self.next = None
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.perf_counter()
+        if self.next is not None and self.next > now:
+            time.sleep(self.next - now)
+        else:
+            self.next = now
+        self.next += self.interval
+
+
+class DetectionScheduler:
+    """
+    Detection Scheduler Class.
+
+    Decides for every frame of every stream whether MediaPipe runs on it:
+        - active: a hand was seen in the last idle_after seconds, every frame is detected
+        - idle: frames are detected at idle_fps only, until a frame differs enough from the
+          previous one (mean absolute difference of small gray thumbnails above
+          motion_threshold), which makes the stream active again right away
+        - locked: every hand of the stream is in a Delay lock-out (ignore_frames), so its
+          classification would be thrown away, and detection is skipped
+    A skipped frame reuses the results of the last detection, so the classifier and the
+    Delays still tick once per frame and lock-outs keep counting down.
+
+    Arguments:
+        classifier {MultiStreamClassifier, SequenceStreamClassifier}: read for the lock-out of
+                each hand
+    Keyword Arguments:
+        idle_fps {float, optional}: detection rate of a stream without hands, 0 to only wake up
+                on motion.
+                (Default: {5.})
+        idle_after {float, optional}: seconds without hands before a stream goes idle.
+                (Default: {2.})
+        motion_threshold {float, optional}: mean absolute thumbnail difference (0-255) that
+                counts as motion, None to disable the motion gate.
+                (Default: {4.})
+        motion_width {int, optional}: width of the thumbnails compared by the motion gate.
+                (Default: {32})
+        skip_locked {bool, optional}: skip detection during lock-outs.
+                (Default: {True})
+        buffers {FrameBuffers, optional}: reusable arrays for the thumbnails, None for
+                buffers of its own.
+                (Default: {None})
+    """
+
+    def __init__(self, classifier, idle_fps=5., idle_after=2., motion_threshold=4., motion_width=32,
+                 skip_locked=True, buffers=None):
+        self.classifier = classifier
+        self.idle_interval = 1. / idle_fps if idle_fps else float('inf')
+        self.idle_after = idle_after
+        self.motion_threshold = motion_threshold
+        self.motion_width = motion_width
+        self.skip_locked = skip_locked
+        self.buffers = buffers if buffers is not None else FrameBuffers()
+        self.results = {}  # stream -> results of the last detection
+        self.last_hand = {}  # stream -> time a hand was last seen (or motion, or the first frame)
+        self.last_detect = {}  # stream -> time of the last detection
+        self.thumbnails = {}  # stream -> thumbnail of the previous idle frame, or None
+        self.counts = Counter()
+
+    def process(self, stream, image, detect, now=None):
+        """
+        Results of one stream for this frame: detect() (e.g. RoiDetector.process) when the
+        stream needs it, else the results of its last detection.  image may be None when
+        there is nothing to compare, e.g. replayed landmarks; the motion gate is then off.
+        """
+
+        now = time.perf_counter() if now is None else now
+        skip = self.skip_reason(stream, image, now)
+        if skip is None:
+            results = detect()
+            self.results[stream] = results
+            self.last_detect[stream] = now
+            self.counts['detected'] += 1
+        else:
+            results = self.results[stream]
+            self.counts[skip] += 1
+        if results.multi_hand_landmarks or stream not in self.last_hand:
+            self.last_hand[stream] = now
+        return results
+
+    def skip_reason(self, stream, image, now):
+        """
+        None if the frame must be detected, else why it is not ('locked' or 'idle')
+        """
+
+        results = self.results.get(stream)
+        if results is None:
+            return None
+
+        if results.multi_hand_landmarks:
+            if self.skip_locked and self.locked(stream, results):
+                return 'locked'
+            self.thumbnails[stream] = None
+            return None
+
+        if now - self.last_hand[stream] < self.idle_after:
+            self.thumbnails[stream] = None
+            return None
+
+        if image is not None and self.motion_threshold is not None and self.motion(stream, image):
+            self.counts['motion'] += 1
+            self.last_hand[stream] = now
+            return None
+        if now - self.last_detect[stream] >= self.idle_interval:
+            return None
+        return 'idle'
+
+    def locked(self, stream, results):
+        """
+        Whether every hand of the last results is ignoring its next frames.  Detections run a
+        frame or so ahead of classification, so the last frame of a lock-out is detected.
+        """
+
+        return all(self.classifier.delay(stream, handedness.classification[0].label).ignore_frames > 1
+                   for handedness in results.multi_handedness)
+
+    def motion(self, stream, image):
+        """
+        Compare a gray thumbnail of the frame with the one of the previous idle frame
+        """
+
+        height, width = image.shape[:2]
+        size = (self.motion_width, max(1, height * self.motion_width // width))
+        small = cv2.resize(image, size, dst=self.buffers.get('motion', (size[1], size[0], 3)),
+                           interpolation=cv2.INTER_AREA)
+        # Two thumbnail buffers per stream take turns as the current and the previous one
+        previous = self.thumbnails.get(stream)
+        turn = 1 if previous is self.buffers.buffers.get(('motion', stream, 0)) else 0
+        thumbnail = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY,
+                                 dst=self.buffers.get(('motion', stream, turn), (size[1], size[0])))
+        self.thumbnails[stream] = thumbnail
+        if previous is None or previous.shape != thumbnail.shape:
+            return False
+        return cv2.norm(thumbnail, previous, cv2.NORM_L1) / thumbnail.size > self.motion_threshold
+
+    def summary(self):
+        frames = sum(self.counts[key] for key in ('detected', 'idle', 'locked'))
+        return {'frames': frames,
+                'detected': self.counts['detected'],
+                'skipped_idle': self.counts['idle'],
+                'skipped_locked': self.counts['locked'],
+                'motion_wakeups': self.counts['motion'],
+                'duty_cycle': self.counts['detected'] / frames if frames else 1.}
+
+    def report(self):
+        s = self.summary()
+        return (f"detection on {s['duty_cycle']:.0%} of {s['frames']} frames: {s['skipped_idle']} skipped idle, "
+                f"{s['skipped_locked']} skipped locked, {s['motion_wakeups']} motion wake-ups")
@@ -1,25 +1,28 @@
 import cv2
 import os
 import mediapipe as mp
-import pandas as pd
 import argparse
-from collections import defaultdict
+import numpy as np
+
+from utils import extract_landmarks, N_LANDMARKS
+from sample_writer import SampleWriter
 
 parser = argparse.ArgumentParser()
-parser.add_argument("-f", "--file", help="data file name",
+parser.add_argument("-f", "--file", help="data file name, *.lmd to append to a binary LandmarkDataset",
                     type=str, required=True)
 parser.add_argument("-p", "--path", help="directory to save the data", type=str, default='.')
+parser.add_argument("--autosave", help="seconds between automatic saves", type=float, default=30.)
 args = parser.parse_args()
 
 file_name = args.file
 path = args.path
-if not file_name.endswith('.csv'):
+if not file_name.endswith('.csv') and not file_name.endswith('.lmd'):
     file_name += '.csv'
 file_path = os.path.join(path, file_name)
 
 mp_drawing = mp.solutions.drawing_utils
 mp_hands = mp.solutions.hands
-landmarks = [x.name for x in mp_hands.HandLandmark]
+landmarks_buffer = np.empty((N_LANDMARKS, 3), dtype=np.float32)
 key2cmd = {
     'c': 'connect_cycle',
     'n': 'next_track',
@@ -40,8 +43,8 @@ key2cmd = {
     '0': 'skipfwd_5',
     'm': 'mark_pos',
 }
-counts = defaultdict(lambda: 0)
-data = []
+# Samples are copied into a fixed-size buffer and written by a background thread
+writer = SampleWriter(file_path, autosave=args.autosave)
 
 cap = cv2.VideoCapture(0)
 with mp_hands.Hands(
@@ -67,17 +70,9 @@ with mp_hands.Hands(
                 if handedness.classification[0].score <= .9:
                     continue
 
-                new_data = {}
-                for lm in landmarks:
-                    new_data[lm + '_x'] = hand_landmarks.landmark[mp_hands.HandLandmark[lm]].x
-                    new_data[lm + '_y'] = hand_landmarks.landmark[mp_hands.HandLandmark[lm]].y
-                    new_data[lm + '_z'] = hand_landmarks.landmark[mp_hands.HandLandmark[lm]].z
-                new_data['hand'] = handedness.classification[0].label
-
                 if key2cmd.get(key, 'unknown') != 'unknown':
-                    counts[key2cmd[key]] += 1
-                    new_data['class'] = key2cmd[key]
-                    data.append(new_data)
+                    extract_landmarks(hand_landmarks, landmarks_buffer)
+                    writer.add(landmarks_buffer, key2cmd[key], handedness.classification[0].label)
 
             mp_drawing.draw_landmarks(
                     image, hand_landmarks, mp_hands.HAND_CONNECTIONS)
@@ -85,8 +80,8 @@ with mp_hands.Hands(
         cv2.imshow('frame', image)
 
         s = f'\r'
-        for k in counts:
-            s += f'{k}: {counts[k]} '
+        for k in writer.counts:
+            s += f'{k}: {writer.counts[k]} '
         print(s, end='', flush=True)
 
         # Quit
@@ -95,16 +90,14 @@ with mp_hands.Hands(
 
         # Undo
         if key == 'z':
-            last_key = data[-1]['class']
-            counts[last_key] -= 1
-            data.pop(-1)
+            writer.undo()
 
         # Write what you have w/o exit
         if key == 'w':
-            pd.DataFrame(data).to_csv(file_path, index=False)
+            writer.save()
 
 print()
-pd.DataFrame(data).to_csv(file_path, index=False)
+writer.close()
 
 cap.release()
 cv2.destroyAllWindows()
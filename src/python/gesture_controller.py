@@ -1,109 +1,126 @@
-import numpy as np
-import pyautogui
-import imutils
-from mss import mss
-from PIL import Image
-
-import cv2
-import copy
+import time
+T0 = time.perf_counter()  # startup times are measured from here
+import signal
 import argparse
+import cv2
 
-from hand_poses import HandPoses
-from hand_detect import HandDetect
-from delay import Delay
-from spotify_controls import SpotifyControls
+from gesture_service import GestureService, DEFAULT_CONFIG
+from control_api import ControlServer
+from playback_backend import BACKENDS
 
 
 parser = argparse.ArgumentParser()
 parser.add_argument("--detect_threshold", help="minimum percentage of a hand prediction",
                     type=float, default=0.90)
-parser.add_argument("--pose_threshold", help="SVC threshold in classification confidence", 
+parser.add_argument("--pose_threshold", help="SVC threshold in classification confidence",
                     type=float, default=0.90)
 parser.add_argument("--path_classifier", help="path to classifier",
-                    type=str, default='models/spotify_gesture_cmd_model.pkl')
+                    type=str, default='models/spotify_gesture_cmd_model.npz')
+parser.add_argument("--path_sequence_model", help="window classifier (train_sequence_classifier.py) to use instead "
+                                                  "of the pose classifier and its Delays",
+                    type=str, default=None)
+parser.add_argument("--sequence_threshold", help="minimum probability of a window classifier decision",
+                    type=float, default=0.80)
+parser.add_argument("--confirm_frames", help="consecutive windows agreeing before the window classifier fires",
+                    type=int, default=3)
+parser.add_argument("--confirm_frames_in_action", help="consecutive windows agreeing before the window classifier "
+                                                       "fires again for a held gesture",
+                    type=int, default=20)
 parser.add_argument("--moving_average", help="minimum percentage of pose prediction of last frames",
                     type=float, default=0.85)
-parser.add_argument("--frames_in", help="number of frames to consider to predict a pose when in action", 
+parser.add_argument("--frames_in", help="number of frames to consider to predict a pose when in action",
                     type=int, default=20)
-parser.add_argument("--frames_out", help="number of frames to consider to predict a pose", 
+parser.add_argument("--frames_out", help="number of frames to consider to predict a pose",
                     type=int, default=40)
-parser.add_argument("--show_lm", help="show hand landmarks", 
+parser.add_argument("--show_lm", help="show hand landmarks",
                     type=bool, default=True)
+parser.add_argument("--playback_ttl", help="seconds between Spotify playback state polls",
+                    type=float, default=2.0)
+parser.add_argument("--backend", help="player to control: spotify, mpris (local players on D-Bus) or mock "
+                                      "(in-process fake player, no account or network)",
+                    type=str, default='spotify', choices=list(BACKENDS))
+parser.add_argument("--cameras", help="indices of the webcams to read, e.g. --cameras 0 1",
+                    type=int, nargs='+', default=[0])
+parser.add_argument("--max_num_hands", help="maximum number of hands detected per camera",
+                    type=int, default=1)
+parser.add_argument("--inference_width", help="downsample frames to this width before hand detection",
+                    type=int, default=None)
+parser.add_argument("--track_roi", help="crop detection to the region around the last detected hands",
+                    action='store_true')
+parser.add_argument("--trace_alloc", help="also trace all allocations per frame with tracemalloc (slow)",
+                    action='store_true')
+parser.add_argument("--record_landmarks", help="write the detected landmarks to this CSV, for benchmark_pipeline.py",
+                    type=str, default=None)
+parser.add_argument("--target_fps", help="maximum frames captured per second, 0 for no cap",
+                    type=float, default=30.)
+parser.add_argument("--idle_fps", help="hand detections per second while no hand is in view",
+                    type=float, default=5.)
+parser.add_argument("--idle_after", help="seconds without hands before detection slows down to --idle_fps",
+                    type=float, default=2.)
+parser.add_argument("--motion_threshold", help="mean thumbnail difference (0-255) that brings detection back to full rate",
+                    type=float, default=4.)
+parser.add_argument("--detect_every_frame", help="run hand detection on every frame, even idle or locked ones",
+                    action='store_true')
+parser.add_argument("--screen", help="detect hands on screen captures instead of webcams",
+                    action='store_true')
+parser.add_argument("--headless", help="run without a window, until stopped with Ctrl-C, SIGTERM or the control API",
+                    action='store_true')
+parser.add_argument("--preview_fps", help="preview frames rendered per second (default: 30 with a window, 0 headless)",
+                    type=float, default=None)
+parser.add_argument("--api_port", help="serve the control API on this localhost port",
+                    type=int, default=None)
+parser.add_argument("--api_host", help="address the control API listens on",
+                    type=str, default='127.0.0.1')
+parser.add_argument("--api_socket", help="serve the control API on this Unix socket instead",
+                    type=str, default=None)
+parser.add_argument("--metrics_export", help="export the timings every --metrics_interval seconds to this file: "
+                                             "Prometheus text format for *.prom, else JSON lines",
+                    type=str, default=None)
+parser.add_argument("--metrics_interval", help="seconds between metrics exports",
+                    type=float, default=10.)
+parser.add_argument("--profile", help="profile the pipeline stages with cProfile and save the statistics to this file",
+                    type=str, default=None)
+parser.add_argument("--sample_profile", help="sample the stacks of all threads and save them, collapsed, to this file",
+                    type=str, default=None)
+parser.add_argument("--show_timings", help="print per-stage pipeline timings every few seconds",
+                    action='store_true')
 args = parser.parse_args()
 
-
-hand_detect = HandDetect(detect_threshold=args.detect_threshold)
-hand_pose = HandPoses(pose_threshold=args.pose_threshold,
-                      name_classifier=args.path_classifier)
-# This will log into Spotify using your personal account with a separate popup window
-spotify_controller = SpotifyControls()
-delay = Delay(hand_pose.classifier.classes_, moving_average=args.moving_average, frames_in_action=args.frames_in, frames_out=args.frames_out)
-
-webcam = True
-if webcam:
-    cap = cv2.VideoCapture(0)
-else:
-    sct = mss()
-
-with hand_detect.mp_hands.Hands(
-        max_num_hands=1,
-        min_detection_confidence=0.6,
-        min_tracking_confidence=0.5) as hands:
-    while True:
-        if webcam:
-            ret, image = cap.read()
-        else:  # screenshot
-            ret = True
-            # image = pyautogui.screenshot()
-            # image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            # Higher fps with mss for screen grab:
-            mon = sct.monitors[0]
-            image = np.array(sct.grab(mon))
-            image = np.flip(image[:, :, :3], 2)
-            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-
-
-        if not ret:  # Image was not successfully read!
-            print('\rNo image!  Is a webcam available?', '', end='')
-            continue
-
-        raw_frame = copy.deepcopy(image)
-
-        image = cv2.flip(image, 1)
-        image_height, image_width, _ = image.shape
-        #spotify_controller.draw_mouse_rectangle(image)
-
-        for (pose, confidence), (lm, mp_lm) in hand_detect.detect_hand(hands=hands,
-                                                              image=raw_frame,
-                                                              hand_pose=hand_pose,
-                                                              delay=delay):
-            if args.show_lm:
-                hand_detect.mp_drawing.draw_landmarks(
-                    image, mp_lm, hand_detect.mp_hands.HAND_CONNECTIONS)
-
-            if pose is not None:
-                cv2.putText(image, f"{pose}: ({confidence:.2f})",
-                            (30, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 100), 2)
-                print(f"\r{pose}: ({confidence:.2f})                   ", "", end="")
-
-                spotify_controller.execute_cmd(pose=pose, lm=lm, delay=delay, frame=image)
-
-            else:
-                cv2.putText(image, f"Idle", (30, 30),
-                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 100), 2)
-                if delay.ignore_frames:
-                    cv2.putText(image, f"Position locked", (30, 60),
-                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 100), 2)
-        key = (cv2.waitKey(10) & 0xFF)
-
-        image = cv2.resize(image, (int(image_width * .6),
-                                   int(image_height * .6)), interpolation=cv2.INTER_AREA)
-        # if webcam:
-        cv2.imshow('frame', image)
-
-        if key == ord('q'):
-            break
-
-if webcam:
-    cap.release()
-cv2.destroyAllWindows()
+if args.preview_fps is None:
+    args.preview_fps = 0. if args.headless else 30.
+service = GestureService(**{key: getattr(args, key) for key in DEFAULT_CONFIG})
+service.startup['imports_s'] = time.perf_counter() - T0
+service.start(t0=T0)
+
+server = None
+if args.api_port is not None or args.api_socket:
+    server = ControlServer(service, host=args.api_host, port=args.api_port or 0, socket_path=args.api_socket).start()
+    print(f'Control API on {server.url}')
+
+signal.signal(signal.SIGTERM, lambda signum, frame: service.request_stop())
+
+try:
+    last_report = time.perf_counter()
+    seq = 0
+    while service.running:
+        if args.headless:
+            service.stop_requested.wait(.5)
+        else:
+            # Display (main thread): show the last preview of each stream in its own window
+            seq, images = service.wait_preview(seq, timeout=.1)
+            for stream, image in enumerate(images or ()):
+                cv2.imshow('frame' if len(images) == 1 else f'frame {stream}', image)
+            if (cv2.waitKey(1) & 0xFF) == ord('q'):
+                break
+
+        if args.show_timings and time.perf_counter() - last_report > 5.:
+            print('\n' + service.report())
+            last_report = time.perf_counter()
+except KeyboardInterrupt:
+    pass
+finally:
+    if server is not None:
+        server.stop()
+    service.stop()
+    print('\n' + service.report())
+    cv2.destroyAllWindows()
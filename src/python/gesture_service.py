@@ -0,0 +1,695 @@
+import time
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import cv2
+
+from hand_poses import HandPoses
+from delay import Delay
+from pipeline import Pipeline
+from model_artifact import load_classifier, check_schema
+from playback_backend import make_backend
+from command_dispatcher import CommandDispatcher
+from multi_stream import MultiStreamClassifier, SequenceStreamClassifier
+from sequence_classifier import GestureWindow
+from roi_detect import RoiDetector
+from frame_buffers import FrameBuffers, FramePool, AllocationMeter
+from frame_scheduler import FramePacer, DetectionScheduler
+from replay import LandmarkRecorder
+from metrics import METRICS, MetricsExporter, SamplingProfiler
+
+# Settings of a GestureService, as gesture_controller.py takes them on the command line
+DEFAULT_CONFIG = {
+    'cameras': [0],
+    'screen': False,
+    'detect_threshold': 0.90,
+    'pose_threshold': 0.90,
+    'path_classifier': 'models/spotify_gesture_cmd_model.npz',
+    'path_sequence_model': None,
+    'sequence_threshold': 0.80,
+    'confirm_frames': 3,
+    'confirm_frames_in_action': 20,
+    'moving_average': 0.85,
+    'frames_in': 20,
+    'frames_out': 40,
+    'max_num_hands': 1,
+    'inference_width': None,
+    'track_roi': False,
+    'target_fps': 30.,
+    'idle_fps': 5.,
+    'idle_after': 2.,
+    'motion_threshold': 4.,
+    'detect_every_frame': False,
+    'preview_fps': 0.,
+    'show_lm': True,
+    'playback_ttl': 2.0,
+    'backend': 'spotify',
+    'record_landmarks': None,
+    'trace_alloc': False,
+    'metrics_export': None,
+    'metrics_interval': 10.,
+    'profile': None,
+    'sample_profile': None,
+}
+
+# Settings reconfigure() changes while running, with the type their new values are parsed as
+RUNTIME_SETTINGS = {
+    'cameras': lambda value: [int(camera) for camera in (value if isinstance(value, (list, tuple)) else [value])],
+    'detect_threshold': float,
+    'pose_threshold': float,
+    'sequence_threshold': float,
+    'confirm_frames': int,
+    'confirm_frames_in_action': int,
+    'moving_average': float,
+    'frames_in': int,
+    'frames_out': int,
+    'target_fps': float,
+    'idle_fps': float,
+    'idle_after': float,
+    'motion_threshold': float,
+    'preview_fps': float,
+    'show_lm': bool,
+}
+
+
+class FramePacket:
+    """
+    Data handed from one pipeline stage to the next for one frame of every stream
+    """
+    __slots__ = ('index', 't_capture', 'images', 'streams', 'results', 'detections')
+
+    def __init__(self, index, images, streams):
+        self.index = index
+        self.t_capture = time.perf_counter()
+        self.images = images
+        self.streams = streams
+        self.results = []
+        self.detections = []
+
+
+class GestureService:
+    """
+    Gesture Service Class.
+
+    The gesture controller as an importable object, without any window: start() opens the
+    cameras and runs capture, detection, classification and publishing on pipeline threads
+    until stop().  Commands go to the player (Spotify, or another backend of playback_backend)
+    through a CommandDispatcher, once it is connected in the background.  MediaPipe and the
+    backend (e.g. spotipy) are only imported by start().
+
+    Instead of drawing every frame, the publish stage renders a preview (landmarks and pose
+    drawn on a shrunk, mirrored frame) at most preview_fps times per second, for a window
+    (wait_preview) or the control API (preview_jpeg); 0 disables it and costs nothing.
+    status(), metrics(), recent_events() and reconfigure() are safe to call from any thread;
+    settings of RUNTIME_SETTINGS take effect without a restart.  New Delay settings start
+    fresh Delays, new cameras fresh detectors.
+
+    Keyword Arguments:
+        sp_client {PlaybackBackend, optional}: player to control instead of creating the
+                backend setting, see SpotifyControls.
+                (Default: {None})
+        **config: settings of DEFAULT_CONFIG, with the meaning of the gesture_controller.py
+                options of the same name
+    """
+
+    def __init__(self, sp_client=None, **config):
+        unknown = set(config) - set(DEFAULT_CONFIG)
+        if unknown:
+            raise TypeError(f'Unknown settings: {", ".join(sorted(unknown))}')
+        self.config = dict(DEFAULT_CONFIG, **config)
+        self.config['cameras'] = list(self.config['cameras'])
+        self.sp_client = sp_client
+
+        # Stages read the classifier, scheduler and streams without locking: reconfigure()
+        # replaces them as a whole, and new streams are swapped in by the capture stage
+        self.lock = threading.RLock()
+        self.stop_requested = threading.Event()
+        self.pipeline = None
+        self.streams = []  # (capture, RoiDetector, mediapipe Hands) of each stream
+        self.next_streams = None  # streams of new cameras, waiting for the capture stage
+        self.retired = []  # streams replaced while frames captured from them may still be detected
+        self.frame_index = 0
+        self.t_start = None
+        self.t0 = None
+        self.startup = {}  # seconds from the start of the process (or of start()) to each startup step
+        self.starting = False
+        self.start_error = None
+        self.buffers = None
+        self.hand_detect = None
+        self.sequence_model = None
+        self.hand_pose = None
+        self.classifier = None
+        self.scheduler = None
+        self.recorder = None
+        self.exporter = None
+        self.sampler = None
+        self.controls = None
+        self.backend = None  # the backend created from the backend setting, closed by stop()
+        self.dispatcher = None
+        self.spotify_error = None
+        self.published = deque(maxlen=60)  # capture time of the last published frames
+        self.hands_in_view = 0
+
+        self.events = deque(maxlen=200)
+        self.event_id = 0
+        self.command_status = ''
+
+        self.preview_cond = threading.Condition()
+        self.preview = None  # rendered images of the last previewed frame, one per stream
+        self.preview_seq = 0
+        self.last_preview = 0.
+
+    def start(self, t0=None):
+        """
+        Start the pipeline as soon as possible: the cameras open, MediaPipe loads and the model
+        is read in parallel, and Spotify connects in the background while frames already
+        flow, commands being dropped until then.  The time of every step, from t0
+        (perf_counter, e.g. at the start of the process; default: now), is kept in startup.
+        """
+
+        self.starting, self.start_error = True, None
+        try:
+            return self._start(t0)
+        except Exception as e:
+            self.start_error = str(e)
+            raise
+        finally:
+            self.starting = False
+
+    def _start(self, t0):
+        config = self.config
+        self.t0 = time.perf_counter() if t0 is None else t0
+        self.startup['start_s'] = time.perf_counter() - self.t0
+
+        # Captured frames are recycled through the pool; the other per-frame images live in buffers
+        self.buffers = FrameBuffers()
+        self.pool = FramePool(self.buffers)
+        self.allocations = AllocationMeter(self.buffers, trace=config['trace_alloc'])
+        self.recorder = LandmarkRecorder(config['record_landmarks']) if config['record_landmarks'] else None
+
+        sources = [None] if config['screen'] else config['cameras']
+        try:
+            with ThreadPoolExecutor(max_workers=3, thread_name_prefix='startup') as executor:
+                captures = executor.submit(self.startup_step, 'cameras_s', self.open_captures, sources)
+                detectors = executor.submit(self.startup_step, 'detector_s', self.load_detector, len(sources))
+                loaded = executor.submit(self.startup_step, 'model_s', self.load_model)
+                streams = [(cap, roi, hands) for cap, (roi, hands) in zip(captures.result(), detectors.result())]
+                loaded.result()
+        except Exception:
+            # Every step has finished: release what the others opened
+            if captures.exception() is None:
+                for cap in captures.result():
+                    if cap is not None:
+                        cap.release()
+            if detectors.exception() is None:
+                for _, hands in detectors.result():
+                    hands.close()
+            raise
+        self.streams = streams
+        model = self.sequence_model if self.sequence_model is not None else self.hand_pose.classifier
+        check_schema(model, self.hand_detect.landmark_schema)
+        self.classes = model.classes_
+        self.classifier = self.make_classifier()
+
+        # Capture is capped at target_fps; detection slows down without hands and pauses during lock-outs
+        self.pacer = FramePacer(config['target_fps'])
+        self.scheduler = None if config['detect_every_frame'] else DetectionScheduler(
+            self.classifier, idle_fps=config['idle_fps'], idle_after=config['idle_after'],
+            motion_threshold=config['motion_threshold'], buffers=self.buffers)
+
+        self.pipeline = Pipeline(queue_size=1, on_drop=self.release, profile=bool(config['profile']))
+        self.pipeline.add_stage('capture', self.capture)\
+                     .add_stage('detect', self.detect)\
+                     .add_stage('classify', self.classify)\
+                     .add_stage('publish', self.publish)
+        self.latency_stats = self.pipeline.stats('end_to_end')
+        for stage in self.pipeline.stages:
+            METRICS.register(f'stage.{stage.name}', stage.stats)
+        METRICS.register('end_to_end', self.latency_stats)
+
+        if config['metrics_export']:
+            self.exporter = MetricsExporter(config['metrics_export'], interval=config['metrics_interval'],
+                                            extra=lambda: {'status': self.status(), **self.counters()}).start()
+        self.sampler = SamplingProfiler().start() if config['sample_profile'] else None
+
+        self.t_start = time.perf_counter()
+        self.pipeline.start()
+        threading.Thread(target=self.connect_spotify, name='spotify_login', daemon=True).start()
+        return self
+
+    def startup_step(self, name, func, *args):
+        result = func(*args)
+        self.startup[name] = time.perf_counter() - self.t0
+        return result
+
+    def load_detector(self, n_streams):
+        """
+        Import MediaPipe and create the detectors of n_streams streams
+        """
+
+        from hand_detect import HandDetect
+
+        self.hand_detect = HandDetect(detect_threshold=self.config['detect_threshold'])
+        return [self.make_detector() for _ in range(n_streams)]
+
+    def load_model(self):
+        config = self.config
+        if config['path_sequence_model']:
+            self.sequence_model = load_classifier(config['path_sequence_model'])
+            self.hand_pose = None
+        else:
+            self.sequence_model = None
+            self.hand_pose = HandPoses(pose_threshold=config['pose_threshold'],
+                                       name_classifier=config['path_classifier'])
+
+    def connect_spotify(self):
+        """
+        Log into Spotify (the first API call authenticates) and start dispatching commands
+        """
+
+        try:
+            from spotify_controls import SpotifyControls
+
+            sp_client = self.sp_client
+            if sp_client is None:
+                # Spotify logs in using your personal account with a separate popup window
+                sp_client = self.backend = make_backend(self.config['backend'])
+            controls = SpotifyControls(playback_ttl=self.config['playback_ttl'], sp_client=sp_client,
+                                       poll_playback=False)
+        except Exception as e:
+            self.spotify_error = str(e)
+            self.add_event('spotify_failed', error=str(e))
+            print(f"\rCould not connect to {self.config['backend']}, no command will be sent...")
+            print(e)
+            return
+        try:
+            controls.playback.refresh()
+        except Exception as e:  # the poller keeps trying
+            print('\rCould not read the Spotify playback state...')
+            print(e)
+        controls.start_polling()
+
+        dispatcher = CommandDispatcher(controls.commands.resolve(self.classes), on_result=self.command_done,
+                                       on_error=self.command_failed)
+        self.pipeline.extra_stats['dispatch'] = dispatcher.stats
+        self.controls, self.dispatcher = controls, dispatcher
+        self.startup['spotify_s'] = time.perf_counter() - self.t0
+        self.add_event('spotify_connected')
+
+    def stop(self):
+        if self.pipeline is not None:
+            self.pipeline.stop()
+            if self.config['profile']:
+                self.pipeline.profile_stats().dump_stats(self.config['profile'])
+                print(f"cProfile statistics of the pipeline saved in {self.config['profile']}")
+        if self.sampler is not None:
+            self.sampler.stop()
+            self.sampler.save(self.config['sample_profile'])
+            print(f"{self.sampler.samples} stack samples saved in {self.config['sample_profile']}")
+        if self.exporter is not None:
+            self.exporter.stop()
+        if self.dispatcher is not None:
+            self.dispatcher.stop()
+            self.controls.stop()
+        if self.backend is not None:
+            self.backend.close()
+        if self.recorder is not None:
+            self.recorder.close()
+        with self.lock:
+            for streams in (self.streams, self.next_streams or []):
+                self.close_streams(streams)
+            for _, _, hands in self.retired:
+                hands.close()
+            self.streams, self.next_streams, self.retired = [], None, []
+
+    def request_stop(self):
+        """
+        Ask the owner of the service (e.g. gesture_controller.py) to stop it
+        """
+
+        self.stop_requested.set()
+
+    @property
+    def running(self):
+        return self.pipeline is not None and self.pipeline.running and not self.stop_requested.is_set()
+
+    def make_classifier(self):
+        """
+        Classifier with one Delay (or GestureWindow) per hand per camera, all hands of a tick
+        classified in one batch
+        """
+
+        config = self.config
+        if self.sequence_model is not None:
+            model = self.sequence_model
+            return SequenceStreamClassifier(model, lambda: GestureWindow(
+                model.classes_, model.window, threshold=config['sequence_threshold'],
+                confirm_frames=config['confirm_frames'], confirm_frames_in_action=config['confirm_frames_in_action']),
+                detect_threshold=config['detect_threshold'])
+        return MultiStreamClassifier(self.hand_pose, lambda: Delay(
+            self.hand_pose.classifier.classes_, moving_average=config['moving_average'],
+            frames_in_action=config['frames_in'], frames_out=config['frames_out']),
+            detect_threshold=config['detect_threshold'])
+
+    def open_captures(self, sources):
+        """
+        Video captures of cameras (None for the screen, captured with mss)
+        """
+
+        if None in sources:
+            from mss import mss
+            self.sct = mss()
+        return [cv2.VideoCapture(source) if source is not None else None for source in sources]
+
+    def make_detector(self):
+        """
+        RoiDetector and MediaPipe Hands of one stream.  MediaPipe tracks hands across frames, so
+        each stream needs its own Hands instance.
+        """
+
+        config = self.config
+        roi = RoiDetector(self.hand_detect, buffers=self.buffers, inference_width=config['inference_width'],
+                          track_roi=config['track_roi'])
+        hands = self.hand_detect.mp_hands.Hands(max_num_hands=config['max_num_hands'],
+                                                min_detection_confidence=0.6,
+                                                min_tracking_confidence=0.5)
+        return roi, hands
+
+    def open_streams(self, cameras):
+        """
+        Capture, RoiDetector and MediaPipe Hands of each camera
+        """
+
+        return [(cap, *self.make_detector()) for cap in self.open_captures(cameras)]
+
+    @staticmethod
+    def close_streams(streams):
+        for cap, roi, hands in streams:
+            if cap is not None:
+                cap.release()
+            hands.close()
+
+    def capture(self):
+        """
+        Capture stage: grab the next frame from the webcams or the screen
+        """
+
+        self.pacer.wait()
+        if 'first_capture_s' not in self.startup:
+            self.startup['first_capture_s'] = time.perf_counter() - self.t0
+        if self.next_streams is not None:
+            with self.lock:
+                self.retired += self.streams
+                self.streams, self.next_streams = self.next_streams, None
+            for cap, _, _ in self.retired:
+                if cap is not None:
+                    cap.release()
+        streams = self.streams
+
+        if self.config['screen']:
+            # Higher fps with mss for screen grab, read in place and converted from BGRA in one pass:
+            shot = self.sct.grab(self.sct.monitors[0])
+            raw = np.frombuffer(shot.raw, dtype=np.uint8).reshape(shot.height, shot.width, 4)
+            images = [cv2.cvtColor(raw, cv2.COLOR_BGRA2BGR, dst=self.pool.acquire((shot.height, shot.width, 3)))]
+        else:
+            images = []
+            for cap, _, _ in streams:
+                frame = self.pool.acquire((int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+                                           int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), 3))
+                ret, image = cap.read(frame)
+                if image is not frame:  # OpenCV could not reuse the buffer
+                    self.pool.release(frame)
+                if not ret:  # Image was not successfully read!
+                    print('\rNo image!  Is a webcam available?', '', end='')
+                    for image in images:
+                        self.pool.release(image)
+                    time.sleep(.1)
+                    return None
+                images.append(image)
+
+        self.frame_index += 1
+        return FramePacket(self.frame_index, images, streams)
+
+    def detect(self, packet):
+        """
+        Landmark detection stage: run MediaPipe Hands on the frame of each stream, or reuse its
+        last results when the scheduler skips the frame
+        """
+
+        scheduler = self.scheduler
+        if scheduler is None:
+            packet.results = [roi.process(hands, image)
+                              for (_, roi, hands), image in zip(packet.streams, packet.images)]
+        else:
+            packet.results = [scheduler.process(stream, image, lambda: roi.process(hands, image), packet.t_capture)
+                              for stream, ((_, roi, hands), image) in enumerate(zip(packet.streams, packet.images))]
+
+        # Frames come in order: once one of the current streams is here, replaced ones are unused
+        if self.retired and packet.streams is self.streams:
+            with self.lock:
+                retired, self.retired = self.retired, []
+            for _, _, hands in retired:
+                hands.close()
+
+        if self.recorder is not None:
+            self.recorder.record(packet.index, packet.results, packet.t_capture)
+        return packet
+
+    def classify(self, packet):
+        """
+        Pose classification stage: classify the hands of all streams in one batch and smooth
+        each one with its own Delay
+        """
+
+        packet.detections = self.classifier.classify(packet.results, packet.t_capture)
+        dispatcher = self.dispatcher
+        if dispatcher is None:  # Spotify not connected yet
+            return packet
+        for stream, detections in enumerate(packet.detections):
+            for (pose, confidence), (lm, mp_lm), delay in detections:
+                if pose is not None and dispatcher.submit(pose, lm, delay):
+                    self.add_event('command', pose=str(pose), stream=stream, confidence=float(confidence))
+        return packet
+
+    def publish(self, packet):
+        """
+        Last stage: account for the frame and render the preview when one is due.  Returns
+        None, so the pipeline gives the frames back to the pool.
+        """
+
+        self.latency_stats.add((time.perf_counter() - packet.t_capture) * 1000.)
+        if 'first_frame_s' not in self.startup:
+            self.startup['first_frame_s'] = time.perf_counter() - self.t0
+            print(self.startup_report())
+        self.published.append(packet.t_capture)
+        self.hands_in_view = sum(len(detections) for detections in packet.detections)
+        self.allocations.frame()
+
+        preview_fps = self.config['preview_fps']
+        now = time.perf_counter()
+        if preview_fps and now - self.last_preview >= 1. / preview_fps:
+            self.last_preview = now
+            with METRICS.timer('render'):
+                images = [self.render(stream, image, detections)
+                          for stream, (image, detections) in enumerate(zip(packet.images, packet.detections))]
+            with self.preview_cond:
+                self.preview = images
+                self.preview_seq += 1
+                self.preview_cond.notify_all()
+        return None
+
+    def release(self, packet):
+        """
+        Give the frames of a packet back to the pool once no stage reads them anymore
+        """
+
+        for image in packet.images:
+            self.pool.release(image)
+
+    def render(self, stream, image, detections):
+        """
+        Draw landmarks and the current pose on a shrunk, mirrored copy of one stream's frame.
+        Previews alternate between two buffers per stream, so the one being shown is not drawn on.
+        """
+
+        image_height, image_width, _ = image.shape
+        size = (int(image_width * .6), int(image_height * .6))
+        image = cv2.resize(image, size, dst=self.buffers.get(('preview', stream, self.preview_seq % 2),
+                                                             (size[1], size[0], 3)),
+                           interpolation=cv2.INTER_AREA)
+        cv2.flip(image, 1, dst=image)
+
+        for (pose, confidence), (lm, mp_lm), delay in detections:
+            if self.config['show_lm']:
+                self.hand_detect.mp_drawing.draw_landmarks(
+                    image, mp_lm, self.hand_detect.mp_hands.HAND_CONNECTIONS)
+
+            if pose is not None:
+                cv2.putText(image, f"{pose}: ({confidence:.2f})",
+                            (30, 30), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 100), 2)
+            else:
+                cv2.putText(image, f"Idle", (30, 30),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 100), 2)
+                if delay.ignore_frames:
+                    cv2.putText(image, f"Position locked", (30, 60),
+                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 0, 100), 2)
+
+        if self.command_status:
+            cv2.putText(image, self.command_status, (30, 90),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.7, (255, 255, 0), 2)
+        return image
+
+    def wait_preview(self, seq=0, timeout=None):
+        """
+        Wait for a preview newer than seq; returns (seq, images), images being None on timeout
+        """
+
+        with self.preview_cond:
+            if not self.preview_cond.wait_for(lambda: self.preview_seq > seq, timeout):
+                return seq, None
+            return self.preview_seq, self.preview
+
+    def preview_jpeg(self, stream=0, quality=80):
+        """
+        Last preview of a stream as JPEG bytes, or None without preview
+        """
+
+        with self.preview_cond:
+            images = self.preview
+        if not images or stream >= len(images):
+            return None
+        ok, jpeg = cv2.imencode('.jpg', images[stream], [cv2.IMWRITE_JPEG_QUALITY, quality])
+        return jpeg.tobytes() if ok else None
+
+    def add_event(self, kind, **fields):
+        with self.lock:
+            self.event_id += 1
+            self.events.append(dict(id=self.event_id, time=time.time(), type=kind, **fields))
+
+    def command_done(self, pose, elapsed):
+        self.command_status = f"{pose}: done in {elapsed * 1000:.0f} ms"
+        self.add_event('done', pose=str(pose), elapsed_ms=elapsed * 1000.)
+
+    def command_failed(self, pose, error):
+        self.command_status = f"{pose}: failed"
+        self.add_event('failed', pose=str(pose), error=str(error))
+        print(f"\rTried to {pose}...")
+        print(error)
+
+    def recent_events(self, since=0):
+        """
+        Commands submitted, done and failed, oldest first, with an id greater than since
+        """
+
+        with self.lock:
+            return [event for event in self.events if event['id'] > since]
+
+    def status(self):
+        published = list(self.published)
+        fps = (len(published) - 1) / (published[-1] - published[0]) if len(published) > 1 and \
+            published[-1] > published[0] else 0.
+        state = 'starting' if self.starting else 'running' if self.running else \
+            f'failed: {self.start_error}' if self.start_error else 'stopped'
+        return {'state': state,
+                'running': self.running,
+                'uptime_s': time.perf_counter() - self.t_start if self.t_start is not None else 0.,
+                'frames': self.frame_index,
+                'fps': fps,
+                'cameras': None if self.config['screen'] else self.config['cameras'],
+                'classifier': 'sequence' if self.config['path_sequence_model'] else 'pose',
+                'spotify': 'connected' if self.dispatcher is not None else
+                           f'failed: {self.spotify_error}' if self.spotify_error else 'connecting',
+                'startup': dict(self.startup),
+                'hands_in_view': self.hands_in_view,
+                'command_status': self.command_status,
+                'last_event': self.event_id,
+                'errors': [f'{stage.name}: {stage.error!r}' for stage in self.pipeline.stages
+                           if stage.error is not None] if self.pipeline is not None else []}
+
+    def counters(self):
+        counters = {'frame_buffer_bytes': self.buffers.allocated_bytes if self.buffers is not None else 0}
+        if self.dispatcher is not None:
+            counters['commands'] = {'submitted': self.dispatcher.submitted,
+                                    'coalesced': self.dispatcher.coalesced,
+                                    'pending': len(self.dispatcher.pending)}
+            if self.controls.requests is not None:
+                counters['spotify_requests'] = dict(self.controls.requests.counters)
+        if self.scheduler is not None:
+            counters['detection'] = self.scheduler.summary()
+        return counters
+
+    def metrics(self):
+        """
+        Timings of every instrumented step (see Metrics), stage drops, and counters
+        """
+
+        return {'timings': METRICS.snapshot(),
+                'stages': self.pipeline.timings() if self.pipeline is not None else {},
+                **self.counters()}
+
+    def startup_report(self):
+        return 'startup: ' + ', '.join(f'{name[:-2]} {seconds:.2f} s' for name, seconds
+                                       in sorted(self.startup.items(), key=lambda item: item[1]))
+
+    def report(self):
+        lines = [self.pipeline.report(), METRICS.report(), self.allocations.report(), self.startup_report()]
+        if self.scheduler is not None:
+            lines.append(self.scheduler.report())
+        return '\n'.join(lines)
+
+    def reconfigure(self, **changes):
+        """
+        Change RUNTIME_SETTINGS while running; returns the new configuration.  Raises
+        ValueError, and changes nothing, for other settings or values that do not parse.
+        """
+
+        unknown = set(changes) - set(RUNTIME_SETTINGS)
+        if unknown:
+            raise ValueError(f'Cannot change {", ".join(sorted(unknown))} while running')
+        if self.pipeline is None:
+            raise ValueError('Cannot change settings before the service started')
+        try:
+            changes = {key: RUNTIME_SETTINGS[key](value) for key, value in changes.items()}
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Invalid setting: {e}')
+        if 'cameras' in changes and self.config['screen']:
+            raise ValueError('Cannot change cameras while capturing the screen')
+
+        # Cameras open before anything changes, so frames keep flowing meanwhile
+        streams = None
+        if 'cameras' in changes and changes['cameras'] != self.config['cameras']:
+            streams = self.open_streams(changes['cameras'])
+            if not all(cap.isOpened() for cap, _, _ in streams):
+                self.close_streams(streams)
+                raise ValueError(f'Cannot open cameras {changes["cameras"]}')
+
+        with self.lock:
+            self.config.update(changes)
+            config = self.config
+            if 'detect_threshold' in changes:
+                self.hand_detect.detect_threshold = config['detect_threshold']
+                self.classifier.detect_threshold = config['detect_threshold']
+            if 'pose_threshold' in changes and self.hand_pose is not None:
+                self.hand_pose.pose_threshold = config['pose_threshold']
+            if streams is not None or set(changes) & {'moving_average', 'frames_in', 'frames_out',
+                                                      'sequence_threshold', 'confirm_frames',
+                                                      'confirm_frames_in_action'}:
+                self.classifier = self.make_classifier()
+            if 'target_fps' in changes:
+                self.pacer = FramePacer(config['target_fps'])
+            if self.scheduler is not None:
+                if streams is not None:
+                    self.scheduler = DetectionScheduler(
+                        self.classifier, idle_fps=config['idle_fps'], idle_after=config['idle_after'],
+                        motion_threshold=config['motion_threshold'], buffers=self.buffers)
+                self.scheduler.classifier = self.classifier
+                self.scheduler.idle_interval = 1. / config['idle_fps'] if config['idle_fps'] else float('inf')
+                self.scheduler.idle_after = config['idle_after']
+                self.scheduler.motion_threshold = config['motion_threshold']
+            if streams is not None:
+                if self.next_streams is not None:  # never captured from
+                    self.close_streams(self.next_streams)
+                self.next_streams = streams
+        self.add_event('reconfigured', changes=changes)
+        return dict(config)
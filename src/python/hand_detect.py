@@ -1,6 +1,9 @@
 import mediapipe as mp
+import numpy as np
 import cv2
 
+from utils import extract_landmarks, landmark_schema, N_LANDMARKS
+
 
 class HandDetect():
     """
@@ -19,18 +22,26 @@ class HandDetect():
 
         self.mp_drawing = mp.solutions.drawing_utils
         self.mp_hands = mp.solutions.hands
+        # Layout of the landmarks extract_landmarks copies, checked against the model's
+        self.landmark_schema = landmark_schema([landmark.name for landmark in self.mp_hands.HandLandmark])
 
-        self.landmarks = [x.name for x in mp.solutions.hands.HandLandmark]
+        # Reused for every hand; the yielded landmarks are only valid until the next one
+        self.buffer = np.empty((N_LANDMARKS, 3), dtype=np.float32)
 
-    def image_preprocessing(self, image):
+    def image_preprocessing(self, image, out=None):
         """
-        Compute the preprocessing to pass it to Mediapipe
+        Compute the preprocessing to pass it to Mediapipe: mirror the BGR frame and
+        convert it to RGB, into out if given so no new frame is allocated
             """
 
-        image = cv2.cvtColor(cv2.flip(image, 1), cv2.COLOR_BGR2RGB)
-        image.flags.writeable = False
+        if out is None:
+            out = np.empty(image.shape, dtype=np.uint8)
+        out.flags.writeable = True
+        cv2.cvtColor(image, cv2.COLOR_BGR2RGB, dst=out)
+        cv2.flip(out, 1, dst=out)
+        out.flags.writeable = False
 
-        return image
+        return out
 
     def detect_hand(self, hands, image, hand_pose, delay):
         """
@@ -40,6 +51,13 @@ class HandDetect():
         image = self.image_preprocessing(image)
         results = hands.process(image)
 
+        return self.classify_results(results, hand_pose, delay)
+
+    def classify_results(self, results, hand_pose, delay):
+        """
+        Classify the hands found by MediaPipe using our trained SVC
+        """
+
         if results.multi_hand_landmarks:
             for hand_landmarks, handedness in zip(results.multi_hand_landmarks,
                                                   results.multi_handedness):
@@ -47,17 +65,7 @@ class HandDetect():
                     delay.update('Unknown')
                     continue
 
-                hand_detected = []
-                for lm in self.landmarks:
-
-                    landmark_idx = self.mp_hands.HandLandmark[lm]
-
-                    hand_detected.append(
-                        hand_landmarks.landmark[landmark_idx].x)
-                    hand_detected.append(
-                        hand_landmarks.landmark[landmark_idx].y)
-                    hand_detected.append(
-                        hand_landmarks.landmark[landmark_idx].z)
+                hand_detected = extract_landmarks(hand_landmarks, self.buffer)
 
                 pose_now, confidences = hand_pose.predict_pose(hand_detected)
                 class_in_action, confidence_in_action = delay.update(
@@ -1,6 +1,7 @@
-import numpy as np
 from sklearn.base import BaseEstimator, TransformerMixin
 
+from utils import shift_and_scale
+
 
 class HandPoseTransform(BaseEstimator, TransformerMixin):
     """
@@ -13,6 +14,7 @@ class HandPoseTransform(BaseEstimator, TransformerMixin):
             Assumes input data is tabular with each landmark's x, y, & z coords flattened into
             three separate columns.  Also assumes wrist position's z coord is already nearly 0.
 
+            The math lives in utils.shift_and_scale, so inference code can use it without sklearn.
     """
     def __init__(self):
         pass
@@ -20,20 +22,9 @@ class HandPoseTransform(BaseEstimator, TransformerMixin):
     def fit(self, X, y=0):
         return self
 
-    def transform(self, X, y=None):
-        X_ = X.copy()
-
-        def _shift_and_scale(row):
-            # Subtract off wrist position
-            row[0::3] = row[0::3] - row[0]
-            row[1::3] = row[1::3] - row[1]
-            # z origin is already anchored to the wrist, so no need to shift
-
-            # Scale so that the max extension of any hand landmark from the wrist is 1.
-            norm = np.max(
-                np.sqrt(np.square(row[0::3]) + np.square(row[1::3]) + np.square(row[2::3]))
-            )
-            row = row / norm
-            return row
-
-        return np.apply_along_axis(_shift_and_scale, 1, X_)
+    def transform(self, X, y=None, out=None):
+        """
+            Shift and scale every row of X.  The result is written to out if given (pass X itself
+            to transform in place), otherwise to a new array.
+        """
+        return shift_and_scale(X, out=out)
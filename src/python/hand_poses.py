@@ -1,40 +1,53 @@
-import pickle
 import numpy as np
 
+from model_artifact import load_classifier
+
 
 class HandPoses:
     """
             Hand Poses Class.
 
             This class predict hand pose from hand landmarks input.
-            The prediction uses C-Support Vector Classification from Scikit-Learn
+            The prediction uses C-Support Vector Classification from Scikit-Learn, either its NumPy-only
+            CompiledClassifier export saved as a model artifact (.npz, see export_classifier.py) or
+            a pickled sklearn model.
 
             Keyword Arguments:
                     pose_threshold {float}: SVC threshold in classification confidence.
                             (default: {0.98})
-                    name_classifier {str}: path with classifier name to load model
+                    name_classifier {str}: path with classifier name to load model (.npz or .pkl)
                             (default: {handsPoseClassifier.pkl})
     """
 
     def __init__(self, pose_threshold=0.98, name_classifier='handsPoseClassifier_6classes.pkl'):
         self.pose_threshold = pose_threshold
         self.name_classifier = name_classifier
-        self.classifier = pickle.load(open(name_classifier, 'rb'))
+        self.classifier = load_classifier(name_classifier)
 
     def predict_pose(self, hand_detected):
         """
-                This method predict hand pose from hand landmarks using C-Support Vector Classification
+                This method predict hand pose from hand landmarks ((21, 3) array) using C-Support Vector
+                Classification
         """
-        result = self.classifier.predict_proba(np.array([hand_detected]))
+        result = self.classifier.predict_proba(np.asarray(hand_detected).reshape(1, -1))
         return self.get_name_pose_predict(result)
 
-    def get_name_pose_predict(self, result):
+    def predict_poses(self, hands_detected):
+        """
+                This method predict the poses of several hands ((n_hands, 21, 3) landmarks) with a single
+                classifier call, returning one (pose, confidences) tuple per hand
+        """
+        hands_detected = np.asarray(hands_detected)
+        result = self.classifier.predict_proba(hands_detected.reshape(len(hands_detected), -1))
+        return [self.get_name_pose_predict(result, row) for row in range(len(result))]
+
+    def get_name_pose_predict(self, result, row=0):
         """
                 This method get name of predicted hand pose class, i.e. the class with the greater confidence
         """
-        idx = np.argmax(result[0])
+        idx = np.argmax(result[row])
         pose = self.classifier.classes_[idx]
 
-        if result[0, idx] < self.pose_threshold:
+        if result[row, idx] < self.pose_threshold:
             pose = 'Unknown'
-        return pose, result[0]
+        return pose, result[row]
@@ -0,0 +1,226 @@
+import os
+import json
+import numpy as np
+
+from utils import LANDMARK_COLUMNS
+
+FORMAT_NAME = 'landmark-dataset'
+FORMAT_VERSION = 1
+HEADER = 'header.json'
+COLUMN_FILES = {'landmarks': 'landmarks.f32', 'class': 'class.u8', 'hand': 'hand.u8'}
+MAX_CATEGORIES = 256
+
+
+class LandmarkDataset:
+    """
+    Landmark Dataset Class.
+
+    Append-only binary training data, stored as a directory (by convention named *.lmd) of
+    column files next to a small JSON header:
+        - landmarks.f32: (n_rows, 63) float32 landmarks, row-major, in LANDMARK_COLUMNS order
+        - class.u8 / hand.u8: one uint8 code per row, indexing the class / hand names of the header
+        - header.json: format version, columns, class and hand names, and n_rows
+    Columns are memory-mapped, so reading needs no parsing.  append() writes the new rows at
+    the end of each column file and then replaces the header atomically: n_rows only
+    counts rows whose bytes were written, so a crash mid-append leaves the previous rows intact.
+
+    Arguments:
+        path {str}: dataset directory
+    Keyword Arguments:
+        mode {str, optional}: 'r' to read, 'a' to append (the dataset is created if missing).
+                (Default: {'r'})
+    """
+
+    def __init__(self, path, mode='r'):
+        if mode not in ('r', 'a'):
+            raise ValueError(f"mode must be 'r' or 'a', not {mode!r}")
+        self.path = path
+        self.mode = mode
+        if not os.path.exists(os.path.join(path, HEADER)):
+            if mode == 'r':
+                raise FileNotFoundError(f'{path} is not a landmark dataset')
+            os.makedirs(path, exist_ok=True)
+            for file_name in COLUMN_FILES.values():
+                open(os.path.join(path, file_name), 'wb').close()
+            self.header = {'format': FORMAT_NAME, 'version': FORMAT_VERSION, 'columns': LANDMARK_COLUMNS,
+                           'dtype': 'float32', 'n_rows': 0, 'classes': [], 'hands': []}
+            self._write_header()
+
+        with open(os.path.join(path, HEADER)) as f:
+            self.header = json.load(f)
+        if self.header.get('format') != FORMAT_NAME or self.header.get('version') != FORMAT_VERSION:
+            raise ValueError(f'{path}: unsupported dataset format {self.header.get("format")} '
+                             f'version {self.header.get("version")}')
+        if self.header['columns'] != LANDMARK_COLUMNS:
+            raise ValueError(f'{path}: landmark columns do not match utils.LANDMARK_COLUMNS')
+        self._maps = None
+
+    def __len__(self):
+        return self.header['n_rows']
+
+    @property
+    def classes(self):
+        return self.header['classes']
+
+    @property
+    def hands(self):
+        return self.header['hands']
+
+    def _file(self, column):
+        return os.path.join(self.path, COLUMN_FILES[column])
+
+    def _write_header(self):
+        tmp = os.path.join(self.path, HEADER + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(self.header, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.path, HEADER))
+
+    def _columns(self):
+        if self._maps is None:
+            n = len(self)
+            if n == 0:
+                self._maps = {'landmarks': np.empty((0, len(LANDMARK_COLUMNS)), dtype=np.float32),
+                              'class': np.empty(0, dtype=np.uint8), 'hand': np.empty(0, dtype=np.uint8)}
+            else:
+                self._maps = {'landmarks': np.memmap(self._file('landmarks'), dtype=np.float32, mode='r',
+                                                     shape=(n, len(LANDMARK_COLUMNS))),
+                              'class': np.memmap(self._file('class'), dtype=np.uint8, mode='r', shape=(n,)),
+                              'hand': np.memmap(self._file('hand'), dtype=np.uint8, mode='r', shape=(n,))}
+        return self._maps
+
+    @property
+    def landmarks(self):
+        """
+        (n_rows, 63) float32 memory-mapped landmarks, in the layout the classifier takes
+        """
+        return self._columns()['landmarks']
+
+    @property
+    def class_codes(self):
+        return self._columns()['class']
+
+    @property
+    def hand_codes(self):
+        return self._columns()['hand']
+
+    def labels(self):
+        """
+        Class name of every row
+        """
+        return np.asarray(self.classes, dtype=object)[self.class_codes] if len(self) else np.empty(0, dtype=object)
+
+    def handedness(self):
+        """
+        Hand name ('Left'/'Right') of every row
+        """
+        return np.asarray(self.hands, dtype=object)[self.hand_codes] if len(self) else np.empty(0, dtype=object)
+
+    def _codes(self, names, key):
+        categories = self.header[key]
+        codes = np.empty(len(names), dtype=np.uint8)
+        for i, name in enumerate(names):
+            if name not in categories:
+                if len(categories) >= MAX_CATEGORIES:
+                    raise ValueError(f'{self.path}: more than {MAX_CATEGORIES} {key}')
+                categories.append(name)
+            codes[i] = categories.index(name)
+        return codes
+
+    def append(self, landmarks, classes, hands):
+        """
+        Append rows: landmarks as (n, 63) or (n, 21, 3) floats, and the class and hand name of
+        each row.  Only the new rows are written.
+        """
+
+        if self.mode != 'a':
+            raise ValueError(f'{self.path} was opened read-only')
+        landmarks = np.ascontiguousarray(landmarks, dtype=np.float32).reshape(-1, len(LANDMARK_COLUMNS))
+        if not len(landmarks) == len(classes) == len(hands):
+            raise ValueError('landmarks, classes and hands must have the same number of rows')
+        if not len(landmarks):
+            return
+
+        class_codes = self._codes(classes, 'classes')
+        hand_codes = self._codes(hands, 'hands')
+        n = len(self)
+        for column, values in (('landmarks', landmarks), ('class', class_codes), ('hand', hand_codes)):
+            with open(self._file(column), 'r+b') as f:
+                # Drop the bytes a crashed append may have left past the last committed row
+                f.truncate(n * values[:1].nbytes)
+                f.seek(0, os.SEEK_END)
+                f.write(values.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+
+        self.header['n_rows'] = n + len(landmarks)
+        self._write_header()
+        self._maps = None
+
+    def truncate(self, n_rows):
+        """
+        Keep only the first n_rows rows, e.g. to undo the last appended ones
+        """
+
+        if self.mode != 'a':
+            raise ValueError(f'{self.path} was opened read-only')
+        n_rows = max(0, min(n_rows, len(self)))
+        self.header['n_rows'] = n_rows
+        self._write_header()
+        self._maps = None
+        for column, row_bytes in (('landmarks', 4 * len(LANDMARK_COLUMNS)), ('class', 1), ('hand', 1)):
+            with open(self._file(column), 'r+b') as f:
+                f.truncate(n_rows * row_bytes)
+
+    def to_frame(self):
+        """
+        pandas DataFrame with the columns of the CSV training data
+        """
+        import pandas as pd
+
+        df = pd.DataFrame(np.asarray(self.landmarks), columns=LANDMARK_COLUMNS)
+        df['hand'] = self.handedness()
+        df['class'] = self.labels()
+        return df
+
+
+def is_landmark_dataset(path):
+    return os.path.isdir(path) and os.path.exists(os.path.join(path, HEADER))
+
+
+def load_dataset(path):
+    """
+    Landmarks ((n, 63) float array), class names and hand names of a CSV file or a LandmarkDataset
+    """
+
+    if is_landmark_dataset(path):
+        dataset = LandmarkDataset(path)
+        return dataset.landmarks, dataset.labels(), dataset.handedness()
+
+    import pandas as pd
+    df = pd.read_csv(path)
+    hands = df['hand'].values if 'hand' in df else np.full(len(df), '', dtype=object)
+    return df[LANDMARK_COLUMNS].values, df['class'].values, hands
+
+
+def dataset_mtime(path):
+    """
+    Size and modification time identifying the current content of a CSV file or LandmarkDataset
+    """
+
+    stat = os.stat(os.path.join(path, HEADER) if is_landmark_dataset(path) else path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def csv_to_dataset(csv_path, dataset_path, chunksize=100000):
+    """
+    Convert a CSV training data file into a LandmarkDataset, appending chunk by chunk
+    """
+    import pandas as pd
+
+    dataset = LandmarkDataset(dataset_path, mode='a')
+    for chunk in pd.read_csv(csv_path, chunksize=chunksize):
+        hands = chunk['hand'].tolist() if 'hand' in chunk else [''] * len(chunk)
+        dataset.append(chunk[LANDMARK_COLUMNS].values, chunk['class'].tolist(), hands)
+    return dataset
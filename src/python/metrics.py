@@ -0,0 +1,264 @@
+import os
+import sys
+import json
+import time
+import threading
+from collections import Counter
+
+from pipeline import StageStats, BUCKETS_MS
+
+
+class Timer:
+    """
+    Context manager adding the time spent in its block to a StageStats
+    """
+    __slots__ = ('stats', 't0')
+
+    def __init__(self, stats):
+        self.stats = stats
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.stats.add((time.perf_counter() - self.t0) * 1000.)
+
+
+class NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+NULL_TIMER = NullTimer()
+
+
+class Metrics:
+    """
+    Metrics Class.
+
+    Registry of named timings (StageStats), filled by timers around the steps of the frame loop:
+    MediaPipe preprocessing and hands.process, landmark extraction, predict_proba, Delay updates,
+    every Spotify API call, rendering.  Pipeline stages and the dispatcher register their own
+    StageStats, so one snapshot() or prometheus() covers everything.  A timer costs about a
+    microsecond; disable() turns them into no-ops.
+
+    Keyword Arguments:
+        window {int, optional}: recent timings kept per metric for percentiles.
+                (Default: {300})
+    """
+
+    def __init__(self, window=300):
+        self.window = window
+        self.enabled = True
+        self.stats = {}
+        self.lock = threading.Lock()
+
+    def get(self, name):
+        """
+        StageStats of a metric, created on first use
+        """
+
+        stats = self.stats.get(name)
+        if stats is None:
+            with self.lock:
+                stats = self.stats.setdefault(name, StageStats(window=self.window))
+        return stats
+
+    def register(self, name, stats):
+        """
+        Report a StageStats kept elsewhere, e.g. by a pipeline stage, under name
+        """
+
+        with self.lock:
+            self.stats[name] = stats
+
+    def timer(self, name):
+        return Timer(self.get(name)) if self.enabled else NULL_TIMER
+
+    def observe(self, name, elapsed_ms):
+        if self.enabled:
+            self.get(name).add(elapsed_ms)
+
+    def disable(self):
+        self.enabled = False
+
+    def snapshot(self):
+        """
+        Summary (count, percentiles...) of every metric that has timings
+        """
+
+        with self.lock:
+            items = sorted(self.stats.items())
+        return {name: stats.summary() for name, stats in items if stats.count}
+
+    def prometheus(self, prefix='gesture'):
+        """
+        All metrics as one Prometheus histogram in the text exposition format, in seconds
+        """
+
+        with self.lock:
+            items = sorted(self.stats.items())
+        name = f'{prefix}_step_seconds'
+        lines = [f'# HELP {name} Time spent in each step of the gesture controller.',
+                 f'# TYPE {name} histogram']
+        for step, stats in items:
+            count, total_ms, buckets = stats.histogram()
+            cumulative = 0
+            for bound, n in zip(BUCKETS_MS, buckets):
+                cumulative += n
+                le = '+Inf' if bound == float('inf') else repr(bound / 1000.)
+                lines.append(f'{name}_bucket{{step="{step}",le="{le}"}} {cumulative}')
+            lines.append(f'{name}_sum{{step="{step}"}} {total_ms / 1000.!r}')
+            lines.append(f'{name}_count{{step="{step}"}} {count}')
+        return '\n'.join(lines) + '\n'
+
+    def report(self):
+        """
+        Human readable table, slowest step (by p95) first
+        """
+
+        snapshot = self.snapshot()
+        return '\n'.join(f"{name:>28}: p50 {t['p50_ms']:8.3f} ms  p95 {t['p95_ms']:8.3f} ms  "
+                         f"max {t['max_ms']:8.3f} ms  n={t['count']}"
+                         for name, t in sorted(snapshot.items(), key=lambda item: -item[1]['p95_ms']))
+
+
+# Process-wide registry the instrumented modules report to
+METRICS = Metrics()
+
+
+class TimedClient:
+    """
+    Wraps a Spotify client so each API method call is timed as spotify.<method>; other
+    attributes are passed through
+    """
+
+    def __init__(self, client, metrics=METRICS):
+        self.client = client
+        self.metrics = metrics
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def timed(*args, **kwargs):
+            with self.metrics.timer(f'spotify.{name}'):
+                return attr(*args, **kwargs)
+        return timed
+
+
+class MetricsExporter:
+    """
+    Metrics Exporter Class.
+
+    Writes the metrics every interval seconds from a background thread, and once more on stop():
+        - *.prom: Prometheus text format, atomically replaced, e.g. for node_exporter's
+          textfile collector
+        - anything else: one JSON line per export, {"time": ..., "metrics": {...}}, appended
+
+    Arguments:
+        path {str}: file to write
+    Keyword Arguments:
+        interval {float, optional}: seconds between exports.
+                (Default: {10.})
+        metrics {Metrics, optional}: registry to export.
+                (Default: {METRICS})
+        extra {callable, optional}: returns more fields for the JSON lines, e.g. detection
+                counters.
+                (Default: {None})
+    """
+
+    def __init__(self, path, interval=10., metrics=METRICS, extra=None):
+        self.path = path
+        self.interval = interval
+        self.metrics = metrics
+        self.extra = extra
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='metrics_export', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+        self.export()
+
+    def _run(self):
+        while not self.stop_event.wait(self.interval):
+            try:
+                self.export()
+            except OSError as e:
+                print(f'Could not export metrics to {self.path}...')
+                print(e)
+
+    def export(self):
+        if self.path.endswith('.prom'):
+            tmp = self.path + '.tmp'
+            with open(tmp, 'w') as f:
+                f.write(self.metrics.prometheus())
+            os.replace(tmp, self.path)
+        else:
+            line = {'time': time.time(), 'metrics': self.metrics.snapshot()}
+            if self.extra is not None:
+                line.update(self.extra())
+            with open(self.path, 'a') as f:
+                f.write(json.dumps(line) + '\n')
+
+
+class SamplingProfiler:
+    """
+    Sampling Profiler Class.
+
+    Statistical profiler of all threads, cheap enough to leave on: every interval seconds it
+    records the stack of each thread (sys._current_frames).  save() writes the collapsed
+    stacks ("thread;outer;...;inner count" lines), the input of flamegraph.pl or speedscope.
+
+    Keyword Arguments:
+        interval {float, optional}: seconds between samples.
+                (Default: {0.005})
+    """
+
+    def __init__(self, interval=.005):
+        self.interval = interval
+        self.stacks = Counter()
+        self.samples = 0
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='sampling_profiler', daemon=True)
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.stop_event.set()
+        self.thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                    frame = frame.f_back
+                stack.append(names.get(ident, str(ident)))
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
@@ -0,0 +1,98 @@
+import json
+import time
+import pickle
+import numpy as np
+
+from compiled_classifier import CompiledClassifier
+from sequence_classifier import SequenceClassifier
+from utils import landmark_schema
+
+FORMAT = 'gesture-model'
+VERSION = 1
+
+
+def save_model(path, model, source=None):
+    """
+    Save a CompiledClassifier or SequenceClassifier as a model artifact: an uncompressed .npz
+    of plain arrays, with a JSON header (format, version, model kind and parameters, landmark
+    schema, source file), so it loads without pickle or sklearn
+    """
+
+    if isinstance(model, CompiledClassifier):
+        kind = 'svc'
+        params = {'kernel': model.kernel, 'gamma': float(model.gamma), 'coef0': float(model.coef0),
+                  'degree': int(model.degree), 'hand_pose_transform': bool(model.hand_pose_transform)}
+        arrays = {'support_vectors': model.support_vectors, 'pair_coef': model.pair_coef,
+                  'intercept': model.intercept, 'prob_a': model.prob_a, 'prob_b': model.prob_b}
+    elif isinstance(model, SequenceClassifier):
+        kind = 'sequence'
+        params = {'window': int(model.window)}
+        # The standardization is already folded into the weights
+        arrays = {'coef': model.coef.T, 'intercept': model.intercept}
+    else:
+        raise TypeError(f'Cannot save a {type(model).__name__}, expected a CompiledClassifier or SequenceClassifier')
+
+    header = {'format': FORMAT, 'version': VERSION, 'kind': kind, 'params': params,
+              'schema': getattr(model, 'schema', None) or landmark_schema(),
+              'classes': [str(name) for name in model.classes_],
+              'source': source, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')}
+    with open(path, 'wb') as f:
+        np.savez(f, header=np.array(json.dumps(header)), **arrays)
+
+
+def load_model(path, schema=None):
+    """
+    Inference object of a model artifact, in milliseconds.  Raises ValueError for files that
+    are not artifacts, of a newer version, or trained on another landmark layout than schema
+    (default: the one of utils.LANDMARK_NAMES).
+    """
+
+    with np.load(path, allow_pickle=False) as data:
+        header = json.loads(str(data['header'][()])) if 'header' in data else {}
+        if header.get('format') != FORMAT:
+            raise ValueError(f'{path} is not a gesture model artifact')
+        if header['version'] > VERSION:
+            raise ValueError(f'{path} is a version {header["version"]} model artifact, '
+                             f'this version reads up to version {VERSION}')
+
+        params = header['params']
+        if header['kind'] == 'svc':
+            model = CompiledClassifier(header['classes'], params['kernel'], data['support_vectors'],
+                                       data['pair_coef'], data['intercept'], data['prob_a'], data['prob_b'],
+                                       gamma=params['gamma'], coef0=params['coef0'], degree=params['degree'],
+                                       hand_pose_transform=params['hand_pose_transform'])
+        elif header['kind'] == 'sequence':
+            coef = data['coef']
+            model = SequenceClassifier(header['classes'], params['window'], np.zeros(coef.shape[1]),
+                                       np.ones(coef.shape[1]), coef, data['intercept'])
+        else:
+            raise ValueError(f'{path} holds an unknown kind of model: {header["kind"]}')
+
+    model.schema = header['schema']
+    model.header = header
+    check_schema(model, schema or landmark_schema(), path)
+    return model
+
+
+def load_classifier(path, schema=None):
+    """
+    load_model() for artifacts; .pkl files (sklearn models, older exports) are still unpickled,
+    which runs code from the file: only load trusted ones
+    """
+
+    if path.endswith('.pkl'):
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+    return load_model(path, schema)
+
+
+def check_schema(model, schema, name='the model'):
+    """
+    Raise ValueError if model was trained on another landmark layout than schema.  Pickled
+    models carry no schema and are not checked.
+    """
+
+    model_schema = getattr(model, 'schema', None)
+    if model_schema is not None and model_schema != schema:
+        raise ValueError(f'{name} was trained on landmark schema {model_schema}, '
+                         f'but the hand detector produces schema {schema}')
@@ -0,0 +1,141 @@
+import threading
+
+from jeepney import DBusAddress, DBusErrorResponse, Properties, new_method_call
+from jeepney.bus_messages import message_bus
+from jeepney.io.blocking import open_dbus_connection
+from jeepney.wrappers import unwrap_msg
+
+from playback_backend import PlaybackBackend, PlaybackError
+
+PREFIX = 'org.mpris.MediaPlayer2.'
+PATH = '/org/mpris/MediaPlayer2'
+ROOT = 'org.mpris.MediaPlayer2'
+PLAYER = 'org.mpris.MediaPlayer2.Player'
+
+
+class MprisBackend(PlaybackBackend):
+    """
+    MPRIS Backend Class.
+
+    Local media players on the D-Bus session bus (VLC, mpv with mpv-mpris, Rhythmbox, the
+    Spotify desktop app, browsers...) through their MPRIS interface, with jeepney
+    (pip install jeepney, Linux only).  Every player is a device: transfer_playback makes
+    the player commands go to, pausing the previous one, like a Spotify Connect switch.
+    Calls are local D-Bus round trips, without network or request budget.  No player is a
+    404 PlaybackError, an error answer of the player a 502 and no answer a 504.
+
+    Keyword Arguments:
+        player {str, optional}: bus name of the player to control first, without the
+                org.mpris.MediaPlayer2. prefix, e.g. 'vlc'; the first player found if not given.
+                (Default: {None})
+        timeout {float, optional}: seconds to wait for the answer of a player.
+                (Default: {1.})
+    """
+
+    def __init__(self, player=None, timeout=1.):
+        self.connection = open_dbus_connection(bus='SESSION')
+        self.timeout = timeout
+        self.active = None if player is None else PREFIX + player
+        self.lock = threading.Lock()  # the connection is shared by the pollers and the dispatcher
+
+    def _call(self, message):
+        with self.lock:
+            try:
+                reply = self.connection.send_and_get_reply(message, timeout=self.timeout)
+            except TimeoutError:
+                raise PlaybackError(504, f'{message.header.fields} got no answer')
+        try:
+            return unwrap_msg(reply)
+        except DBusErrorResponse as e:
+            if e.name in ('org.freedesktop.DBus.Error.ServiceUnknown', 'org.freedesktop.DBus.Error.NameHasNoOwner'):
+                self.active = None
+                raise PlaybackError(404, 'The MPRIS player left the bus')
+            raise PlaybackError(502, f'{e.name}: {e.data}')
+
+    def players(self):
+        """
+        Bus names of the MPRIS players running
+        """
+
+        return sorted(name for name in self._call(message_bus.ListNames())[0] if name.startswith(PREFIX))
+
+    def _player(self):
+        if self.active is None:
+            players = self.players()
+            if not players:
+                raise PlaybackError(404, 'No MPRIS player on the session bus')
+            self.active = players[0]
+        return self.active
+
+    def _method(self, name, signature=None, body=()):
+        address = DBusAddress(PATH, bus_name=self._player(), interface=PLAYER)
+        return self._call(new_method_call(address, name, signature, body))
+
+    def _properties(self, player, interface=PLAYER):
+        properties = self._call(Properties(DBusAddress(PATH, bus_name=player, interface=interface)).get_all())[0]
+        return {name: value for name, (signature, value) in properties.items()}
+
+    def _device(self, player, properties):
+        return {'id': player, 'name': player[len(PREFIX):], 'type': 'Computer', 'is_active': player == self.active,
+                'volume_percent': int(round(properties.get('Volume', 1.) * 100))}
+
+    def current_playback(self):
+        try:
+            player = self._player()
+        except PlaybackError as e:
+            if e.http_status == 404:
+                return None
+            raise
+        properties = self._properties(player)
+        metadata = {name: value for name, (signature, value) in properties.get('Metadata', {}).items()}
+        track_id = metadata.get('mpris:trackid', '')
+        return {'device': self._device(player, properties),
+                'is_playing': properties.get('PlaybackStatus') == 'Playing',
+                'progress_ms': properties.get('Position', 0) // 1000,
+                'item': {'id': track_id, 'uri': metadata.get('xesam:url', track_id),
+                         'name': metadata.get('xesam:title', ''), 'duration_ms': metadata.get('mpris:length', 0) // 1000}}
+
+    def devices(self):
+        devices = []
+        for player in self.players():
+            device = self._device(player, self._properties(player))
+            device['name'] = self._properties(player, ROOT).get('Identity', device['name'])
+            devices.append(device)
+        return {'devices': devices}
+
+    def transfer_playback(self, device_id, force_play=True):
+        if device_id not in self.players():
+            raise PlaybackError(404, f'No MPRIS player {device_id}')
+        previous, self.active = self.active, device_id
+        if previous is not None and previous != device_id:
+            try:
+                self._call(new_method_call(DBusAddress(PATH, bus_name=previous, interface=PLAYER), 'Pause'))
+            except PlaybackError:
+                pass
+        if force_play:
+            self._method('Play')
+
+    def start_playback(self, *args, **kwargs):
+        self._method('Play')
+
+    def pause_playback(self, *args, **kwargs):
+        self._method('Pause')
+
+    def next_track(self, *args, **kwargs):
+        self._method('Next')
+
+    def previous_track(self, *args, **kwargs):
+        self._method('Previous')
+
+    def seek_track(self, position_ms, *args, **kwargs):
+        # SetPosition is ignored unless it names the current track
+        metadata = self._properties(self._player()).get('Metadata', {})
+        track_id = metadata.get('mpris:trackid', ('o', '/org/mpris/MediaPlayer2/TrackList/NoTrack'))[1]
+        self._method('SetPosition', 'ox', (track_id, int(position_ms) * 1000))
+
+    def volume(self, volume_percent, *args, **kwargs):
+        address = DBusAddress(PATH, bus_name=self._player(), interface=PLAYER)
+        self._call(Properties(address).set('Volume', 'd', volume_percent / 100.))
+
+    def close(self):
+        self.connection.close()
@@ -0,0 +1,175 @@
+import time
+import numpy as np
+
+from utils import extract_landmarks, N_LANDMARKS
+from metrics import METRICS
+
+
+class MultiStreamClassifier:
+    """
+    Multi Stream Classifier Class.
+
+    Classifies every hand seen in every stream (camera) during one tick with a single
+    batched classifier call, and smooths each hand with its own Delay.  A hand is
+    identified by its stream and its MediaPipe handedness label ('Left'/'Right'),
+    which stays stable while the hand index in the results does not.
+
+    Arguments:
+        hand_pose {HandPoses}: pose classifier
+        make_delay {callable}: returns a new Delay for a hand seen for the first time
+    Keyword Arguments:
+        detect_threshold {float, optional}: minimum MediaPipe handedness score of a hand,
+                as HandDetect's detect_threshold.
+                (Default: {0.9})
+    """
+
+    def __init__(self, hand_pose, make_delay, detect_threshold=0.90):
+        self.detect_threshold = detect_threshold
+        self.hand_pose = hand_pose
+        self.make_delay = make_delay
+        self.delays = {}
+        self.runs = {}  # (stream, hand) -> [pose, time of its first frame] of the current run of a pose
+        # Landmarks of all hands of a tick; the yielded landmarks are views valid until the next tick
+        self.buffer = np.empty((4, N_LANDMARKS, 3), dtype=np.float32)
+
+    def delay(self, stream, hand):
+        """
+        Delay state of one hand of one stream, created on first use
+        """
+
+        key = (stream, hand)
+        if key not in self.delays:
+            self.delays[key] = self.make_delay()
+        return self.delays[key]
+
+    def classify(self, results_per_stream, t=None):
+        """
+        Classify the MediaPipe results of all streams of one tick, captured at t (perf_counter).
+
+        Returns, for each stream, a list of ((pose, confidence), (lm, mp_lm), delay) like
+        HandDetect.classify_results, plus the Delay the pose came from, so commands can reset it.
+        When a pose is decided, delay.onset is the time of the first frame of the run of frames
+        predicted as that pose, the start of the gesture-to-command latency.
+        """
+
+        t = time.perf_counter() if t is None else t
+        owners = []
+        for stream, results in enumerate(results_per_stream):
+            seen = set()
+            if results.multi_hand_landmarks:
+                for hand_landmarks, handedness in zip(results.multi_hand_landmarks,
+                                                      results.multi_handedness):
+                    hand = handedness.classification[0].label
+                    seen.add(hand)
+                    if handedness.classification[0].score <= self.detect_threshold:
+                        self.delay(stream, hand).update('Unknown')
+                        continue
+                    if len(owners) == len(self.buffer):
+                        self.buffer = np.concatenate([self.buffer, np.empty_like(self.buffer)])
+                    with METRICS.timer('classify.extract'):
+                        extract_landmarks(hand_landmarks, self.buffer[len(owners)])
+                    owners.append((stream, hand, hand_landmarks))
+
+            # Hands that went out of view count as 'Unknown', as a missing hand does in HandDetect
+            for (delay_stream, hand), delay in self.delays.items():
+                if delay_stream == stream and hand not in seen:
+                    delay.update('Unknown')
+
+        detections = [[] for _ in results_per_stream]
+        if not owners:
+            return detections
+
+        rows = self.buffer[:len(owners)]
+        with METRICS.timer('classify.predict_proba'):
+            predictions = self.hand_pose.predict_poses(rows)
+        for (stream, hand, hand_landmarks), lm, (pose_now, confidences) in zip(owners, rows, predictions):
+            delay = self.delay(stream, hand)
+            # Frames ignored after a command do not start a gesture
+            run = self.runs.setdefault((stream, hand), [None, t])
+            if not delay.ignore_frames and pose_now != 'Unknown' and pose_now != run[0]:
+                run[0], run[1] = pose_now, t
+            with METRICS.timer('classify.delay_update'):
+                class_in_action, confidence_in_action = delay.update(pose_now, confidences)
+            if class_in_action is not None and class_in_action != 'Unknown':
+                delay.onset = run[1] if run[0] == class_in_action else t
+                run[0] = None  # the next decision is timed from its own first frame
+            detections[stream].append(((class_in_action, confidence_in_action), (lm, hand_landmarks), delay))
+        return detections
+
+
+class SequenceStreamClassifier:
+    """
+    Sequence Stream Classifier Class.
+
+    Same role and classify() output as MultiStreamClassifier, with a SequenceClassifier over the
+    last frames of each hand instead of HandPoses on one frame.  Every hand (stream and
+    handedness) keeps its frames in its own GestureWindow, which also replaces Delay; the
+    windows of all hands whose window is full are classified in one batched call.
+
+    Arguments:
+        sequence_model {SequenceClassifier}: window classifier
+        make_window {callable}: returns a new GestureWindow for a hand seen for the first time
+    Keyword Arguments:
+        detect_threshold {float, optional}: minimum MediaPipe handedness score of a hand.
+                (Default: {0.9})
+    """
+
+    def __init__(self, sequence_model, make_window, detect_threshold=0.90):
+        self.sequence_model = sequence_model
+        self.make_window = make_window
+        self.detect_threshold = detect_threshold
+        self.windows = {}
+        self.buffer = np.empty((4, sequence_model.window, N_LANDMARKS, 3), dtype=np.float32)
+
+    def delay(self, stream, hand):
+        """
+        GestureWindow of one hand of one stream, created on first use
+        """
+
+        key = (stream, hand)
+        if key not in self.windows:
+            self.windows[key] = self.make_window()
+        return self.windows[key]
+
+    def classify(self, results_per_stream, t=None):
+        """
+        Classify the MediaPipe results of all streams of one tick, captured at t (perf_counter);
+        returns, for each stream, a list of ((pose, confidence), (lm, mp_lm), window) like
+        MultiStreamClassifier.classify.  Hands whose window is not full yet get (None, None) as
+        pose.  When a pose is decided, window.onset is the time of the first window agreeing on it.
+        """
+
+        t = time.perf_counter() if t is None else t
+        detections = [[] for _ in results_per_stream]
+        owners = []
+        for stream, results in enumerate(results_per_stream):
+            seen = set()
+            if results.multi_hand_landmarks:
+                for hand_landmarks, handedness in zip(results.multi_hand_landmarks,
+                                                      results.multi_handedness):
+                    hand = handedness.classification[0].label
+                    seen.add(hand)
+                    window = self.delay(stream, hand)
+                    if handedness.classification[0].score <= self.detect_threshold:
+                        window.miss()
+                        continue
+                    with METRICS.timer('classify.extract'):
+                        lm = window.push(hand_landmarks)
+                    if not window.ready:
+                        detections[stream].append(((None, None), (lm, hand_landmarks), window))
+                        continue
+                    if len(owners) == len(self.buffer):
+                        self.buffer = np.concatenate([self.buffer, np.empty_like(self.buffer)])
+                    window.window_into(self.buffer[len(owners)])
+                    owners.append((stream, window, lm, hand_landmarks))
+
+            for (window_stream, hand), window in self.windows.items():
+                if window_stream == stream and hand not in seen:
+                    window.miss()
+
+        if owners:
+            with METRICS.timer('classify.predict_proba'):
+                probabilities = self.sequence_model.predict_proba(self.buffer[:len(owners)])
+            for (stream, window, lm, hand_landmarks), row in zip(owners, probabilities):
+                detections[stream].append((window.decide(row, t), (lm, hand_landmarks), window))
+        return detections
@@ -0,0 +1,294 @@
+import threading
+import time
+import bisect
+import cProfile
+from collections import deque
+
+# Upper bounds (ms) of the histogram buckets every StageStats counts timings into
+BUCKETS_MS = (.05, .1, .25, .5, 1., 2.5, 5., 10., 25., 50., 100., 250., 500., 1000., 2500., 5000., float('inf'))
+
+
+class LatestQueue:
+    """
+    Latest Queue Class.
+
+    Bounded hand-off between two pipeline stages.  When the queue is full the
+    oldest item is dropped, so the consumer always works on the newest data
+    instead of falling further and further behind a fast producer.
+
+    Keyword Arguments:
+        maxsize {int, optional}: number of items kept before the oldest is dropped.
+                (Default: {1})
+        on_drop {callable, optional}: called with each dropped item, e.g. to recycle its buffers.
+                (Default: {None})
+    """
+
+    def __init__(self, maxsize=1, on_drop=None):
+        self.maxsize = maxsize
+        self.on_drop = on_drop
+        self.items = deque()
+        self.dropped = 0
+        self.cond = threading.Condition()
+
+    def put(self, item):
+        """
+        Add an item, dropping the oldest one if the queue is full
+        """
+
+        dropped = None
+        with self.cond:
+            if len(self.items) >= self.maxsize:
+                dropped = self.items.popleft()
+                self.dropped += 1
+            self.items.append(item)
+            self.cond.notify()
+        if dropped is not None and self.on_drop is not None:
+            self.on_drop(dropped)
+
+    def get(self, timeout=None):
+        """
+        Take the oldest pending item, or None if nothing arrived before timeout
+        """
+
+        with self.cond:
+            if not self.items:
+                self.cond.wait(timeout)
+            if not self.items:
+                return None
+            return self.items.popleft()
+
+    def __len__(self):
+        return len(self.items)
+
+
+class StageStats:
+    """
+    Rolling timing statistics of one pipeline stage, in milliseconds: percentiles of the
+    recent timings, plus counts of all timings per BUCKETS_MS bucket (a cumulative histogram,
+    as Prometheus exports it).
+
+    Keyword Arguments:
+        window {int, optional}: number of most recent timings used for mean and percentiles,
+                None to keep all of them, e.g. for an offline benchmark.
+                (Default: {120})
+    """
+
+    def __init__(self, window=120):
+        self.count = 0
+        self.last_ms = 0.
+        self.max_ms = 0.
+        self.total_ms = 0.
+        self.buckets = [0] * len(BUCKETS_MS)
+        self.samples = deque(maxlen=window)
+        self.lock = threading.Lock()
+
+    def add(self, elapsed_ms):
+        with self.lock:
+            self.count += 1
+            self.last_ms = elapsed_ms
+            self.max_ms = max(self.max_ms, elapsed_ms)
+            self.total_ms += elapsed_ms
+            self.buckets[bisect.bisect_left(BUCKETS_MS, elapsed_ms)] += 1
+            self.samples.append(elapsed_ms)
+
+    def histogram(self):
+        """
+        Count, sum (ms) and per-bucket counts of all timings so far
+        """
+
+        with self.lock:
+            return self.count, self.total_ms, list(self.buckets)
+
+    def summary(self):
+        """
+        Count, last, mean, p50, p95, p99 and max of the recent timings
+        """
+
+        with self.lock:
+            samples = sorted(self.samples)
+            count, last_ms, max_ms = self.count, self.last_ms, self.max_ms
+        if not samples:
+            return {'count': count, 'last_ms': 0., 'mean_ms': 0., 'p50_ms': 0., 'p95_ms': 0., 'p99_ms': 0.,
+                    'max_ms': 0.}
+        return {'count': count,
+                'last_ms': last_ms,
+                'mean_ms': sum(samples) / len(samples),
+                'p50_ms': samples[min(len(samples) - 1, int(.50 * len(samples)))],
+                'p95_ms': samples[min(len(samples) - 1, int(.95 * len(samples)))],
+                'p99_ms': samples[min(len(samples) - 1, int(.99 * len(samples)))],
+                'max_ms': max_ms}
+
+
+class Stage(threading.Thread):
+    """
+    Pipeline Stage Class.
+
+    Runs func on its own thread.  A stage without an input queue is a source and
+    calls func() in a loop; otherwise it calls func(item) for every item taken
+    from the input queue.  Results that are not None go to the output queue.
+
+    Arguments:
+        name {str}: stage name used in the timing report
+        func {callable}: work done for each item
+        stop_event {threading.Event}: set to stop the stage
+    Keyword Arguments:
+        in_queue {LatestQueue, optional}: where items come from (Default: {None})
+        out_queue {LatestQueue, optional}: where results go (Default: {None})
+        on_drop {callable, optional}: called with items for which func returned None (Default: {None})
+        profile {bool, optional}: run the stage under its own cProfile profiler (Default: {False})
+    """
+
+    def __init__(self, name, func, stop_event, in_queue=None, out_queue=None, on_drop=None, profile=False):
+        super().__init__(name=name, daemon=True)
+        self.profile = cProfile.Profile() if profile else None
+        self.on_drop = on_drop
+        self.func = func
+        self.stop_event = stop_event
+        self.in_queue = in_queue
+        self.out_queue = out_queue
+        self.stats = StageStats()
+        self.error = None
+
+    def run(self):
+        if self.profile is not None:
+            self.profile.enable()
+        try:
+            while not self.stop_event.is_set():
+                if self.in_queue is None:
+                    t0 = time.perf_counter()
+                    result = self.func()
+                else:
+                    item = self.in_queue.get(timeout=0.1)
+                    if item is None:
+                        continue
+                    t0 = time.perf_counter()
+                    result = self.func(item)
+                self.stats.add((time.perf_counter() - t0) * 1000.)
+
+                if result is not None and self.out_queue is not None:
+                    self.out_queue.put(result)
+                elif result is None and self.in_queue is not None and self.on_drop is not None:
+                    self.on_drop(item)
+        except Exception as e:
+            self.error = e
+            self.stop_event.set()
+            raise
+        finally:
+            if self.profile is not None:
+                self.profile.disable()
+
+
+class Pipeline:
+    """
+    Pipeline Class.
+
+    Chains stages running on their own threads through LatestQueues.  The last
+    queue is left for the caller (e.g. the display loop on the main thread) to
+    consume with get().
+
+    Keyword Arguments:
+        queue_size {int, optional}: default capacity of the queues between stages.
+                (Default: {1})
+        on_drop {callable, optional}: called with every item the frame chain drops, either
+                because a newer one replaced it in a queue or because a stage returned None.
+                (Default: {None})
+        profile {bool, optional}: profile every stage with cProfile, see profile_stats().
+                (Default: {False})
+    """
+
+    def __init__(self, queue_size=1, on_drop=None, profile=False):
+        self.queue_size = queue_size
+        self.on_drop = on_drop
+        self.profile = profile
+        self.stop_event = threading.Event()
+        self.stages = []
+        self.queues = []
+        self.extra_stats = {}
+
+    def add_stage(self, name, func, queue_size=None):
+        """
+        Append a stage fed by the output of the previous one
+        """
+
+        in_queue = self.queues[-1] if self.stages else None
+        out_queue = LatestQueue(queue_size or self.queue_size, on_drop=self.on_drop)
+        self.stages.append(Stage(name, func, self.stop_event, in_queue, out_queue, self.on_drop, self.profile))
+        self.queues.append(out_queue)
+        return self
+
+    def add_worker(self, name, func, in_queue):
+        """
+        Add a stage outside of the frame chain, consuming in_queue and producing nothing
+        """
+
+        self.stages.append(Stage(name, func, self.stop_event, in_queue, profile=self.profile))
+        return self
+
+    def stats(self, name):
+        """
+        Timing stats for work measured outside of the stage threads, e.g. display
+        """
+
+        return self.extra_stats.setdefault(name, StageStats())
+
+    def get(self, timeout=None):
+        """
+        Take the next result from the last stage
+        """
+
+        return self.queues[-1].get(timeout)
+
+    def start(self):
+        for stage in self.stages:
+            stage.start()
+        return self
+
+    def stop(self, timeout=1.):
+        self.stop_event.set()
+        for stage in self.stages:
+            stage.join(timeout)
+
+    def profile_stats(self):
+        """
+        cProfile statistics of all stages merged into one pstats.Stats, once they stopped, or
+        None when not profiling
+        """
+        import pstats
+
+        profiles = [stage.profile for stage in self.stages if stage.profile is not None]
+        if not profiles:
+            return None
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        return stats
+
+    @property
+    def running(self):
+        return not self.stop_event.is_set()
+
+    def timings(self):
+        """
+        Per-stage timing summary plus the number of items dropped on each stage's input
+        """
+
+        report = {}
+        for stage in self.stages:
+            report[stage.name] = stage.stats.summary()
+            report[stage.name]['dropped'] = stage.in_queue.dropped if stage.in_queue else 0
+        for name, stats in self.extra_stats.items():
+            report[name] = stats.summary()
+        return report
+
+    def report(self):
+        """
+        Human readable timing table, slowest stage first
+        """
+
+        timings = self.timings()
+        lines = []
+        for name in sorted(timings, key=lambda n: -timings[n]['mean_ms']):
+            t = timings[name]
+            lines.append(f"{name:>12}: mean {t['mean_ms']:7.2f} ms  p95 {t['p95_ms']:7.2f} ms  "
+                         f"max {t['max_ms']:7.2f} ms  n={t['count']}  dropped={t.get('dropped', 0)}")
+        return '\n'.join(lines)
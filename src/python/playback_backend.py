@@ -0,0 +1,99 @@
+import importlib
+
+# Backends gesture_controller.py can drive: name -> (module, class), imported on first use
+BACKENDS = {
+    'spotify': ('spotify_backend', 'SpotifyBackend'),
+    'mock': ('fake_spotify', 'FakeSpotify'),
+    'mpris': ('mpris_backend', 'MprisBackend'),
+}
+
+
+class PlaybackError(Exception):
+    """
+    Error of a playback backend, with the HTTP status the Spotify Web API would answer, so
+    callers handle every backend alike: 404 when there is no active device, 429 when rate
+    limited, 5xx for transient failures.  spotipy's SpotifyException has the same
+    http_status attribute.
+    """
+
+    def __init__(self, http_status, msg, headers=None):
+        super().__init__(f'http status: {http_status}, {msg}')
+        self.http_status = http_status
+        self.msg = msg
+        self.headers = headers
+
+
+def http_status(error):
+    """
+    HTTP status of an error raised by a backend, or None for other errors
+    """
+
+    return getattr(error, 'http_status', None)
+
+
+class PlaybackBackend:
+    """
+    Playback Backend Class.
+
+    What SpotifyControls, PlaybackState, DeviceRegistry and VolumeController need from a
+    player: the spotipy.Spotify methods below, with their arguments and results (playback
+    and devices as the Web API JSON), raising PlaybackError (or a SpotifyException).
+    Subclasses implement them for one kind of player; spotipy clients, e.g. of a
+    FakeSpotifyServer, can be used as they are.
+    """
+
+    # Whether calls go over the network to a service with a request budget, so
+    # SpotifyControls sends them through a RateLimitedClient
+    rate_limited = False
+
+    def current_playback(self):
+        """
+        {'device': ..., 'is_playing': ..., 'progress_ms': ..., 'item': {'id', 'uri', 'duration_ms'}}
+        of the active device, or None if there is none
+        """
+        raise NotImplementedError
+
+    def devices(self):
+        """
+        {'devices': [{'id', 'name', 'type', 'is_active', 'volume_percent'}, ...]}
+        """
+        raise NotImplementedError
+
+    def transfer_playback(self, device_id, force_play=True):
+        raise NotImplementedError
+
+    def start_playback(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def pause_playback(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def next_track(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def previous_track(self, *args, **kwargs):
+        raise NotImplementedError
+
+    def seek_track(self, position_ms, *args, **kwargs):
+        raise NotImplementedError
+
+    def volume(self, volume_percent, *args, **kwargs):
+        raise NotImplementedError
+
+    def current_user_saved_tracks_add(self, tracks=None):
+        raise PlaybackError(405, f'{type(self).__name__} cannot save tracks')
+
+    def close(self):
+        pass
+
+
+def make_backend(name, **kwargs):
+    """
+    Create the backend registered in BACKENDS under name, importing its module (and so its
+    dependencies) only now
+    """
+
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown playback backend {name!r}, expected one of {", ".join(BACKENDS)}')
+    module, cls = BACKENDS[name]
+    return getattr(importlib.import_module(module), cls)(**kwargs)
@@ -0,0 +1,135 @@
+import copy
+import threading
+import time
+
+
+class PlaybackState:
+    """
+    Playback State Class.
+
+    Local cache of spotipy's current_playback() result (device, volume, track,
+    progress and is_playing), so commands can decide what to do without a round
+    trip to the Spotify API.  A background poller refreshes it every ttl seconds,
+    our own commands update it optimistically, and progress is extrapolated from
+    the wall-clock time elapsed since the last poll.
+
+    Arguments:
+        sp_client {PlaybackBackend}: authenticated Spotify client, or another playback backend
+    Keyword Arguments:
+        ttl {float, optional}: seconds between polls.  A read refreshes the cache itself
+                once it is older than ttl, or than 2 * ttl while the poller runs, so reads
+                do not race the next poll.
+                (Default: {2.0})
+        poll {bool, optional}: start the background poller.
+                (Default: {True})
+    """
+
+    def __init__(self, sp_client, ttl=2.0, poll=True):
+        self.sp_client = sp_client
+        self.ttl = ttl
+        self.playback = None
+        self.updated = None
+        self.polls = 0
+        self.lock = threading.Lock()
+        self.stop_event = threading.Event()
+        self.poller = None
+        if poll:
+            self.start_polling()
+
+    def start_polling(self):
+        """
+        Start the background poller, if not running yet
+        """
+
+        if self.poller is None:
+            self.poller = threading.Thread(target=self._poll, name='playback_poller', daemon=True)
+            self.poller.start()
+
+    def _poll(self):
+        while not self.stop_event.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                print("Could not refresh playback state...")
+                print(e)
+            self.stop_event.wait(self.ttl)
+
+    def refresh(self):
+        """
+        Fetch current_playback() from Spotify into the cache
+        """
+
+        playback = self.sp_client.current_playback()
+        with self.lock:
+            self.playback = playback
+            self.updated = time.monotonic()
+            self.polls += 1
+
+    def max_age(self):
+        """
+        Age of the cache a read accepts: the poller refreshes it ttl seconds after the last
+        refresh returned, plus the time current_playback() takes, so allow it twice that
+        """
+
+        polling = self.poller is not None and not self.stop_event.is_set()
+        return 2 * self.ttl if polling else self.ttl
+
+    def invalidate(self):
+        """
+        Mark the cache stale, e.g. after changing track, so the next read refreshes it
+        """
+
+        with self.lock:
+            self.updated = None
+
+    def current(self):
+        """
+        Cached playback in the same layout as current_playback(), with progress_ms
+        extrapolated to now.  None when nothing is playing on any device.
+        """
+
+        with self.lock:
+            fresh = self.updated is not None and time.monotonic() - self.updated < self.max_age()
+        if not fresh:
+            self.refresh()
+
+        with self.lock:
+            if self.playback is None:
+                return None
+            playback = copy.deepcopy(self.playback)
+            elapsed_ms = int((time.monotonic() - self.updated) * 1000)
+
+        if playback.get('is_playing') and playback.get('progress_ms') is not None:
+            progress_ms = playback['progress_ms'] + elapsed_ms
+            if playback.get('item'):
+                progress_ms = min(progress_ms, playback['item']['duration_ms'])
+            playback['progress_ms'] = progress_ms
+        return playback
+
+    def update(self, is_playing=None, volume_percent=None, progress_ms=None, device=None):
+        """
+        Optimistically apply the effect of one of our own commands to the cache
+        """
+
+        with self.lock:
+            if self.playback is None or self.updated is None:
+                return
+            now = time.monotonic()
+            if self.playback.get('is_playing') and self.playback.get('progress_ms') is not None:
+                # Fold the extrapolated progress in before restarting the clock
+                self.playback['progress_ms'] += int((now - self.updated) * 1000)
+            self.updated = now
+
+            if is_playing is not None:
+                self.playback['is_playing'] = is_playing
+            if progress_ms is not None:
+                self.playback['progress_ms'] = progress_ms
+            if device is not None:
+                self.playback['device'] = dict(device)
+            if volume_percent is not None and self.playback.get('device') is not None:
+                self.playback['device']['volume_percent'] = volume_percent
+
+    def stop(self, timeout=1.):
+        self.stop_event.set()
+        if self.poller is not None:
+            self.poller.join(timeout)
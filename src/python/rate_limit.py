@@ -0,0 +1,262 @@
+import time
+import random
+import threading
+from collections import Counter
+
+import requests
+
+from playback_backend import PlaybackError, http_status
+
+# Requests per second and burst of each endpoint (spotipy method); '*' is shared by all calls.
+# Spotify does not publish its limits, it only answers 429 with a Retry-After header once an app
+# goes over its rolling 30 s budget, so these keep a gesture session well below it.
+DEFAULT_BUDGETS = {
+    '*': (5., 10),
+    'current_playback': (1., 2),
+    'devices': (.5, 2),
+    'volume': (2., 2),
+    'seek_track': (2., 2),
+    'transfer_playback': (.5, 1),
+}
+
+# Calls that can be repeated without changing their effect: retried after errors and timeouts.
+# next_track and previous_track (POST) would skip twice if the first request did go through.
+IDEMPOTENT = {'current_playback', 'devices', 'transfer_playback', 'start_playback', 'pause_playback',
+              'seek_track', 'volume', 'current_user_saved_tracks_add'}
+
+# Calls that set an absolute value: a newer call supersedes one still waiting for its turn
+MERGEABLE = {'volume', 'seek_track'}
+
+
+class RateLimited(PlaybackError):
+    """
+    Raised instead of sending a call whose budget would not allow it within max_wait seconds,
+    or after Spotify kept answering 429.  It is a 429 PlaybackError, so callers handle it
+    as one from the API.
+    """
+
+    def __init__(self, endpoint, retry_after):
+        super().__init__(429, f'{endpoint} rate limited, retry in {retry_after:.1f} s')
+        self.endpoint = endpoint
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """
+    Token Bucket Class.
+
+    Allows rate calls per second on average and bursts of up to burst calls.  Tokens may go
+    negative: a call that takes one before it is refilled waits for its turn (wait()), and
+    the calls after it queue behind.  block() empties it until a Retry-After has passed.
+
+    Arguments:
+        rate {float}: tokens added per second
+    Keyword Arguments:
+        burst {int, optional}: tokens the bucket holds when full, 1 if not given.
+                (Default: {None})
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or 1
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.blocked_until = 0.
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait(self, now):
+        """
+        Seconds until a token taken now may be used
+        """
+
+        self._refill(now)
+        return max(0., (1. - self.tokens) / self.rate, self.blocked_until - now)
+
+    def take(self):
+        self.tokens -= 1.
+
+    def block(self, until):
+        self.tokens = min(self.tokens, 0.)
+        self.blocked_until = max(self.blocked_until, until)
+
+
+class RateLimitedClient:
+    """
+    Rate Limited Client Class.
+
+    Wraps a Spotify client so every API method call goes through a request budget (a
+    TokenBucket per endpoint of budgets, and the shared '*' one):
+        - calls of MERGEABLE endpoints (volume, seek_track) over budget are deferred and
+          sent from a timer when their turn comes; a newer call replaces a deferred one
+          (merged) and returns right away
+        - other calls wait for their turn, or raise RateLimited (dropped) if it is more than
+          max_wait seconds away
+        - a 429 answer blocks the buckets for its Retry-After seconds and the call is tried
+          again, since Spotify did not run it
+        - IDEMPOTENT calls are tried again after 5xx answers, connection errors and timeouts,
+          with exponential backoff and full jitter
+    counters holds the number of calls sent, merged, throttled (delayed by the budget or a
+    429), retried, dropped and failed.  Other attributes are passed through.  Give the spotipy
+    client a requests_session of its own, so urllib3 does not retry under it and the
+    Retry-After header of 429s reaches this client.
+
+    Arguments:
+        client {spotipy.Spotify}: client to send the calls with
+    Keyword Arguments:
+        budgets {dict, optional}: (rate, burst) of each endpoint and of '*'.
+                (Default: {DEFAULT_BUDGETS})
+        max_wait {float, optional}: longest a caller is blocked waiting for its turn or a
+                Retry-After, in seconds.
+                (Default: {1.})
+        max_retries {int, optional}: attempts after the first one.
+                (Default: {3})
+        backoff {float, optional}: seconds of the first retry backoff, doubled after each one.
+                (Default: {0.2})
+        max_backoff {float, optional}: longest retry backoff, in seconds.
+                (Default: {4.})
+    """
+
+    def __init__(self, client, budgets=None, max_wait=1., max_retries=3, backoff=.2, max_backoff=4.):
+        self.client = client
+        self.buckets = {name: TokenBucket(rate, burst)
+                        for name, (rate, burst) in (DEFAULT_BUDGETS if budgets is None else budgets).items()}
+        self.max_wait = max_wait
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.counters = Counter()
+        self.deferred = {}  # endpoint -> (args, kwargs) of the call waiting for its timer
+        self.lock = threading.Lock()
+
+    def __getattr__(self, name):
+        attr = getattr(self.client, name)
+        if not callable(attr) or name.startswith('_'):
+            return attr
+
+        def limited(*args, **kwargs):
+            return self.call(name, args, kwargs)
+        return limited
+
+    def _buckets(self, endpoint):
+        return [bucket for bucket in (self.buckets.get('*'), self.buckets.get(endpoint)) if bucket is not None]
+
+    def _reserve(self, endpoint, max_wait=None):
+        """
+        Take a token from the buckets of endpoint and return the seconds until it may be used,
+        or None, taking nothing, if that is more than max_wait.  Call with the lock held.
+        """
+
+        buckets = self._buckets(endpoint)
+        now = time.monotonic()
+        wait = max([bucket.wait(now) for bucket in buckets], default=0.)
+        if max_wait is not None and wait > max_wait:
+            return None
+        for bucket in buckets:
+            bucket.take()
+        return wait
+
+    def call(self, endpoint, args, kwargs):
+        if endpoint in MERGEABLE:
+            with self.lock:
+                if endpoint in self.deferred:
+                    self.deferred[endpoint] = (args, kwargs)
+                    self.counters['merged'] += 1
+                    return None
+                wait = self._reserve(endpoint)
+                if wait > 0.:
+                    self._defer(endpoint, args, kwargs, wait)
+                    return None
+            return self._send(endpoint, args, kwargs)
+
+        with self.lock:
+            wait = self._reserve(endpoint, self.max_wait)
+        if wait is None:
+            self.counters['dropped'] += 1
+            raise RateLimited(endpoint, self._wait(endpoint))
+        if wait > 0.:
+            self.counters['throttled'] += 1
+            time.sleep(wait)
+        return self._send(endpoint, args, kwargs)
+
+    def _wait(self, endpoint):
+        now = time.monotonic()
+        with self.lock:
+            return max([bucket.wait(now) for bucket in self._buckets(endpoint)], default=0.)
+
+    def _defer(self, endpoint, args, kwargs, wait):
+        """
+        Send the call in wait seconds, or the one that replaced it by then.  Call with the
+        lock held.
+        """
+
+        self.deferred[endpoint] = (args, kwargs)
+        self.counters['throttled'] += 1
+        timer = threading.Timer(wait, self._flush, (endpoint,))
+        timer.daemon = True
+        timer.start()
+
+    def _flush(self, endpoint):
+        with self.lock:
+            args, kwargs = self.deferred.pop(endpoint)
+        try:
+            self._send(endpoint, args, kwargs)
+        except RateLimited as e:
+            # Spotify is still refusing: try the newest value again once it allows calls
+            with self.lock:
+                if endpoint not in self.deferred:
+                    self._reserve(endpoint)
+                    self._defer(endpoint, args, kwargs, e.retry_after)
+        except Exception as e:
+            print(f'Could not send deferred {endpoint}...')
+            print(e)
+
+    def _send(self, endpoint, args, kwargs):
+        """
+        Make the call, trying again after 429s and, for IDEMPOTENT calls, transient errors
+        """
+
+        method = getattr(self.client, endpoint)
+        for attempt in range(self.max_retries + 1):
+            try:
+                result = method(*args, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+                if endpoint not in IDEMPOTENT or attempt == self.max_retries:
+                    self.counters['failed'] += 1
+                    raise
+                delay = self._backoff(attempt)
+            except Exception as e:
+                status = http_status(e)  # SpotifyException or PlaybackError; None for other errors
+                if status == 429:
+                    delay = self._retry_after(e)
+                    with self.lock:
+                        until = time.monotonic() + delay
+                        for bucket in self._buckets(endpoint):
+                            bucket.block(until)
+                    self.counters['throttled'] += 1
+                    if attempt == self.max_retries or delay > self.max_wait:
+                        self.counters['failed'] += 1
+                        raise RateLimited(endpoint, delay) from e
+                elif status is not None and status >= 500 and endpoint in IDEMPOTENT and attempt < self.max_retries:
+                    delay = self._backoff(attempt)
+                else:
+                    self.counters['failed'] += 1
+                    raise
+            else:
+                self.counters['sent'] += 1
+                return result
+            self.counters['retried'] += 1
+            time.sleep(delay)
+
+    @staticmethod
+    def _retry_after(e):
+        headers = getattr(e, 'headers', None) or {}
+        try:
+            return float(headers.get('Retry-After', 1))
+        except ValueError:
+            return 1.
+
+    def _backoff(self, attempt):
+        return random.uniform(0., min(self.max_backoff, self.backoff * 2 ** attempt))
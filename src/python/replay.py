@@ -0,0 +1,354 @@
+import csv
+import time
+from collections import Counter
+import numpy as np
+
+from utils import LANDMARK_COLUMNS, N_LANDMARKS
+from pipeline import StageStats
+from landmark_dataset import load_dataset
+
+# One row per hand per frame, or one row with an empty hand for a frame without hands
+RECORDING_COLUMNS = ['frame', 'time', 'stream', 'hand', 'score'] + LANDMARK_COLUMNS
+
+
+class Landmark:
+    __slots__ = ('x', 'y', 'z')
+
+    def __init__(self, x, y, z):
+        self.x, self.y, self.z = x, y, z
+
+
+class HandLandmarks:
+    __slots__ = ('landmark',)
+
+    def __init__(self, landmark):
+        self.landmark = landmark
+
+
+class Classification:
+    __slots__ = ('label', 'score')
+
+    def __init__(self, label, score):
+        self.label, self.score = label, score
+
+
+class Handedness:
+    __slots__ = ('classification',)
+
+    def __init__(self, classification):
+        self.classification = classification
+
+
+class Results:
+    """
+    Stand-in for the results of MediaPipe's hands.process, rebuilt from a recording
+    """
+    __slots__ = ('multi_hand_landmarks', 'multi_handedness')
+
+    def __init__(self, hands=()):
+        """
+        hands: (label, score, (21, 3) landmarks) of each hand, MediaPipe gives None for no hand
+        """
+
+        self.multi_hand_landmarks = [HandLandmarks([Landmark(*map(float, row)) for row in lm])
+                                     for _, _, lm in hands] or None
+        self.multi_handedness = [Handedness([Classification(label, score)])
+                                 for label, score, _ in hands] or None
+
+
+class ReplayFrame:
+    """
+    One frame of every stream: recorded results, or images still to be run through MediaPipe
+    """
+    __slots__ = ('index', 'time', 'images', 'results')
+
+    def __init__(self, index, time, images=None, results=None):
+        self.index = index
+        self.time = time
+        self.images = images
+        self.results = results
+
+
+class LandmarkRecorder:
+    """
+    Landmark Recorder Class.
+
+    Writes the hands MediaPipe found in every frame of every stream to a CSV recording,
+    which read_recording replays without camera or MediaPipe.
+
+    Arguments:
+        path {str}: CSV file to write
+    """
+
+    def __init__(self, path):
+        self.file = open(path, 'w', newline='')
+        self.writer = csv.writer(self.file)
+        self.writer.writerow(RECORDING_COLUMNS)
+        self.t0 = None
+
+    def record(self, frame, results_per_stream, t=None):
+        t = time.perf_counter() if t is None else t
+        if self.t0 is None:
+            self.t0 = t
+        t -= self.t0
+
+        for stream, results in enumerate(results_per_stream):
+            if not results.multi_hand_landmarks:
+                self.writer.writerow([frame, f'{t:.4f}', stream, '', ''] + [''] * len(LANDMARK_COLUMNS))
+                continue
+            for hand_landmarks, handedness in zip(results.multi_hand_landmarks, results.multi_handedness):
+                coords = [v for lm in hand_landmarks.landmark for v in (lm.x, lm.y, lm.z)]
+                self.writer.writerow([frame, f'{t:.4f}', stream, handedness.classification[0].label,
+                                      handedness.classification[0].score] + coords)
+
+    def close(self):
+        self.file.close()
+
+
+def read_recording(path):
+    """
+    Read a LandmarkRecorder CSV into a list of ReplayFrames holding MediaPipe-like results
+    """
+
+    rows_per_frame = {}
+    n_streams = 1
+    with open(path, newline='') as f:
+        reader = csv.reader(f)
+        header = next(reader)
+        if header[:5] != RECORDING_COLUMNS[:5]:
+            raise ValueError(f'{path} is not a landmark recording')
+        for row in reader:
+            frame, stream = int(row[0]), int(row[2])
+            n_streams = max(n_streams, stream + 1)
+            rows_per_frame.setdefault(frame, []).append(row)
+
+    frames = []
+    for frame in sorted(rows_per_frame):
+        rows = rows_per_frame[frame]
+        hands = [[] for _ in range(n_streams)]
+        for row in rows:
+            if row[3]:
+                lm = np.array(row[5:], dtype=np.float32).reshape(N_LANDMARKS, 3)
+                hands[int(row[2])].append((row[3], float(row[4]), lm))
+        frames.append(ReplayFrame(frame, float(rows[0][1]), results=[Results(h) for h in hands]))
+    return frames
+
+
+def synthetic_recording(dataset_path, n_gestures=20, hold_frames=45, gap_frames=30, fps=30., jitter=.002,
+                        seed=0, swipe_fraction=0., transition_fraction=0., swipe_frames=12, swipe_distance=.5):
+    """
+    Build a reproducible single-stream recording from the training data: n_gestures random
+    poses, each held for hold_frames frames (training samples of that class plus a little
+    landmark noise), separated by gap_frames frames without hands.
+
+    Optionally, swipe_fraction of the gestures are swipes instead ('swipe_left'/'swipe_right':
+    a random hand moving swipe_distance across the frame in swipe_frames frames), and
+    transition_fraction of the gaps keep the hand in view, morphing from the previous gesture
+    into the next one.
+
+    Returns the ReplayFrames and the (class, first_frame, last_frame) of each gesture.
+    """
+    rng = np.random.default_rng(seed)
+    X, y, hand = load_dataset(dataset_path)
+    X = np.asarray(X, dtype=np.float32).reshape(-1, N_LANDMARKS, 3)
+    classes = np.unique(y)
+
+    # Landmarks of every gesture, before gaps are put between them
+    clips = []
+    for _ in range(n_gestures):
+        if rng.random() < swipe_fraction:
+            row = rng.integers(len(X))
+            direction = 1. if rng.random() < .5 else -1.
+            lms = []
+            for i in range(swipe_frames):
+                lm = X[row] + rng.normal(0., jitter, X[row].shape).astype(np.float32)
+                lm[:, 0] += direction * swipe_distance * (i / (swipe_frames - 1) - .5)
+                lms.append(lm)
+            clips.append(('swipe_right' if direction > 0 else 'swipe_left', hand[row], lms))
+            continue
+        cls = classes[rng.integers(len(classes))]
+        samples = np.flatnonzero(y == cls)
+        start = rng.integers(len(samples))
+        rows = [samples[(start + i) % len(samples)] for i in range(hold_frames)]
+        clips.append((cls, hand[rows[0]], [X[row] + rng.normal(0., jitter, X[row].shape).astype(np.float32)
+                                           for row in rows]))
+
+    frames, gestures = [], []
+    index = 0
+    previous = None
+    for cls, label, lms in clips:
+        transition = previous is not None and rng.random() < transition_fraction
+        for i in range(gap_frames):
+            results = Results()
+            if transition:
+                w = (i + 1) / (gap_frames + 1)
+                results = Results([(label, 1., (1 - w) * previous + w * lms[0])])
+            frames.append(ReplayFrame(index, index / fps, results=[results]))
+            index += 1
+        gestures.append((cls, index, index + len(lms) - 1))
+        for lm in lms:
+            frames.append(ReplayFrame(index, index / fps, results=[Results([(label, 1., lm)])]))
+            index += 1
+        previous = lms[-1]
+    return frames, gestures
+
+
+def read_videos(paths):
+    """
+    Yield ReplayFrames with the images of one video file per stream, until one of them ends
+    """
+    import cv2
+
+    caps = [cv2.VideoCapture(path) for path in paths]
+    fps = caps[0].get(cv2.CAP_PROP_FPS) or 30.
+    index = 0
+    try:
+        while True:
+            images = []
+            for cap in caps:
+                ret, image = cap.read()
+                if not ret:
+                    return
+                images.append(image)
+            yield ReplayFrame(index, index / fps, images=images)
+            index += 1
+    finally:
+        for cap in caps:
+            cap.release()
+
+
+class ReplayEngine:
+    """
+    Replay Engine Class.
+
+    Feeds recorded frames through the same stages as gesture_controller: MediaPipe (for
+    video recordings only), MultiStreamClassifier with its Delays, and the CommandDispatcher
+    with its SpotifyControls, usually backed by a FakeSpotify.  Frames are replayed as fast
+    as possible by default, and every stage is timed with unbounded StageStats.
+
+    Arguments:
+        classifier {MultiStreamClassifier}: classifier and Delays of every hand
+        dispatcher {CommandDispatcher}: where the commands go
+    Keyword Arguments:
+        detectors {list, optional}: (RoiDetector, mediapipe Hands) of each stream, needed to
+                replay video frames.
+                (Default: {None})
+        speed {float, optional}: replay speed relative to the recording, e.g. 1 for real
+                time, 0 for as fast as possible.
+                (Default: {0.})
+        scheduler {DetectionScheduler, optional}: decides which frames are detected; recorded
+                results of skipped frames are replaced by the last detected ones.
+                (Default: {None})
+    """
+
+    def __init__(self, classifier, dispatcher, detectors=None, speed=0., scheduler=None):
+        self.classifier = classifier
+        self.dispatcher = dispatcher
+        self.detectors = detectors
+        self.speed = speed
+        self.scheduler = scheduler
+        self.stats = {name: StageStats(window=None) for name in ('detect', 'classify', 'submit', 'frame')}
+        self.commands = []  # (frame index, recording time, pose) of every submitted command
+        self.decisions = []  # (frame index, pose) of every frame a hand was classified as a gesture
+
+    def step(self, frame):
+        """
+        Run one frame through detection, classification and dispatch
+        """
+
+        t_frame = time.perf_counter()
+        results = frame.results
+        if results is None:
+            t0 = time.perf_counter()
+            if self.scheduler is None:
+                results = [roi.process(hands, image) for (roi, hands), image in zip(self.detectors, frame.images)]
+            else:
+                results = [self.scheduler.process(stream, image, lambda: roi.process(hands, image), frame.time)
+                           for stream, ((roi, hands), image) in enumerate(zip(self.detectors, frame.images))]
+            self.stats['detect'].add((time.perf_counter() - t0) * 1000.)
+        elif self.scheduler is not None:
+            # Recorded frames are shared between replays: only this replay sees the reused results
+            results = [self.scheduler.process(stream, None, lambda: recorded, frame.time)
+                       for stream, recorded in enumerate(results)]
+
+        t0 = time.perf_counter()
+        detections = self.classifier.classify(results)
+        self.stats['classify'].add((time.perf_counter() - t0) * 1000.)
+
+        t0 = time.perf_counter()
+        for stream_detections in detections:
+            for (pose, confidence), (lm, mp_lm), delay in stream_detections:
+                if pose is not None and pose != 'Unknown':
+                    self.decisions.append((frame.index, pose))
+                if pose is not None and self.dispatcher.submit(pose, lm, delay):
+                    self.commands.append((frame.index, frame.time, pose))
+        self.stats['submit'].add((time.perf_counter() - t0) * 1000.)
+        self.stats['frame'].add((time.perf_counter() - t_frame) * 1000.)
+
+    def run(self, frames):
+        """
+        Replay all frames, wait for the last commands to be sent, and return the report
+        """
+
+        n_frames, first, last = 0, None, 0.
+        t_start = time.perf_counter()
+        for frame in frames:
+            if first is None:
+                first = frame.time
+            last = frame.time
+            if self.speed:
+                wait = (frame.time - first) / self.speed - (time.perf_counter() - t_start)
+                if wait > 0:
+                    time.sleep(wait)
+            self.step(frame)
+            n_frames += 1
+        self.dispatcher.wait_idle(timeout=30.)
+        wall = time.perf_counter() - t_start
+
+        # A recording of n frames lasts n frame intervals
+        duration = (last - (first or 0.)) * n_frames / max(1, n_frames - 1)
+        timings = {name: stats.summary() for name, stats in self.stats.items() if stats.count}
+        timings['command'] = self.dispatcher.stats.summary()
+        timings.update({f'command.{key}': summary for key, summary in self.dispatcher.commands.stats().items()})
+        report = {'frames': n_frames,
+                  'duration_s': duration,
+                  'wall_s': wall,
+                  'fps': n_frames / wall if wall else 0.,
+                  'speedup': duration / wall if wall else 0.,
+                  'commands': len(self.commands),
+                  'commands_per_min': len(self.commands) / duration * 60. if duration else 0.,
+                  'commands_sent': self.dispatcher.stats.count,
+                  'poses': dict(Counter(pose for _, _, pose in self.commands)),
+                  'timings': timings}
+        if self.scheduler is not None:
+            report['detection'] = self.scheduler.summary()
+        return report
+
+    def recognized(self, gestures, fps=30.):
+        """
+        Score the replay of a recording whose gestures are known, as (class, first_frame, last_frame):
+            - recognized: fraction of the gestures classified as their class while performed
+            - wrong: commands that did not match the gesture performed at the time
+            - duplicates: matching commands after the first one of each gesture
+            - latency_frames / latency_ms: median and p95 frames (and ms at fps) from the start
+              of each recognized gesture to its first decision
+        """
+
+        latencies = []
+        for cls, start, end in gestures:
+            first = next((index for index, pose in self.decisions if start <= index <= end and pose == cls), None)
+            if first is not None:
+                latencies.append(first - start)
+        wrong = sum(not any(start <= index <= end and pose == cls for cls, start, end in gestures)
+                    for index, _, pose in self.commands)
+        duplicates = sum(max(0, sum(start <= index <= end and pose == cls for index, _, pose in self.commands) - 1)
+                         for cls, start, end in gestures)
+
+        latencies = sorted(latencies)
+        p50 = latencies[len(latencies) // 2] if latencies else 0
+        p95 = latencies[min(len(latencies) - 1, int(.95 * len(latencies)))] if latencies else 0
+        return {'recognized': len(latencies) / len(gestures) if gestures else 0.,
+                'wrong': wrong,
+                'duplicates': duplicates,
+                'latency_frames': {'p50': p50, 'p95': p95},
+                'latency_ms': {'p50': p50 / fps * 1000., 'p95': p95 / fps * 1000.}}
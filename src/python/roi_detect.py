@@ -0,0 +1,112 @@
+import math
+import cv2
+
+from metrics import METRICS
+
+
+class RoiDetector:
+    """
+    ROI Detector Class.
+
+    Runs MediaPipe Hands on a reduced part of the frame of one stream:
+        - the frame (or crop) is downsampled to at most inference_width pixels wide
+        - once a hand is found, the next frames are cropped to the padded bounding box
+          of its last landmarks; when the hand is lost, or every redetect_interval
+          frames, the full frame is searched again
+    Landmarks are mapped back to normalized coordinates of the full (flipped) frame,
+    so drawing and classification see the same values as with a full-frame search.
+
+    Arguments:
+        hand_detect {HandDetect}: used for the MediaPipe preprocessing
+    Keyword Arguments:
+        buffers {FrameBuffers, optional}: reusable arrays for the resized and RGB images,
+                None to allocate new ones every frame.
+                (Default: {None})
+        inference_width {int, optional}: maximum width of the image given to MediaPipe,
+                None to keep the full resolution.
+                (Default: {None})
+        track_roi {bool, optional}: crop to the region of the last detected hands.
+                (Default: {False})
+        roi_padding {float, optional}: padding added on each side of the hands bounding
+                box, as a fraction of its largest side.
+                (Default: {0.5})
+        redetect_interval {int, optional}: frames between full-frame searches while
+                tracking, so new hands entering the frame are found.
+                (Default: {30})
+    """
+
+    def __init__(self, hand_detect, buffers=None, inference_width=None, track_roi=False, roi_padding=.5,
+                 redetect_interval=30):
+        self.hand_detect = hand_detect
+        self.buffers = buffers
+        self.inference_width = inference_width
+        self.track_roi = track_roi
+        self.roi_padding = roi_padding
+        self.redetect_interval = redetect_interval
+        self.roi = None  # (x0, y0, x1, y1), normalized in the flipped frame
+        self.frames_tracked = 0
+
+    def process(self, hands, image):
+        """
+        Run hands.process on the region of interest of a BGR frame.  Returns the MediaPipe
+        results with landmarks in full-frame coordinates.
+        """
+
+        height, width = image.shape[:2]
+        x0, y0, x1, y1 = self.roi if self.roi is not None else (0., 0., 1., 1.)
+
+        # The ROI is tracked in the flipped frame MediaPipe sees; crop the unflipped frame
+        left, right = int((1. - x1) * width), int(round((1. - x0) * width))
+        top, bottom = int(y0 * height), int(round(y1 * height))
+        crop = image[top:bottom, left:right]
+
+        crop_width = right - left
+        if self.inference_width is not None and crop_width > self.inference_width:
+            size = (self.inference_width, max(1, int(round((bottom - top) * self.inference_width / crop_width))))
+            crop = cv2.resize(crop, size, dst=self._buffer('resized', (size[1], size[0], 3)),
+                              interpolation=cv2.INTER_AREA)
+
+        with METRICS.timer('mediapipe.preprocess'):
+            rgb = self.hand_detect.image_preprocessing(crop, out=self._buffer('rgb', crop.shape))
+        with METRICS.timer('mediapipe.process'):
+            results = hands.process(rgb)
+
+        if results.multi_hand_landmarks and (x0, y0, x1, y1) != (0., 0., 1., 1.):
+            crop_x, crop_y = 1. - right / width, top / height
+            crop_w, crop_h = crop_width / width, (bottom - top) / height
+            for hand_landmarks in results.multi_hand_landmarks:
+                for landmark in hand_landmarks.landmark:
+                    landmark.x = crop_x + landmark.x * crop_w
+                    landmark.y = crop_y + landmark.y * crop_h
+                    landmark.z = landmark.z * crop_w
+
+        self.update_roi(results, width, height)
+        return results
+
+    def _buffer(self, key, shape):
+        if self.buffers is None:
+            return None
+        return self.buffers.get((id(self), key), shape)
+
+    def update_roi(self, results, width, height):
+        """
+        Track the padded bounding box of the detected hands, or fall back to the full frame
+        """
+
+        self.frames_tracked += 1
+        if not self.track_roi or not results.multi_hand_landmarks \
+                or self.frames_tracked >= self.redetect_interval:
+            self.roi = None
+            self.frames_tracked = 0
+            return
+
+        xs = [lm.x for hand in results.multi_hand_landmarks for lm in hand.landmark]
+        ys = [lm.y for hand in results.multi_hand_landmarks for lm in hand.landmark]
+
+        # Square box in pixels around the hands, padded on every side.  Its size is rounded
+        # up to 16 pixels so the crop, and the buffers it needs, rarely change shape.
+        center_x, center_y = (min(xs) + max(xs)) / 2 * width, (min(ys) + max(ys)) / 2 * height
+        half = max((max(xs) - min(xs)) * width, (max(ys) - min(ys)) * height) * (.5 + self.roi_padding)
+        half = math.ceil(half / 16) * 16
+        self.roi = (max(0., (center_x - half) / width), max(0., (center_y - half) / height),
+                    min(1., (center_x + half) / width), min(1., (center_y + half) / height))
@@ -0,0 +1,225 @@
+import os
+import shutil
+import threading
+import time
+from collections import Counter
+import numpy as np
+
+from utils import LANDMARK_COLUMNS
+from landmark_dataset import LandmarkDataset
+
+
+class SampleWriter:
+    """
+    Sample Writer Class.
+
+    Collects labeled landmark samples from the capture loop and writes them from a background
+    thread, so saving never stalls the preview.  add() copies a sample into a preallocated
+    ring of capacity rows; the writer flushes rows in batches and, every autosave seconds,
+    makes the saved file consistent:
+        - *.lmd: rows are appended to the LandmarkDataset, whose header is replaced atomically
+        - *.csv: rows are appended (and fsynced) to a <file>.part journal, which autosave copies
+          to a temporary file that atomically replaces <file>, so <file> is always a complete
+          CSV.  The journal is removed on close(); one left by a crash is kept as
+          <file>.recovered.csv
+    Memory stays bounded by the ring, whatever the session length.  undo() removes the last
+    sample, even once written, as long as it is still in the ring.
+
+    Arguments:
+        path {str}: CSV file or LandmarkDataset directory to write
+    Keyword Arguments:
+        capacity {int, optional}: samples kept in memory, i.e. how far undo goes back and how far
+                the writer may fall behind before new samples are dropped.
+                (Default: {4096})
+        batch_size {int, optional}: samples gathered before the writer flushes them.
+                (Default: {64})
+        autosave {float, optional}: seconds between autosaves.
+                (Default: {30.})
+    """
+
+    def __init__(self, path, capacity=4096, batch_size=64, autosave=30.):
+        self.path = path
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.autosave = autosave
+
+        self.landmarks = np.empty((capacity, len(LANDMARK_COLUMNS)), dtype=np.float32)
+        self.class_codes = np.empty(capacity, dtype=np.int32)
+        self.hand_codes = np.empty(capacity, dtype=np.int32)
+        self.offsets = np.zeros(capacity, dtype=np.int64)  # CSV journal offset where each row starts
+        self.classes, self.hands = [], []
+        self.counts = Counter()
+
+        self.n_rows = 0  # samples kept, written or not
+        self.n_written = 0  # samples in the file that were not undone since
+        self.low_water = 0  # fewest samples kept since the writer took its last batch
+        self.file_rows = 0  # samples in the file, undone or not (writer thread only)
+        self.undo_floor = 0  # first sample still in the ring
+        self.dropped = 0
+        self.saves = 0
+        self.save_requested = False
+        self.closing = False
+        self.error = None
+        self.cond = threading.Condition()
+
+        if path.endswith('.lmd'):
+            self.dataset = LandmarkDataset(path, mode='a')
+            self.dataset_start = len(self.dataset)
+            self.journal = None
+        else:
+            self.dataset = None
+            self.journal_path = path + '.part'
+            if os.path.exists(self.journal_path):
+                recovered = os.path.splitext(path)[0] + '.recovered.csv'
+                os.replace(self.journal_path, recovered)
+                print(f'Samples of an interrupted session saved in {recovered}')
+            self.journal = open(self.journal_path, 'wb')
+            self.journal.write((','.join(LANDMARK_COLUMNS + ['hand', 'class']) + '\n').encode())
+
+        self.last_save = time.monotonic()
+        self.worker = threading.Thread(target=self._run, name='sample_writer', daemon=True)
+        self.worker.start()
+
+    @staticmethod
+    def _code(names, name):
+        if name not in names:
+            names.append(name)
+        return names.index(name)
+
+    def add(self, landmarks, cls, hand):
+        """
+        Queue one sample ((21, 3) or (63,) landmarks).  Returns False if it was dropped because
+        the writer is capacity samples behind.
+        """
+
+        with self.cond:
+            if self.n_rows - self.n_written >= self.capacity:
+                self.dropped += 1
+                return False
+            slot = self.n_rows % self.capacity
+            self.landmarks[slot] = np.reshape(landmarks, -1)
+            self.class_codes[slot] = self._code(self.classes, cls)
+            self.hand_codes[slot] = self._code(self.hands, hand)
+            self.n_rows += 1
+            self.undo_floor = max(self.undo_floor, self.n_rows - self.capacity)
+            self.counts[cls] += 1
+            if self.n_rows - self.n_written >= self.batch_size:
+                self.cond.notify()
+        return True
+
+    def undo(self):
+        """
+        Remove the last sample; returns its class, or None if there is nothing left to undo
+        """
+
+        with self.cond:
+            if self.n_rows <= self.undo_floor:
+                return None
+            self.n_rows -= 1
+            self.n_written = min(self.n_written, self.n_rows)
+            self.low_water = min(self.low_water, self.n_rows)
+            cls = self.classes[self.class_codes[self.n_rows % self.capacity]]
+            self.counts[cls] -= 1
+        return cls
+
+    def __len__(self):
+        return self.n_rows
+
+    def save(self):
+        """
+        Ask the writer to flush and autosave now, without waiting for it
+        """
+
+        with self.cond:
+            self.save_requested = True
+            self.cond.notify()
+
+    def close(self, timeout=None):
+        """
+        Flush the remaining samples, save, and stop the writer
+        """
+
+        with self.cond:
+            self.closing = True
+            self.cond.notify()
+        self.worker.join(timeout)
+        if self.error is not None:
+            raise self.error
+
+    def _run(self):
+        try:
+            while True:
+                with self.cond:
+                    self.cond.wait_for(lambda: self.closing or self.save_requested
+                                       or self.n_rows - self.n_written >= self.batch_size,
+                                       max(0., self.last_save + self.autosave - time.monotonic()))
+                    closing, save = self.closing, self.save_requested
+                    self.save_requested = False
+
+                self._flush()
+                if closing or save or time.monotonic() - self.last_save >= self.autosave:
+                    self._flush(everything=True)
+                    self._save()
+                if closing:
+                    self._finish()
+                    return
+        except Exception as e:
+            self.error = e
+            print(f'Could not write samples to {self.path}...')
+            print(e)
+
+    def _flush(self, everything=False):
+        """
+        Bring the file to the first n_rows samples: truncate undone ones, append new ones
+        """
+
+        with self.cond:
+            n_rows, n_written = self.n_rows, self.n_written
+            if not everything and n_rows - n_written < self.batch_size and self.file_rows == n_written:
+                return
+            # Undone samples may be replaced while the batch is written, so it only counts up to
+            # the fewest samples kept meanwhile
+            self.low_water = n_rows
+            slots = np.arange(n_written, n_rows) % self.capacity
+            landmarks = self.landmarks[slots]
+            classes = [self.classes[c] for c in self.class_codes[slots]]
+            hands = [self.hands[c] for c in self.hand_codes[slots]]
+            truncate_at = int(self.offsets[n_written % self.capacity]) if self.file_rows > n_written else None
+
+        if self.dataset is not None:
+            if self.file_rows > n_written:
+                self.dataset.truncate(self.dataset_start + n_written)
+            self.dataset.append(landmarks, classes, hands)
+            offsets = None
+        else:
+            if truncate_at is not None:
+                self.journal.truncate(truncate_at)
+                self.journal.seek(truncate_at)
+            offsets = np.empty(len(landmarks), dtype=np.int64)
+            for i, (row, hand, cls) in enumerate(zip(landmarks.tolist(), hands, classes)):
+                offsets[i] = self.journal.tell()
+                self.journal.write((','.join(map(repr, row)) + f',{hand},{cls}\n').encode())
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+        self.file_rows = n_rows
+        with self.cond:
+            if offsets is not None:
+                self.offsets[slots] = offsets
+            self.n_written = min(n_rows, self.low_water)
+
+    def _save(self):
+        if self.journal is not None:
+            tmp = self.path + '.tmp'
+            with open(self.journal_path, 'rb') as src, open(tmp, 'wb') as dst:
+                shutil.copyfileobj(src, dst)
+                dst.flush()
+                os.fsync(dst.fileno())
+            os.replace(tmp, self.path)
+        self.saves += 1
+        self.last_save = time.monotonic()
+
+    def _finish(self):
+        if self.journal is not None:
+            self.journal.close()
+            os.remove(self.journal_path)
@@ -0,0 +1,216 @@
+import threading
+import numpy as np
+
+from utils import extract_landmarks, shift_and_scale, N_LANDMARKS, WRIST
+
+
+def window_features(windows):
+    """
+    Features of (n, window, 21, 3) windows of raw landmarks, oldest frame first:
+        - mean of the normalized poses (shift_and_scale of every frame), for static poses
+        - last minus first normalized pose, for hand shapes that change
+        - wrist x/y of every frame relative to the last one, in hand sizes, for motions such
+          as swipes, plus the length of the wrist path and of the net displacement, which
+          tell steady motions from jitter whatever their direction
+    """
+
+    windows = np.asarray(windows, dtype=np.float64)
+    n, length = windows.shape[:2]
+    poses = shift_and_scale(windows.reshape(n * length, -1)).reshape(n, length, -1)
+
+    # Hand size as shift_and_scale measures it: farthest landmark from the wrist (x/y only)
+    wrist = windows[:, :, WRIST, :2]
+    origin = np.zeros((n, length, 1, 3))
+    origin[..., :2] = wrist[:, :, None]
+    size = np.sqrt(np.square(windows - origin).sum(axis=-1).max(axis=-1)).mean(axis=1)
+    trajectory = (wrist - wrist[:, -1:]) / size[:, None, None]
+    path = np.sqrt(np.square(np.diff(trajectory, axis=1)).sum(axis=-1)).sum(axis=1)
+    displacement = np.sqrt(np.square(trajectory[:, 0]).sum(axis=-1))
+
+    return np.concatenate([poses.mean(axis=1), poses[:, -1] - poses[:, 0], trajectory.reshape(n, -1),
+                           path[:, None], displacement[:, None]], axis=1)
+
+
+class SequenceClassifier:
+    """
+    Sequence Classifier Class.
+
+    NumPy-only gesture classifier over short windows of frames: window_features() followed by
+    a standardized softmax (multinomial logistic regression), exported from the sklearn model
+    train_sequence_classifier.py fits.  Unlike HandPoses, which sees one frame, it sees how
+    the hand moves, so it recognizes dynamic gestures such as swipes, and its decisions need
+    no long vote over frames.
+
+    Arguments:
+        classes {np.ndarray}: class names, in the order of the probability columns, with
+                'Unknown' for windows that are no gesture
+        window {int}: frames per window
+        mean {np.ndarray}: (n_features,) feature means of the scaler
+        scale {np.ndarray}: (n_features,) feature scales of the scaler
+        coef {np.ndarray}: (n_classes, n_features) weights
+        intercept {np.ndarray}: (n_classes,) intercepts
+    """
+
+    def __init__(self, classes, window, mean, scale, coef, intercept):
+        self.classes_ = np.asarray(classes)
+        self.window = window
+        coef = np.asarray(coef, dtype=np.float64)
+        intercept = np.asarray(intercept, dtype=np.float64)
+        if len(coef) == 1:  # binary logistic regression: one logit against a zero one
+            coef = np.vstack([np.zeros_like(coef), coef])
+            intercept = np.concatenate([[0.], intercept])
+        # Fold the standardization into the weights
+        scale = np.asarray(scale, dtype=np.float64)
+        self.coef = np.ascontiguousarray((coef / scale).T)
+        self.intercept = intercept - (np.asarray(mean, dtype=np.float64) / scale) @ coef.T
+
+    @classmethod
+    def from_sklearn(cls, model, window):
+        """
+        Export a fitted Pipeline([StandardScaler, LogisticRegression]) trained on window_features
+        """
+
+        scaler, logistic = model.steps[0][1], model.steps[-1][1]
+        return cls(logistic.classes_, window, scaler.mean_, scaler.scale_, logistic.coef_, logistic.intercept_)
+
+    def predict_proba(self, windows):
+        """
+        Class probabilities of (n, window, 21, 3) landmark windows
+        """
+
+        logits = window_features(windows) @ self.coef + self.intercept
+        logits -= logits.max(axis=1, keepdims=True)
+        np.exp(logits, out=logits)
+        logits /= logits.sum(axis=1, keepdims=True)
+        return logits
+
+    def predict(self, windows):
+        return self.classes_[np.argmax(self.predict_proba(windows), axis=1)]
+
+
+class GestureWindow:
+    """
+    Gesture Window Class.
+
+    Takes the role of Delay for the SequenceClassifier, for one hand: keeps its last window
+    frames in a ring and fires a class once it is the most likely one, above threshold, for
+    confirm_frames consecutive windows.  It has Delay's reset_counter / set_in_action /
+    ignore_frames interface, so the CommandDispatcher treats both alike: after a command
+    the next frames are ignored, and the window refills before the next decision.  Like
+    Delay's frames_in_action, confirm_frames_in_action makes a held gesture repeat its
+    command only once it is held longer than a usual gesture.
+
+    Arguments:
+        classes {np.ndarray}: class names of the SequenceClassifier
+        window {int}: frames per window
+    Keyword Arguments:
+        threshold {float, optional}: minimum probability of the most likely class.
+                (Default: {0.8})
+        confirm_frames {int, optional}: consecutive windows agreeing before a class fires.
+                (Default: {3})
+        confirm_frames_in_action {int, optional}: the same for the class of the last command,
+                once it was run. (Default: {20})
+    """
+
+    def __init__(self, classes, window, threshold=.8, confirm_frames=3, confirm_frames_in_action=20):
+        self.classes = [str(cls) for cls in classes]
+        self.window = window
+        self.threshold = threshold
+        self.confirm_frames = confirm_frames
+        self.confirm_frames_in_action = confirm_frames_in_action
+        self.frames = np.empty((window, N_LANDMARKS, 3), dtype=np.float32)
+        self.pos = 0  # slot of the next frame, i.e. of the oldest one once the ring is full
+        self.count = 0  # consecutive frames in the ring
+        self.streak = 0
+        self.last_idx = None
+        self.action_idx = None  # class of the last decision
+        self.streak_start = None
+        self.onset = None  # time of the first window of the last decided gesture
+        self.in_action = False
+        self.ignore_frames = 0
+        self.lock = threading.RLock()
+
+    @property
+    def ready(self):
+        return self.count >= self.window and not self.ignore_frames
+
+    def push(self, hand_landmarks):
+        """
+        Add the MediaPipe landmarks of the hand in this frame; returns them as a (21, 3) view
+        valid until the ring wraps around.  Frames are dropped while ignoring frames.
+        """
+
+        with self.lock:
+            lm = extract_landmarks(hand_landmarks, self.frames[self.pos])
+            if self.ignore_frames > 0:
+                self.ignore_frames -= 1
+                return lm
+            self.pos = (self.pos + 1) % self.window
+            self.count += 1
+            return lm
+
+    def miss(self):
+        """
+        The hand is not seen (or not confidently) in this frame: the window starts over
+        """
+
+        with self.lock:
+            if self.ignore_frames > 0:
+                self.ignore_frames -= 1
+            self.count = 0
+            self.streak = 0
+            self.last_idx = None
+
+    def window_into(self, out):
+        """
+        Copy the frames of the window, oldest first, into a (window, 21, 3) array
+        """
+
+        with self.lock:
+            oldest = self.pos
+            out[:self.window - oldest] = self.frames[oldest:]
+            out[self.window - oldest:] = self.frames[:oldest]
+        return out
+
+    def decide(self, probabilities, t=None):
+        """
+        Update the streak with the probabilities of the current window, ending at time t; returns
+        (pose, confidence) like Delay.update
+        """
+
+        with self.lock:
+            idx = int(np.argmax(probabilities))
+            confidence = probabilities[idx]
+            if confidence >= self.threshold and self.classes[idx] != 'Unknown':
+                self.streak = self.streak + 1 if idx == self.last_idx else 1
+                if self.streak == 1:
+                    self.streak_start = t
+                self.last_idx = idx
+            else:
+                self.streak = 0
+                self.last_idx = None
+
+            in_action = self.in_action and idx == self.action_idx
+            needed = self.confirm_frames_in_action if in_action else self.confirm_frames
+            if self.streak >= needed:
+                self.onset = self.streak_start
+                self.action_idx = idx
+                return self.classes[idx], confidence
+            return 'Unknown', 1.0
+
+    def reset_counter(self, ignore_next_frames=0):
+        """
+        Empty the window and can ignore the next frames
+        """
+
+        with self.lock:
+            self.in_action = False
+            self.count = 0
+            self.streak = 0
+            self.last_idx = None
+            if ignore_next_frames > 0:
+                self.ignore_frames = ignore_next_frames
+
+    def set_in_action(self, value):
+        with self.lock:
+            self.in_action = value
@@ -0,0 +1,45 @@
+import os
+import requests
+import spotipy
+from spotipy.oauth2 import SpotifyOAuth
+
+from playback_backend import PlaybackBackend
+
+
+class SpotifyBackend(spotipy.Spotify, PlaybackBackend):
+    """
+    Spotify Backend Class.
+
+    spotipy client of the Spotify Web API, logged in with OAuth: the first API call opens the
+    login popup, and the token is cached in /tmp/.cache-<username>.
+
+    Keyword Arguments:
+        username {str, optional}: Spotify user, $USERNAME if not given.
+                (Default: {None})
+        scope {str, optional}: OAuth scopes the commands need.
+                (Default: {SCOPE})
+    """
+
+    SCOPE = "user-read-playback-state,user-modify-playback-state,user-library-modify"
+    rate_limited = True
+
+    def __init__(self, username=None, scope=SCOPE):
+        self.username = username or os.environ['USERNAME']
+        self.scope = scope
+
+        # One pooled keep-alive session, so repeated commands reuse the same connection.  Its
+        # adapter does not retry, so 429s and their Retry-After reach the RateLimitedClient.
+        self.session = requests.Session()
+        self.session.mount('https://', requests.adapters.HTTPAdapter(pool_connections=2, pool_maxsize=4))
+
+        super().__init__(
+            client_credentials_manager=SpotifyOAuth(
+                scope=self.scope,
+                cache_path='/tmp/.cache-'+self.username,
+                username=self.username,
+            ),
+            requests_session=self.session,
+        )
+
+    def close(self):
+        self.session.close()
@@ -1,17 +1,20 @@
-import os
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth
-import pyautogui
 import cv2
-from datetime import datetime
 
 from utils import *
+from playback_state import PlaybackState
+from device_registry import DeviceRegistry
+from volume_control import VolumeController
+from metrics import METRICS, TimedClient
+from rate_limit import RateLimitedClient
+from command_registry import CommandRegistry, Command
+from playback_backend import make_backend, http_status
 
 
 class SpotifyControls:
     """
         This class execute Spotify API commands based on the hand pose predicted from HandPoses.
-        The gesture controller uses a specific spotipy API call for each pose.
+        The gesture controller uses a specific spotipy API call for each pose, declared in the
+        CommandRegistry commands.
 
         Keyword Arguments:
             screen_proportion {float}: the proportion of gesture controller interaction area in 'mouse'
@@ -24,197 +27,197 @@ class SpotifyControls:
                 When this value has the tradeoff: increase this number improves the mouse
                 sensitivity, but delays the mouse iteration (midpoint update)
                 (default: {10})
+            playback_ttl {float}: seconds between playback state polls.
+                (default: {2.0})
+            sp_client {PlaybackBackend, optional}: player to control instead of logging into Spotify,
+                e.g. a FakeSpotify to run without network or an MprisBackend (see playback_backend).
+                (default: {None})
+            device_ttl {float}: seconds between device list polls.
+                (default: {10.0})
+            poll_playback {bool}: refresh the playback state and the device list on background
+                threads.
+                (default: {True})
+            rate_limit {bool}: send the calls through a RateLimitedClient, which keeps them
+                within a request budget and retries them; its counters are in requests.  None
+                to do so if the backend is rate_limited, as Spotify is.
+                (default: {None})
+            volume_rate {float}: volume() calls per second at most while sliding the volume.
+                (default: {3.0})
     """
 
-    def __init__(self):
+    def __init__(self, playback_ttl=2.0, sp_client=None, poll_playback=True, rate_limit=None, device_ttl=10.0,
+                 volume_rate=3.0):
         self.marked_pos = None
         self.marked_uri = 'empty'
-        self.prev_index_finger_tip_y = None
-        self.prev_vol_datetime = None
 
-        self.username = os.environ['USERNAME']
-
-        # Authenticate with proper scopes
-        self.scope = "user-read-playback-state,user-modify-playback-state,user-library-modify"
-
-        self.sp_client = spotipy.Spotify(
-            client_credentials_manager=SpotifyOAuth(
-                scope=self.scope,
-                cache_path='/tmp/.cache-'+self.username,
-                username=self.username,
-            )
-        )
-
-    def execute_cmd(self, pose, lm, delay, frame):
+        # Backends given by the caller are theirs to close
+        self.owns_backend = sp_client is None
+        if sp_client is None:
+            # This will log into Spotify using your personal account with a separate popup window
+            sp_client = make_backend('spotify')
+        self.backend = sp_client
+        if rate_limit is None:
+            rate_limit = getattr(sp_client, 'rate_limited', True)
+        # Every API call is timed as spotify.<method> in the metrics, without the budget waits
+        self.sp_client = TimedClient(sp_client)
+        self.requests = None
+        if rate_limit:
+            self.sp_client = self.requests = RateLimitedClient(self.sp_client)
+
+        # Commands read the playback state from this cache instead of calling current_playback()
+        self.playback = PlaybackState(self.sp_client, ttl=playback_ttl, poll=poll_playback)
+        # connect_cycle reads the devices and its target from this cache instead of calling devices()
+        self.devices = DeviceRegistry(self.sp_client, ttl=device_ttl, poll=poll_playback)
+        # volume_slider sets a smoothed target volume, sent in the background at volume_rate at most
+        self.volume = VolumeController(self.sp_client, self.playback, max_rate=volume_rate)
+        # What each gesture does; a CommandDispatcher runs them once resolved against the model classes
+        self.commands = self.command_registry()
+
+    def start_polling(self):
         """
-            Execute Movement Method
-
-            This method execute movements (gesture controller) using pose class.
-
-            Arguments:
-                pose {string}: predicted hand pose
-                lm {string}: hands landmarks detected by HandDetect
-                delay {Delay}: class responsible to provoke delays on the execution frames
-                frame {cv2 Image, np.ndarray}: webcam frame
+            Start refreshing the playback state and the device list in the background
         """
-        if pose == 'pause_or_play':
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is None or not playback['is_playing']:
-                    self.sp_client.start_playback()
-                else:
-                    self.sp_client.pause_playback()
-            except spotipy.exceptions.SpotifyException as e:
-                # print(e)
-                # print("Trying to find an active device...")
-                devs = self.sp_client.devices()['devices']
-                if len(devs) > 0:
-                    dev_id = devs[0]['id']
-                    self.sp_client.transfer_playback(dev_id)
-                else:
-                    print("Tried to turn the volume up...")
-                    print("Sorry, user needs to log into a device with Spotify!")
-
-            delay.reset_counter(20)
-            delay.set_in_action(True)
-
-        elif pose == 'connect_cycle':
-            try:
-                cur_dev_id = self.sp_client.current_playback()['device']['id']
-                devs = self.sp_client.devices()['devices']
-                cur_dev_idx = None
-                for i, dev in enumerate(devs):
-                    if dev['id'] == cur_dev_id:
-                        cur_dev_idx = i
-
-                new_dev_idx = cur_dev_idx - 1  # Loop backwards
-
-                new_dev_id = devs[new_dev_idx]['id']
-                self.sp_client.transfer_playback(new_dev_id)
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to change device to connect_speaker (left)...")
-                print(e)
-
-            delay.reset_counter(20)
-            delay.set_in_action(True)
-
-        elif pose == 'next_track':
-            try:
-                self.sp_client.next_track()
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to go to next track...")
-                print(e)
-
-            delay.reset_counter(10)
-            delay.set_in_action(True)
-
-        elif pose == 'previous_track':
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is not None:
-                    cur_uri = playback['item']['uri']
-                    cur_pos = playback['progress_ms']
-                    # Check if we have a valid mark in this track to skip back to
-                    if self.marked_pos is not None and self.marked_pos < cur_pos \
-                            and cur_uri == self.marked_uri:
-                        self.sp_client.seek_track(self.marked_pos)
-                    else:
-                        if cur_pos < 6*1000:  # Go to previous track
-                            self.sp_client.previous_track(self.marked_pos)
-                        else:  # Go back to beginning of track
-                            self.sp_client.seek_track(0)
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to go to previous track...")
-                print(e)
-
-            delay.reset_counter(10)
-            delay.set_in_action(True)
-
-        elif pose == 'volume_slider':
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is not None:
-                    if self.prev_index_finger_tip_y is not None \
-                            and self.prev_vol_datetime is not None \
-                            and (datetime.now() - self.prev_vol_datetime).total_seconds() < 2.5:
-                        cur_vol = playback['device']['volume_percent']
-                        # print(f"DEBUG: Current volume {cur_vol}.")
-                        # print(f"DEBUG: Landmarks: {lm[8*3+1]}")
-                        cur_index_finger_tip_y = lm[8*3+1]
-                        vol_diff = int((self.prev_index_finger_tip_y - cur_index_finger_tip_y)*200)
-                        new_vol = max(0, min(100, cur_vol + vol_diff))
-                        self.sp_client.volume(new_vol)
-                        # print(f"DEBUG: New Volume: {new_vol}")
-                        self.prev_index_finger_tip_y = lm[8*3+1]
-                        self.prev_vol_datetime = datetime.now()
-                    else:
-                        self.prev_index_finger_tip_y = lm[8*3+1]
-                        self.prev_vol_datetime = datetime.now()
-                        # print(f"DEBUG: Setting volume reference point to {self.prev_index_finger_tip_y}")
-                else:
-                    print("No active playback device... start playing Spotify somewhere.")
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to set volume...")
-                print(e)
-
-            delay.reset_counter()
-            delay.set_in_action(True)
-
-        # E.g. 'skipback_2' or 'skipfwd_5'
-        elif pose[:9] == 'skipback_' or pose[:8] == 'skipfwd_':
-            n = int(pose[-1]) * (-1 if pose[:9] == 'skipback_' else 1)
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is not None:
-                    new_pos = max(playback['progress_ms']+int((3*n + 0.3)*1000), 0)
-                    self.sp_client.seek_track(new_pos)
-                    # print(f"DEBUG: Seek {(new_pos - playback['progress_ms'])/1000} seconds.")
-                else:
-                    print("No active playback device... start playing Spotify somewhere.")
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to skipback...")
-                print(e)
-
-            self.angle_now = None
-            delay.reset_counter()
-            delay.set_in_action(True)
-
-        elif pose == 'like':
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is not None and playback['is_playing']:
-                    track_id = playback['progress_ms']
-                    self.sp_client.current_user_saved_tracks_add(tracks=[track_id])
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to like a song...")
-                print(e)
-
-            delay.reset_counter(20)
-            delay.set_in_action(True)
-
-        elif pose == 'mark_pos':
-            try:
-                playback = self.sp_client.current_playback()
-                if playback is not None:  # and playback['is_playing']:
-                    cur_uri = playback['item']['uri']
-                    if self.marked_uri == 'empty' or self.marked_uri != cur_uri:
-                        self.marked_pos = playback['progress_ms']
-                        self.marked_uri = playback['item']['uri']
-                        print(f"DEBUG: Position {self.marked_pos} marked.")
-                    else:  # Delete old mark
-                        print(f"DEBUG: Position {self.marked_pos} deleted.")
-                        self.marked_pos = None
-                        self.marked_uri = 'empty'
-
-                else:
-                    print("No active playback device... start playing Spotify somewhere.")
-            except spotipy.exceptions.SpotifyException as e:
-                print("Tried to mark_pos...")
-                print(e)
-
-            delay.reset_counter(20)  # Ignore a few more frames than usual to avoid undoing
-            delay.set_in_action(True)
-
+        self.playback.start_polling()
+        self.devices.start_polling()
 
+    def stop(self):
+        self.volume.stop()
+        self.playback.stop()
+        self.devices.stop()
+        if self.owns_backend:
+            self.backend.close()
 
+    def command_registry(self):
+        """
+            The commands of the gestures, with the frames to ignore after each one so one gesture
+            does not fire twice
+        """
+        registry = CommandRegistry()
+        # A RateLimitedClient already retries the idempotent calls: the dispatcher retries only without one
+        retry = self.requests is None
+        registry.add('pause_or_play', lambda lm, value: self.pause_or_play(), cooldown=20)
+        registry.add('connect_cycle', lambda lm, value: self.connect_cycle(), cooldown=20)
+        registry.add('next_track', lambda lm, value: self.next_track(), cooldown=10)
+        registry.add('previous_track', lambda lm, value: self.previous_track(), cooldown=10)
+        registry.add('volume_slider', lambda lm, value: self.volume_slider(lm), coalesce='latest', idempotent=retry)
+        registry.add('like', lambda lm, value: self.like(), cooldown=20, idempotent=retry)
+        # Ignore a few more frames than usual to avoid undoing
+        registry.add('mark_pos', lambda lm, value: self.mark_pos(), cooldown=20)
+        # Dynamic gestures of the sequence model
+        registry.add('swipe_right', lambda lm, value: self.next_track(), cooldown=10)
+        registry.add('swipe_left', lambda lm, value: self.previous_track(), cooldown=10)
+        # skipback_N / skipfwd_N seek by 3*N + 0.3 seconds; runs of them become one net seek
+        registry.add_pattern(r'skip(back|fwd)_(\d)', lambda match: Command(
+            match.group(0), lambda lm, seconds: self.skip(seconds), coalesce='sum', idempotent=retry, key='skip',
+            value=(3*int(match.group(2)) + 0.3) * (-1 if match.group(1) == 'back' else 1)))
+        return registry
+
+    def next_track(self):
+        self.sp_client.next_track()
+        self.playback.invalidate()
+
+    def pause_or_play(self):
+        try:
+            playback = self.playback.current()
+            if playback is None or not playback['is_playing']:
+                self.sp_client.start_playback()
+                self.playback.update(is_playing=True)
+            else:
+                self.sp_client.pause_playback()
+                self.playback.update(is_playing=False)
+        except Exception as e:
+            # Only "no active device" is worth a transfer; rate limits and server errors are not
+            if http_status(e) != 404:
+                raise
+            devs = self.sp_client.devices()['devices']
+            if len(devs) > 0:
+                dev_id = devs[0]['id']
+                self.sp_client.transfer_playback(dev_id)
+                self.playback.invalidate()
+            else:
+                print("Tried to turn the volume up...")
+                print("Sorry, user needs to log into a device with Spotify!")
+
+    def connect_cycle(self):
+        """
+            Transfer playback to the device the DeviceRegistry predicted, with a single request
+            unless that device is gone.  The switch latency is timed as device_switch.
+        """
+        with METRICS.timer('device_switch'):
+            device = self.devices.next_device()
+            if device is not None:
+                try:
+                    self.sp_client.transfer_playback(device['id'])
+                except Exception as e:
+                    if http_status(e) != 404:
+                        raise
+                    # The cached device disappeared: cycle through a fresh list
+                    self.devices.refresh()
+                    device = self.devices.next_device()
+                    if device is not None:
+                        self.sp_client.transfer_playback(device['id'])
+        if device is None:
+            print("No other Spotify Connect device to switch to...")
+            return
+        self.devices.activate(device['id'])
+        device['is_active'] = True
+        self.playback.update(device=device)
+
+    def previous_track(self):
+        playback = self.playback.current()
+        if playback is not None:
+            cur_uri = playback['item']['uri']
+            cur_pos = playback['progress_ms']
+            # Check if we have a valid mark in this track to skip back to
+            if self.marked_pos is not None and self.marked_pos < cur_pos \
+                    and cur_uri == self.marked_uri:
+                self.sp_client.seek_track(self.marked_pos)
+                self.playback.update(progress_ms=self.marked_pos)
+            else:
+                if cur_pos < 6*1000:  # Go to previous track
+                    self.sp_client.previous_track(self.marked_pos)
+                    self.playback.invalidate()
+                else:  # Go back to beginning of track
+                    self.sp_client.seek_track(0)
+                    self.playback.update(progress_ms=0)
+
+    def volume_slider(self, lm):
+        """
+            Move the target volume with the index fingertip; the VolumeController sends it
+        """
+        self.volume.update(float(lm[INDEX_FINGER_TIP, 1]))
 
+    def skip(self, seconds):
+        """
+            Seek forward (or backward, if negative) by the given number of seconds
+        """
+        playback = self.playback.current()
+        if playback is not None:
+            new_pos = max(playback['progress_ms']+int(seconds*1000), 0)
+            self.sp_client.seek_track(new_pos)
+            self.playback.update(progress_ms=new_pos)
+            # print(f"DEBUG: Seek {(new_pos - playback['progress_ms'])/1000} seconds.")
+        else:
+            print("No active playback device... start playing Spotify somewhere.")
+
+    def like(self):
+        playback = self.playback.current()
+        if playback is not None and playback['is_playing']:
+            track_id = playback['item']['id']
+            self.sp_client.current_user_saved_tracks_add(tracks=[track_id])
+
+    def mark_pos(self):
+        playback = self.playback.current()
+        if playback is not None:  # and playback['is_playing']:
+            cur_uri = playback['item']['uri']
+            if self.marked_uri == 'empty' or self.marked_uri != cur_uri:
+                self.marked_pos = playback['progress_ms']
+                self.marked_uri = playback['item']['uri']
+                print(f"DEBUG: Position {self.marked_pos} marked.")
+            else:  # Delete old mark
+                print(f"DEBUG: Position {self.marked_pos} deleted.")
+                self.marked_pos = None
+                self.marked_uri = 'empty'
+
+        else:
+            print("No active playback device... start playing Spotify somewhere.")
@@ -1,21 +1,53 @@
+import os
+import sys
+import time
+import contextlib
+import numpy as np
 import pandas as pd
+from scipy.special import expit
 from sklearn.svm import SVC
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 from sklearn.metrics import accuracy_score
 from sklearn.model_selection import RandomizedSearchCV
+from sklearn.experimental import enable_halving_search_cv  # noqa: F401, enables HalvingRandomSearchCV
+from sklearn.model_selection import HalvingRandomSearchCV
 from sklearn.pipeline import Pipeline
 import pickle
 import argparse
 from hand_pose_transform import HandPoseTransform
+from compiled_classifier import CompiledClassifier
+from model_artifact import save_model
+from landmark_dataset import load_dataset, dataset_mtime
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
 
 parser = argparse.ArgumentParser(description="List Parameters.")
 parser.add_argument("-d", "--dataset_path", type=str, default='data/dataset_train.csv',
-                    help='Dataset filename path')
+                    help='Dataset filename path (CSV or .lmd LandmarkDataset)')
 parser.add_argument("-s", "--save_path", type=str, default='hands_pose_classifier.pkl',
                     help='Path to save trained SVC model')
 parser.add_argument("--test_size", type=float, default=0.2,
                     help='Float % Test Size')
+parser.add_argument("--n_jobs", type=int, default=-1,
+                    help='Parallel jobs of the hyperparameter search, -1 for all cores')
+parser.add_argument("--search", type=str, default='halving', choices=['halving', 'random'],
+                    help='Successive halving (HalvingRandomSearchCV) or RandomizedSearchCV')
+parser.add_argument("--n_iter", type=int, default=10,
+                    help='Parameter settings sampled by the random search')
+parser.add_argument("--cv", type=int, default=3,
+                    help='Folds of the hyperparameter search')
+parser.add_argument("--feature_cache", type=str, default=None,
+                    help='.npz file keeping the transformed features between runs')
+parser.add_argument("--warm_start", type=str, default=None,
+                    help='Existing model: reuse its parameters and support vectors, and only add new samples.  '
+                         'The decision function is trained on the support vectors and new samples, but the '
+                         'probabilities are calibrated on the whole dataset, on the decision values of the '
+                         'model itself instead of cross-validated ones, so they are somewhat more confident '
+                         'than after a full retraining')
 args = parser.parse_args()
 
 path_save_model = args.save_path
@@ -25,84 +57,238 @@ if not path_save_model.endswith('.pkl'):
 dataset_path = args.dataset_path
 test_size = args.test_size
 
-# Load Dataset
+phase_times = []
+
+
+@contextlib.contextmanager
+def timed(phase):
+    t0 = time.perf_counter()
+    yield
+    phase_times.append((phase, time.perf_counter() - t0))
+
+
+def peak_memory_mb():
+    """
+    Peak resident memory of this process in MB (the search workers share the features it holds)
+    """
+    if resource is None:
+        return None
+    scale = 1 / 2**20 if sys.platform == 'darwin' else 1 / 2**10  # ru_maxrss is in bytes on macOS, KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+
+
+def fit_sigmoid(dec, positive, max_iter=100, min_step=1e-10, sigma=1e-12, eps=1e-5):
+    """
+    Platt's sigmoid P(positive | dec) = 1 / (1 + exp(A * dec + B)) of the decision values dec,
+    fitted by Newton's method with backtracking as libsvm's sigmoid_train does.  Returns (A, B).
+    """
+    prior1 = np.count_nonzero(positive)
+    prior0 = len(positive) - prior1
+    t = np.where(positive, (prior1 + 1.) / (prior1 + 2.), 1. / (prior0 + 2.))
+
+    def objective(a, b):
+        f = dec * a + b
+        return np.sum(t * f + np.logaddexp(0., -f))
+
+    a, b = 0., np.log((prior0 + 1.) / (prior1 + 1.))
+    fval = objective(a, b)
+    for _ in range(max_iter):
+        p = expit(-(dec * a + b))
+        d2 = p * (1. - p)
+        h11, h22, h21 = sigma + np.dot(dec * dec, d2), sigma + d2.sum(), np.dot(dec, d2)
+        d1 = t - p
+        g1, g2 = np.dot(dec, d1), d1.sum()
+        if abs(g1) < eps and abs(g2) < eps:
+            break
+        det = h11 * h22 - h21 * h21
+        da, db = -(h22 * g1 - h21 * g2) / det, -(-h21 * g1 + h11 * g2) / det
+        gd = g1 * da + g2 * db
+        step = 1.
+        while step >= min_step:
+            new_fval = objective(a + step * da, b + step * db)
+            if new_fval < fval + 1e-4 * step * gd:
+                a, b, fval = a + step * da, b + step * db, new_fval
+                break
+            step /= 2.
+        if step < min_step:
+            break
+    return a, b
+
+
+def calibrate(svc, X, Y):
+    """
+    Refit the pairwise Platt sigmoids of a fitted SVC on the samples X of labels Y, so its
+    predict_proba is calibrated on them rather than on the samples it was fitted on
+    """
+    # One decision value per pair of classes, in the order of libsvm's sigmoids
+    shape = svc.decision_function_shape
+    dec = svc.set_params(decision_function_shape='ovo').decision_function(X)
+    svc.set_params(decision_function_shape=shape)
+    prob_a, prob_b = [], []
+    p = 0
+    for i, cls_i in enumerate(svc.classes_):
+        for cls_j in svc.classes_[i + 1:]:
+            pair = (Y == cls_i) | (Y == cls_j)
+            a, b = fit_sigmoid(dec[pair, p], Y[pair] == cls_i)
+            prob_a.append(a)
+            prob_b.append(b)
+            p += 1
+    # Attribute names changed across sklearn versions, as in CompiledClassifier.from_sklearn
+    state = vars(svc)
+    state['_probA' if '_probA' in state else 'probA_'] = np.array(prob_a)
+    state['_probB' if '_probB' in state else 'probB_'] = np.array(prob_b)
+    svc.probability = True
+    return svc
+
+
+# Load Dataset (CSV, or a LandmarkDataset directory memory-mapped without parsing)
 print(f'Loading {dataset_path} dataset...')
-df = pd.read_csv(dataset_path)
-print(f'Dataset with shape={df.shape} Loaded', end='\n\n')
+with timed('load'):
+    X_landmarks, Y, _ = load_dataset(dataset_path)
+print(f'Dataset with shape={X_landmarks.shape} Loaded', end='\n\n')
 
 # Dataset Info
 print('Qty of tuples per class')
-len_per_class = df.groupby('class').count()['WRIST_x']
+len_per_class = pd.Series(Y).value_counts().sort_index()
 print([(key, len_per_class[key]) for key in len_per_class.keys()], end='\n\n')
 
-# train test split
-Y = df['class'].values
-xcols = list(df.columns)
-xcols.remove('hand')
-xcols.remove('class')
-X = df[xcols].values
-X_train, X_test, Y_train, Y_test = train_test_split(
-    X, Y, test_size=test_size, random_state=42, stratify=Y)
-print(f'Train Size {len(X_train)}')
-print(f'Test Size {len(X_test)}')
-
-# Train SVC inside of a Pipeline
-scale_hands = True
-if scale_hands:
-    svc_model = Pipeline([
-        ('scaler', HandPoseTransform()),
-        ('svc', SVC(C=1, kernel='linear', random_state=42))
-    ])
+# HandPoseTransform works row by row and learns nothing, so the features are transformed
+# once here instead of in every fold, and the search runs on a plain SVC
+with timed('features'):
+    cache_key = np.array(dataset_mtime(dataset_path) + (len(Y),))
+    cached = None
+    if args.feature_cache and os.path.exists(args.feature_cache):
+        cached = np.load(args.feature_cache)
+        if not np.array_equal(cached['key'], cache_key):
+            cached = None
+    if cached is not None:
+        X = cached['X']
+        print(f'Features loaded from {args.feature_cache}')
+    else:
+        X = HandPoseTransform().transform(np.ascontiguousarray(X_landmarks, dtype=np.float64))
+        if args.feature_cache:
+            np.savez(args.feature_cache, X=X, key=cache_key)
+            print(f'Features cached in {args.feature_cache}')
+del X_landmarks
+
+if args.warm_start:
+    # libsvm cannot resume training, but the old solution only depends on its support
+    # vectors: train on them plus the samples appended since, with the same parameters
+    print(f'Warm start from {args.warm_start}...')
+    old_model = pickle.load(open(args.warm_start, 'rb'))
+    old_svc = old_model.steps[-1][1] if hasattr(old_model, 'steps') else old_model
+    best_parameters_svc = {key: getattr(old_svc, key) for key in ('C', 'kernel', 'gamma', 'degree', 'coef0')}
+    n_seen = getattr(old_model, 'n_samples_seen_', None)
+    if n_seen is None or n_seen > len(X):
+        print('The model does not record the samples it was trained on, retraining on the whole dataset')
+        X_fit, Y_fit = X, Y
+    else:
+        Y_old = np.repeat(old_svc.classes_, old_svc.n_support_)
+        X_fit = np.vstack([old_svc.support_vectors_, X[n_seen:]])
+        Y_fit = np.concatenate([Y_old, Y[n_seen:]])
+        print(f'{len(Y_old)} support vectors + {len(X) - n_seen} new samples')
+    print(best_parameters_svc, end='\n\n')
 else:
+    # train test split
+    X_train, X_test, Y_train, Y_test = train_test_split(
+        X, Y, test_size=test_size, random_state=42, stratify=Y)
+    print(f'Train Size {len(X_train)}')
+    print(f'Test Size {len(X_test)}')
+
+    # Train SVC on the transformed features
     svc_model = SVC(C=1, kernel='linear', random_state=42)
 
-print(f'Training SVC with {len(X_train)} tuples...')
-svc_model.fit(X_train, Y_train)
-print('Train Completed', end='\n\n')
-
-# Test SVC
-print(f'Testing SVC with {len(X_test)} tuples...', end='\n\n')
-predict_svc_model = svc_model.predict(X_test)
-print(classification_report(Y_test, predict_svc_model), end='\n\n')
-print(accuracy_score(Y_test, predict_svc_model), end='\n\n')
-
-# Grid Search SVC - Train/Validation
-print('Grid Search Training Starting...')
-# svc_model = SVC(random_state=42)
-grid_svc = {'C': [0.1, 1, 10, 100],
-            'gamma': [1, 0.1, 0.01, 0.001],
-            'kernel': ['linear', 'rbf', 'poly', 'sigmoid']}
-if scale_hands:  # For a Pipeline with multiple steps, we need to specify where param belongs
-    for key in grid_svc.keys():
-        grid_svc['svc__' + key] = grid_svc.pop(key)
-
-svc_model_optimized = RandomizedSearchCV(estimator=svc_model, param_distributions=grid_svc,
-                                         n_iter=10, cv=3, random_state=42)
-svc_model_optimized.fit(X_train, Y_train)
-print('Grid Search Training Completed', end='\n\n')
-
-# Grid Search SVC - Test
-print('Grid Search Test Starting...')
-predict_optimized_svc_model = svc_model_optimized.predict(X_test)
-print(classification_report(Y_test, predict_optimized_svc_model), end='\n\n')
-print(accuracy_score(Y_test, predict_optimized_svc_model), end='\n\n')
-
-# Get Best Parameters
-best_parameters_svc = svc_model_optimized.best_params_
-del svc_model_optimized, predict_optimized_svc_model
-print('Best Parameters:')
-print(best_parameters_svc, end='\n\n')
+    print(f'Training SVC with {len(X_train)} tuples...')
+    with timed('baseline fit'):
+        svc_model.fit(X_train, Y_train)
+    print('Train Completed', end='\n\n')
+
+    # Test SVC
+    print(f'Testing SVC with {len(X_test)} tuples...', end='\n\n')
+    predict_svc_model = svc_model.predict(X_test)
+    print(classification_report(Y_test, predict_svc_model), end='\n\n')
+    print(accuracy_score(Y_test, predict_svc_model), end='\n\n')
+
+    # Grid Search SVC - Train/Validation
+    print(f'{"Successive Halving" if args.search == "halving" else "Grid"} Search Training Starting...')
+    grid_svc = {'C': [0.1, 1, 10, 100],
+                'gamma': [1, 0.1, 0.01, 0.001],
+                'kernel': ['linear', 'rbf', 'poly', 'sigmoid']}
+
+    with timed('search'):
+        if args.search == 'halving':
+            # Every candidate starts on a few samples, only the best third gets 3x more each round
+            svc_model_optimized = HalvingRandomSearchCV(estimator=svc_model, param_distributions=grid_svc,
+                                                        factor=3, cv=args.cv, random_state=42, n_jobs=args.n_jobs)
+        else:
+            svc_model_optimized = RandomizedSearchCV(estimator=svc_model, param_distributions=grid_svc,
+                                                     n_iter=args.n_iter, cv=args.cv, random_state=42,
+                                                     n_jobs=args.n_jobs)
+        svc_model_optimized.fit(X_train, Y_train)
+    n_candidates = len(svc_model_optimized.cv_results_['params'])
+    print(f'Grid Search Training Completed ({n_candidates} fits of {args.cv} folds)', end='\n\n')
+
+    # Grid Search SVC - Test
+    print('Grid Search Test Starting...')
+    predict_optimized_svc_model = svc_model_optimized.predict(X_test)
+    print(classification_report(Y_test, predict_optimized_svc_model), end='\n\n')
+    print(accuracy_score(Y_test, predict_optimized_svc_model), end='\n\n')
+
+    # Get Best Parameters
+    best_parameters_svc = svc_model_optimized.best_params_
+    del svc_model_optimized, predict_optimized_svc_model
+    print('Best Parameters:')
+    print(best_parameters_svc, end='\n\n')
+    X_fit, Y_fit = X, Y
 
 # Generate SVC Model - Best Parameters founded in Grid Search
 print('Training Final SVC Model with Best Parameters')
 
 # Add in that we want to predict probability instead of class (for multi-class estimates)
-best_parameters_svc['svc__probability' if scale_hands else 'probability'] = True
-svc_model.set_params(**best_parameters_svc)
-svc_model.fit(X, Y)
+# A warm start calibrates the probabilities on the whole dataset instead: libsvm would calibrate
+# them on the support vectors, the samples closest to the boundaries, and underestimate them
+final_svc = SVC(random_state=42, probability=not args.warm_start, **best_parameters_svc)
+with timed('final fit'):
+    final_svc.fit(X_fit, Y_fit)
+if args.warm_start:
+    with timed('calibration'):
+        calibrate(final_svc, X, Y)
+# The transform has nothing to fit, so the Pipeline is assembled from the fitted SVC
+svc_model = Pipeline([
+    ('scaler', HandPoseTransform()),
+    ('svc', final_svc)
+])
+svc_model.n_samples_seen_ = len(X)  # Rows of the dataset already learned, for --warm_start
 print('Final training completed successfully', end='\n\n')
+if args.warm_start:
+    # Both models on the whole dataset, the samples of the final fit included: a check of the
+    # calibration, not a measure of generalization
+    print('On the whole dataset (training samples included):')
+    for name, model in [('previous model', old_svc), ('warm-started model', final_svc)]:
+        proba = model.predict_proba(X)
+        # Classes added since the previous model have a probability of 0 in it
+        idx = np.minimum(np.searchsorted(model.classes_, Y), len(model.classes_) - 1)
+        true_proba = np.where(model.classes_[idx] == Y, proba[np.arange(len(Y)), idx], 0.)
+        print(f'{name:>19}: accuracy {accuracy_score(Y, model.classes_[proba.argmax(1)]):.4f}, '
+              f'mean probability of the true class {true_proba.mean():.3f}, '
+              f'{np.mean(proba.max(1) >= 0.9):.1%} of the samples at 0.9 or more')
+    print()
 
 # Saving SVC Best Model
 print('Saving Final SVC Model...')
 pickle.dump(svc_model, open(path_save_model, "wb"))
 print(f'Model Saved in {path_save_model}', end='\n\n')
+
+# Saving the NumPy-only model artifact used for inference
+path_save_compiled = path_save_model.replace('.pkl', '.npz')
+save_model(path_save_compiled, CompiledClassifier.from_sklearn(svc_model), source=os.path.basename(path_save_model))
+print(f'Model artifact Saved in {path_save_compiled}', end='\n\n')
+
+# Training Report
+print('Training time:')
+for phase, seconds in phase_times:
+    print(f'{phase:>13}: {seconds:8.2f} s')
+print(f'{"total":>13}: {sum(seconds for _, seconds in phase_times):8.2f} s')
+peak = peak_memory_mb()
+if peak is not None:
+    print(f'Peak memory: {peak:.0f} MB')
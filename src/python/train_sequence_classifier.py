@@ -0,0 +1,131 @@
+import csv
+import time
+import argparse
+import numpy as np
+from sklearn.linear_model import LogisticRegression
+from sklearn.preprocessing import StandardScaler
+from sklearn.pipeline import Pipeline
+from sklearn.model_selection import train_test_split
+from sklearn.metrics import classification_report, accuracy_score
+
+from replay import read_recording, synthetic_recording
+from sequence_classifier import SequenceClassifier, window_features
+from model_artifact import save_model
+from utils import extract_landmarks, N_LANDMARKS
+
+parser = argparse.ArgumentParser(description="Train a gesture classifier over short windows of landmark frames.")
+parser.add_argument("--recordings", type=str, nargs='+', default=None,
+                    help='Landmark recordings (gesture_controller.py --record_landmarks) to train on')
+parser.add_argument("--labels", type=str, nargs='+', default=None,
+                    help='One CSV per recording with the class,start,end frames of every gesture')
+parser.add_argument("-d", "--dataset_path", type=str, default='data/spotify_control_training_data.csv',
+                    help='Pose dataset used to build synthetic recordings when none are given')
+parser.add_argument("--gestures", type=int, default=400,
+                    help='Gestures of the synthetic training recording')
+parser.add_argument("--swipes", type=float, default=.25,
+                    help='Fraction of swipes among the synthetic gestures')
+parser.add_argument("--transitions", type=float, default=.5,
+                    help='Fraction of synthetic gaps where the hand morphs into the next gesture')
+parser.add_argument("--seed", type=int, default=0,
+                    help='Random seed of the synthetic recordings')
+parser.add_argument("--window", type=int, default=8,
+                    help='Frames per window')
+parser.add_argument("--label_frames", type=int, default=None,
+                    help='Frames of a gesture a window must hold to be labeled with it (default: window/2)')
+parser.add_argument("--C", type=float, default=1.,
+                    help='Inverse regularization strength of the logistic regression')
+parser.add_argument("-s", "--save_path", type=str, default='models/spotify_gesture_sequence_model.npz',
+                    help='Path to save the NumPy-only sequence model')
+args = parser.parse_args()
+
+label_frames = args.label_frames or args.window // 2
+
+
+def read_labels(path):
+    with open(path, newline='') as f:
+        return [(row['class'], int(row['start']), int(row['end'])) for row in csv.DictReader(f)]
+
+
+def recording_windows(frames, gestures):
+    """
+    Every window of consecutive frames of each hand, labeled with the gesture it ends in when
+    it holds at least label_frames frames of it, else 'Unknown'
+    """
+
+    label_of = {}
+    for cls, start, end in gestures:
+        for index in range(start, end + 1):
+            label_of[index] = (cls, start)
+
+    windows, labels = [], []
+    tracks = {}  # (stream, hand) -> consecutive (frame index, landmarks)
+    for frame in frames:
+        seen = set()
+        for stream, results in enumerate(frame.results):
+            if not results.multi_hand_landmarks:
+                continue
+            for hand_landmarks, handedness in zip(results.multi_hand_landmarks, results.multi_handedness):
+                key = (stream, handedness.classification[0].label)
+                seen.add(key)
+                track = tracks.setdefault(key, [])
+                track.append(extract_landmarks(hand_landmarks))
+                del track[:-args.window]
+                if len(track) < args.window:
+                    continue
+                cls, start = label_of.get(frame.index, ('Unknown', frame.index))
+                windows.append(np.stack(track))
+                labels.append(cls if frame.index - start + 1 >= label_frames else 'Unknown')
+        for key in list(tracks):
+            if key not in seen:
+                del tracks[key]
+    return np.array(windows).reshape(-1, args.window, N_LANDMARKS, 3), np.array(labels)
+
+
+# Load recordings
+t0 = time.perf_counter()
+if args.recordings:
+    if not args.labels or len(args.labels) != len(args.recordings):
+        raise SystemExit('Give one --labels file per recording')
+    sets = [recording_windows(read_recording(recording), read_labels(labels))
+            for recording, labels in zip(args.recordings, args.labels)]
+    if len(sets) > 1:  # hold out the last recording
+        X_train = np.concatenate([X for X, _ in sets[:-1]])
+        Y_train = np.concatenate([Y for _, Y in sets[:-1]])
+        X_test, Y_test = sets[-1]
+    else:
+        X_train, X_test, Y_train, Y_test = train_test_split(*sets[0], test_size=0.2, random_state=42,
+                                                            stratify=sets[0][1])
+else:
+    print(f'Building synthetic recordings from {args.dataset_path}...')
+    X_train, Y_train = recording_windows(*synthetic_recording(
+        args.dataset_path, n_gestures=args.gestures, seed=args.seed,
+        swipe_fraction=args.swipes, transition_fraction=args.transitions))
+    X_test, Y_test = recording_windows(*synthetic_recording(
+        args.dataset_path, n_gestures=args.gestures // 4, seed=args.seed + 1,
+        swipe_fraction=args.swipes, transition_fraction=args.transitions))
+print(f'{len(X_train)} training and {len(X_test)} test windows of {args.window} frames '
+      f'({time.perf_counter() - t0:.1f} s)')
+classes, counts = np.unique(Y_train, return_counts=True)
+print([(cls, n) for cls, n in zip(classes, counts)], end='\n\n')
+
+# Train
+print('Training the window classifier...')
+t0 = time.perf_counter()
+model = Pipeline([
+    ('scaler', StandardScaler()),
+    ('logistic', LogisticRegression(C=args.C, max_iter=2000))
+])
+model.fit(window_features(X_train), Y_train)
+print(f'Train Completed in {time.perf_counter() - t0:.1f} s', end='\n\n')
+
+# Test the exported model, as it runs in the gesture controller
+sequence_model = SequenceClassifier.from_sklearn(model, args.window)
+max_diff = np.abs(sequence_model.predict_proba(X_test) - model.predict_proba(window_features(X_test))).max()
+print(f'Exported model max abs probability diff {max_diff:.2e}')
+predicted = sequence_model.predict(X_test)
+print(classification_report(Y_test, predicted, zero_division=0), end='\n\n')
+print(accuracy_score(Y_test, predicted), end='\n\n')
+
+print('Saving the sequence model...')
+save_model(args.save_path, sequence_model)
+print(f'Model Saved in {args.save_path}')
@@ -1,5 +1,54 @@
+import hashlib
 import numpy as np
 
+# MediaPipe hand landmarks, in the order of mp.solutions.hands.HandLandmark and of the
+# (21, 3) arrays filled by extract_landmarks
+LANDMARK_NAMES = [
+    'WRIST',
+    'THUMB_CMC', 'THUMB_MCP', 'THUMB_IP', 'THUMB_TIP',
+    'INDEX_FINGER_MCP', 'INDEX_FINGER_PIP', 'INDEX_FINGER_DIP', 'INDEX_FINGER_TIP',
+    'MIDDLE_FINGER_MCP', 'MIDDLE_FINGER_PIP', 'MIDDLE_FINGER_DIP', 'MIDDLE_FINGER_TIP',
+    'RING_FINGER_MCP', 'RING_FINGER_PIP', 'RING_FINGER_DIP', 'RING_FINGER_TIP',
+    'PINKY_MCP', 'PINKY_PIP', 'PINKY_DIP', 'PINKY_TIP',
+]
+N_LANDMARKS = len(LANDMARK_NAMES)
+WRIST = 0
+THUMB_CMC = 1
+THUMB_TIP = 4
+INDEX_FINGER_TIP = 8
+FINGER_TIPS = [4, 8, 12, 16, 20]
+
+# Column names of the training data, e.g. 'WRIST_x'
+LANDMARK_COLUMNS = [f'{name}_{axis}' for name in LANDMARK_NAMES for axis in 'xyz']
+
+
+def landmark_schema(names=LANDMARK_NAMES):
+    """
+    Short hash of the classifier input layout: x, y, z of each landmark in this order.  Model
+    artifacts record the schema they were trained on, HandDetect the one MediaPipe produces.
+    """
+
+    columns = ','.join(f'{name}_{axis}' for name in names for axis in 'xyz')
+    return hashlib.sha256(columns.encode()).hexdigest()[:16]
+
+
+def extract_landmarks(hand_landmarks, out=None):
+    """
+    Copy the x, y, z of the 21 MediaPipe landmarks of one hand into a (21, 3) float32
+    array.  Pass a preallocated array (or a row of a (n_hands, 21, 3) batch buffer) as
+    out to avoid allocating one per frame.  Flatten with out.reshape(-1) for the
+    classifier, which keeps the [x0, y0, z0, x1, ...] column order.
+    """
+
+    if out is None:
+        out = np.empty((N_LANDMARKS, 3), dtype=np.float32)
+    for i, landmark in enumerate(hand_landmarks.landmark):
+        row = out[i]
+        row[0] = landmark.x
+        row[1] = landmark.y
+        row[2] = landmark.z
+    return out
+
 
 def _get_angle(a, b, c):
     """
@@ -20,9 +69,9 @@ def get_points_to_zoom(lm):
     Get index_finger_tip, thumb_tip and thumb_cmc coordinates
     """
 
-    index_finger_tip = np.array([lm[24], lm[25]])
-    thumb_tip = np.array([lm[12], lm[13]])
-    thumb_cmc = np.array([lm[3], lm[4]])
+    index_finger_tip = lm[INDEX_FINGER_TIP, :2]
+    thumb_tip = lm[THUMB_TIP, :2]
+    thumb_cmc = lm[THUMB_CMC, :2]
 
     return index_finger_tip, thumb_tip, thumb_cmc
 
@@ -32,8 +81,7 @@ def get_average_points(lm):
     Get average x and y cordinates of tips points
     """
 
-    x_average = (lm[12] + lm[24] + lm[36] + lm[48] + lm[60]) / 5
-    y_average = (lm[13] + lm[25] + lm[37] + lm[49] + lm[61]) / 5
+    x_average, y_average = lm[FINGER_TIPS, :2].mean(axis=0)
 
     return x_average, y_average
 
@@ -45,3 +93,35 @@ def get_angle(hand_landmarks):
 
     index_cd, thumb_cd, thumb_cmc_cd = get_points_to_zoom(hand_landmarks)
     return _get_angle(index_cd, thumb_cmc_cd, thumb_cd)
+
+
+def shift_and_scale(X, out=None):
+    """
+    Shift every row of landmarks so the wrist is the origin and scale it so the
+    farthest landmark is at distance 1.  Rows are transformed at once on an
+    (N, landmarks, 3) view of X.  The result is written to out if given (pass X
+    itself to transform in place), otherwise to a new array.
+    """
+
+    X = np.asarray(X)
+    if not np.issubdtype(X.dtype, np.floating):
+        X = X.astype(np.float64)
+    if out is None:
+        out = np.empty(X.shape, dtype=X.dtype)
+    elif out.shape != X.shape or not out.flags.c_contiguous:
+        raise ValueError('out must be a C-contiguous array with the same shape as X')
+
+    points = X.reshape(len(X), -1, 3)
+    points_out = out.reshape(points.shape)
+
+    # Subtract off wrist position
+    # z origin is already anchored to the wrist, so no need to shift
+    origin = np.zeros((len(X), 1, 3), dtype=X.dtype)
+    origin[:, :, :2] = points[:, :1, :2]
+    np.subtract(points, origin, out=points_out)
+
+    # Scale so that the max extension of any hand landmark from the wrist is 1.
+    norm = np.sqrt(np.einsum('nlk,nlk->nl', points_out, points_out).max(axis=1))
+    np.divide(points_out, norm[:, None, None], out=points_out)
+
+    return out
@@ -0,0 +1,157 @@
+import math
+import threading
+import time
+
+
+class OneEuroFilter:
+    """
+    One Euro Filter Class.
+
+    Low-pass filter whose cutoff frequency rises with the speed of the signal (Casiez et al.,
+    CHI 2012): a resting fingertip is smoothed heavily, so landmark jitter does not move the
+    volume, while a fast sweep is followed with little lag.
+
+    Keyword Arguments:
+        min_cutoff {float, optional}: cutoff frequency at rest, in Hz.
+                (Default: {1.})
+        beta {float, optional}: cutoff increase per unit of speed (units per second).
+                (Default: {10.})
+        d_cutoff {float, optional}: cutoff frequency of the speed estimate, in Hz.
+                (Default: {1.})
+    """
+
+    def __init__(self, min_cutoff=1., beta=10., d_cutoff=1.):
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+        self.reset()
+
+    def reset(self):
+        self.x = None
+        self.dx = 0.
+        self.t = None
+
+    @staticmethod
+    def alpha(cutoff, dt):
+        tau = 1. / (2 * math.pi * cutoff)
+        return 1. / (1. + tau / dt)
+
+    def __call__(self, x, t):
+        if self.t is None:
+            self.x, self.dx, self.t = x, 0., t
+            return x
+        dt = max(t - self.t, 1e-6)
+        self.t = t
+        self.dx += self.alpha(self.d_cutoff, dt) * ((x - self.x) / dt - self.dx)
+        cutoff = self.min_cutoff + self.beta * abs(self.dx)
+        self.x += self.alpha(cutoff, dt) * (x - self.x)
+        return self.x
+
+
+class VolumeController:
+    """
+    Volume Controller Class.
+
+    Continuous volume control from the height of the index fingertip.  The fingertip goes
+    through a OneEuroFilter and sets a target volume kept locally: at the start of a gesture
+    the fingertip position stands for the current volume, and moving up by 1/gain of the frame
+    height adds one percent (changes under a percent are ignored).  A background thread sends
+    the target at most max_rate times per second, and only when it changed, so a sweep costs
+    a handful of volume() calls whatever the frame rate.
+
+    Arguments:
+        sp_client {PlaybackBackend}: client to send volume() with
+        playback {PlaybackState}: cache the current volume is read from, and updated
+    Keyword Arguments:
+        gain {float, optional}: volume percents per unit of fingertip height.
+                (Default: {200.})
+        max_rate {float, optional}: volume() calls per second at most.
+                (Default: {3.})
+        timeout {float, optional}: seconds without updates after which the next one starts a
+                new gesture.
+                (Default: {2.5})
+        min_cutoff, beta: OneEuroFilter settings.
+    """
+
+    def __init__(self, sp_client, playback, gain=200., max_rate=3., timeout=2.5, min_cutoff=1., beta=10.):
+        self.sp_client = sp_client
+        self.playback = playback
+        self.gain = gain
+        self.interval = 1. / max_rate
+        self.timeout = timeout
+        self.filter = OneEuroFilter(min_cutoff=min_cutoff, beta=beta)
+        self.reference = None  # (filtered fingertip height, volume) the target is measured from
+        self.last_update = None
+        self.target = None
+        self.sent = None
+        self.sends = 0
+        self.cond = threading.Condition()
+        self.running = True
+        self.stop_event = threading.Event()
+        self.flusher = threading.Thread(target=self._run, name='volume_flush', daemon=True)
+        self.flusher.start()
+
+    def update(self, y, t=None):
+        """
+        New fingertip height (0 at the top of the frame, 1 at the bottom).  Returns the target
+        volume, or None when there is no active device.
+        """
+
+        t = time.monotonic() if t is None else t
+        if self.last_update is None or t - self.last_update > self.timeout:
+            # A new gesture: the fingertip is where the current volume is
+            playback = self.playback.current()
+            if playback is None or playback.get('device') is None:
+                print("No active playback device... start playing Spotify somewhere.")
+                return None
+            self.filter.reset()
+            self.reference = (self.filter(y, t), playback['device']['volume_percent'])
+            self.last_update = t
+            with self.cond:
+                self.target = self.sent = self.reference[1]
+            return self.target
+
+        self.last_update = t
+        y_filtered = self.filter(y, t)
+        y0, volume0 = self.reference
+        volume = volume0 + (y0 - y_filtered) * self.gain
+        if not 0 <= volume <= 100:
+            # Past either end, the volume follows the hand back as soon as it turns around
+            volume = max(0, min(100, volume))
+            self.reference = (y_filtered, volume)
+        with self.cond:
+            # A full percent of movement is needed: rounding alone would flicker between two
+            # values while the hand rests near their midpoint
+            if abs(volume - self.target) >= 1 or volume in (0, 100):
+                self.target = int(round(volume))
+                self.cond.notify()
+            return self.target
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: not self.running or self.target != self.sent)
+                if self.target == self.sent:
+                    return
+                target = self.target
+            try:
+                self.sp_client.volume(target)
+                self.playback.update(volume_percent=target)
+                self.sends += 1
+            except Exception as e:
+                print("Tried to change the volume...")
+                print(e)
+            with self.cond:
+                self.sent = target
+            self.stop_event.wait(self.interval)
+
+    def stop(self, timeout=1.):
+        """
+        Send the pending target, if any, and stop the flusher
+        """
+
+        with self.cond:
+            self.running = False
+            self.cond.notify()
+        self.stop_event.set()
+        self.flusher.join(timeout)
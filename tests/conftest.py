@@ -0,0 +1,9 @@
+import os
+import sys
+
+# The modules of src/python import each other as top-level modules, as when running its scripts
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'src', 'python'))
+
+DATASET_PATH = os.path.join(ROOT, 'data', 'spotify_control_training_data.csv')
+MODEL_PATH = os.path.join(ROOT, 'models', 'spotify_gesture_cmd_model.pkl')
@@ -0,0 +1,55 @@
+import pickle
+
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+pytest.importorskip('pandas')
+
+from conftest import DATASET_PATH, MODEL_PATH
+from compiled_classifier import CompiledClassifier
+from landmark_dataset import load_dataset
+from model_artifact import save_model, load_classifier
+
+TOLERANCE = 1e-9
+
+
+@pytest.fixture(scope='module')
+def landmarks():
+    return np.asarray(load_dataset(DATASET_PATH)[0], dtype=np.float64)
+
+
+@pytest.fixture(scope='module')
+def sklearn_model():
+    with open(MODEL_PATH, 'rb') as f:
+        return pickle.load(f)
+
+
+@pytest.fixture(scope='module')
+def expected(sklearn_model, landmarks):
+    try:
+        return sklearn_model.predict_proba(landmarks)
+    except AttributeError as e:
+        # The pickle is of the scikit-learn of requirements.txt; later versions renamed SVC attributes
+        pytest.skip(f'{MODEL_PATH} cannot predict with this scikit-learn version: {e}')
+
+
+def test_from_sklearn(sklearn_model, landmarks, expected):
+    compiled = CompiledClassifier.from_sklearn(sklearn_model)
+    assert list(compiled.classes_) == list(sklearn_model.classes_)
+    np.testing.assert_allclose(compiled.predict_proba(landmarks), expected, rtol=0, atol=TOLERANCE)
+
+
+def test_artifact(sklearn_model, landmarks, expected, tmp_path):
+    path = str(tmp_path / 'model.npz')
+    save_model(path, CompiledClassifier.from_sklearn(sklearn_model))
+    artifact = load_classifier(path)
+    assert isinstance(artifact, CompiledClassifier)
+    np.testing.assert_allclose(artifact.predict_proba(landmarks), expected, rtol=0, atol=TOLERANCE)
+
+
+def test_single_row_matches_batch(sklearn_model, landmarks):
+    compiled = CompiledClassifier.from_sklearn(sklearn_model)
+    batch = compiled.predict_proba(landmarks)
+    single = np.vstack([compiled.predict_proba(landmarks[i:i + 1]) for i in range(len(landmarks))])
+    np.testing.assert_allclose(single, batch, rtol=0, atol=TOLERANCE)
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+pytest.importorskip('sklearn')
+pytest.importorskip('pandas')
+
+from conftest import DATASET_PATH
+from hand_pose_transform import HandPoseTransform
+from landmark_dataset import load_dataset
+
+
+def reference_transform(X):
+    """
+    The original row-by-row transform
+    """
+    X_ = X.copy()
+
+    def _shift_and_scale(row):
+        row[0::3] = row[0::3] - row[0]
+        row[1::3] = row[1::3] - row[1]
+        norm = np.max(
+            np.sqrt(np.square(row[0::3]) + np.square(row[1::3]) + np.square(row[2::3]))
+        )
+        row = row / norm
+        return row
+
+    return np.apply_along_axis(_shift_and_scale, 1, X_)
+
+
+@pytest.fixture(scope='module')
+def landmarks():
+    return np.asarray(load_dataset(DATASET_PATH)[0], dtype=np.float64)
+
+
+def test_new_array(landmarks):
+    X = landmarks.copy()
+    result = HandPoseTransform().transform(X)
+    np.testing.assert_allclose(result, reference_transform(landmarks), rtol=1e-12, atol=1e-12)
+    np.testing.assert_array_equal(X, landmarks)
+
+
+def test_out(landmarks):
+    out = np.empty(landmarks.shape)
+    result = HandPoseTransform().transform(landmarks, out=out)
+    assert result is out
+    np.testing.assert_allclose(out, reference_transform(landmarks), rtol=1e-12, atol=1e-12)
+
+
+def test_in_place(landmarks):
+    X = np.ascontiguousarray(landmarks.copy())
+    HandPoseTransform().transform(X, out=X)
+    np.testing.assert_allclose(X, reference_transform(landmarks), rtol=1e-12, atol=1e-12)
+
+
+def test_single_row(landmarks):
+    np.testing.assert_allclose(HandPoseTransform().transform(landmarks[:1]), reference_transform(landmarks[:1]),
+                               rtol=1e-12, atol=1e-12)